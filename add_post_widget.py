@@ -3,25 +3,26 @@
 # ============================================================================
 
 
-import uuid
-import cv2
-import numpy as np
 import threading
 from pathlib import Path
 from PyQt5.QtWidgets import (
-    QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout,
-    QFileDialog, QMessageBox, QTextEdit
+    QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout,
+    QFileDialog, QMessageBox, QTextEdit, QComboBox
 )
 from PyQt5.QtCore import QTimer
-from config import KNOWN_DIR, MAX_IMAGES, SIMILARITY_THRESHOLD
-from utils import load_posts, save_posts, cosine_similarity
-from face_model import images_to_embedding_list, get_face_app
+from config import MAX_IMAGES, SEX_VALUES, AGE_BANDS
+from utils import load_posts
+from face_model import inference_ready
+from phash_index import file_phash, describe_duplicates
+from post_metadata import clean_metadata
+import post_store
 
 class AddPostWidget(QWidget):
     def __init__(self, on_post_added, chroma_manager=None):
         super().__init__()
         self.on_post_added = on_post_added
         self.chroma_manager = chroma_manager
+        self.index_error = None  # set by the main window if the index failed to open
         self.chosen_paths = []
 
         self.setWindowTitle("Add Post")
@@ -34,6 +35,24 @@ class AddPostWidget(QWidget):
         self.id_input.setPlaceholderText("Enter unique integer ID")
         self.id_input.setStyleSheet("background-color: #242526; border: 1px solid #4E4F50; padding: 3px; color: white;")
 
+        input_style = "background-color: #242526; border: 1px solid #4E4F50; padding: 3px; color: white;"
+        self.date_input = QLineEdit()
+        self.date_input.setPlaceholderText("Date reported (YYYY-MM-DD)")
+        self.date_input.setStyleSheet(input_style)
+        self.region_input = QLineEdit()
+        self.region_input.setPlaceholderText("Region")
+        self.region_input.setStyleSheet(input_style)
+        self.sex_input = QComboBox()
+        self.sex_input.addItems(["Sex", *SEX_VALUES])
+        self.age_input = QComboBox()
+        self.age_input.addItems(["Age band", *AGE_BANDS])
+
+        details_layout = QHBoxLayout()
+        details_layout.addWidget(self.date_input)
+        details_layout.addWidget(self.region_input)
+        details_layout.addWidget(self.sex_input)
+        details_layout.addWidget(self.age_input)
+
         self.select_btn = QPushButton("Select images (1-5)")
         self.select_btn.setStyleSheet("background-color: #365899; color: white; font-weight: bold;")
         self.select_btn.clicked.connect(self.select_images)
@@ -50,6 +69,7 @@ class AddPostWidget(QWidget):
         layout = QVBoxLayout()
         layout.addWidget(self.id_label)
         layout.addWidget(self.id_input)
+        layout.addLayout(details_layout)
         layout.addWidget(self.select_btn)
         layout.addWidget(self.images_preview)
         layout.addWidget(self.add_btn)
@@ -65,12 +85,24 @@ class AddPostWidget(QWidget):
             files = files[:MAX_IMAGES]
 
         self.chosen_paths = files
-        self.images_preview.setPlainText("\n".join(files))
+        lines = []
+        for f in files:
+            note = describe_duplicates(file_phash(f))
+            lines.append(f"{f}  — {note}" if note else f)
+        self.images_preview.setPlainText("\n".join(lines))
 
     def add_post(self):
-        if get_face_app() is None:
+        if not inference_ready():
             QMessageBox.warning(self, "Face Model Not Ready", "Face model is still loading. Please wait...")
             return
+        if self.chroma_manager is None:
+            if self.index_error:
+                QMessageBox.critical(self, "Index Unavailable",
+                                     f"The search index could not be opened ({self.index_error}), so posts "
+                                     f"cannot be added. Restart the app to try again.")
+            else:
+                QMessageBox.warning(self, "Index Not Ready", "Search index is still loading. Please wait...")
+            return
 
         post_id_text = self.id_input.text().strip()
         if not post_id_text.isdigit():
@@ -86,77 +118,44 @@ class AddPostWidget(QWidget):
             QMessageBox.warning(self, "No images", "Please choose 1 to 5 images.")
             return
 
+        try:
+            metadata = clean_metadata({
+                'date_reported': self.date_input.text(),
+                'region': self.region_input.text(),
+                'sex': self.sex_input.currentText() if self.sex_input.currentIndex() > 0 else None,
+                'age_band': self.age_input.currentText() if self.age_input.currentIndex() > 0 else None,
+            })
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid details", str(e))
+            return
+
         threading.Thread(
             target=self._process_and_save_post,
-            args=(int(post_id_text), list(self.chosen_paths)),
+            args=(int(post_id_text), list(self.chosen_paths), metadata),
             daemon=True
         ).start()
 
         QMessageBox.information(self, "Processing", "Post is being processed.")
         self.id_input.clear()
+        self.date_input.clear()
+        self.region_input.clear()
+        self.sex_input.setCurrentIndex(0)
+        self.age_input.setCurrentIndex(0)
         self.images_preview.clear()
         self.chosen_paths = []
 
-    def _process_and_save_post(self, post_id, image_paths):
+    def _process_and_save_post(self, post_id, image_paths, metadata=None):
         try:
-            print(f"[INFO] Processing post {post_id}...")
-            emb = images_to_embedding_list(image_paths)
-
-            if emb is None:
-                def show_err():
-                    QMessageBox.critical(self, "No faces", "No faces detected.")
-                QTimer.singleShot(0, show_err)
-                return
-
-            print(f"[INFO] Embedding extracted for post {post_id}")
-
-            post_folder = KNOWN_DIR / str(post_id)
-            post_folder.mkdir(parents=True, exist_ok=True)
-
-            saved_paths = []
-            for src in image_paths:
-                ext = Path(src).suffix
-                dst = post_folder / (str(uuid.uuid4()) + ext)
-                img = cv2.imread(src)
-                if img is not None:
-                    try:
-                        cv2.imwrite(str(dst), img)
-                        saved_paths.append(str(dst))
-                    except Exception as e:
-                        print(f"[WARN] failed to save image {src}: {e}")
-
-            print(f"[INFO] Saved {len(saved_paths)} images for post {post_id}")
-
-            posts = load_posts()
-            new_post = {
-                "post_id": post_id,
-                "images": saved_paths,
-                "embedding": emb.tolist(),
-                "matches": []
-            }
-            posts.append(new_post)
-
-            if self.chroma_manager is not None:
-                try:
-                    self.chroma_manager.add_post(
-                        post_id=post_id,
-                        embedding=emb,
-                        metadata={'num_images': len(saved_paths)}
-                    )
-                    print(f"[INFO] Added post {post_id} to ChromaDB")
-                except Exception as e:
-                    print(f"[ERROR] Failed to add to ChromaDB: {e}")
-
-            print(f"[INFO] Computing matches for post {post_id}...")
-            self._recompute_all_matches(posts)
-
-            save_posts(posts)
-
-            print(f"[INFO] Post {post_id} added successfully!")
+            post_store.add_post(post_id, image_paths, self.chroma_manager, metadata=metadata)
 
             if self.on_post_added:
                 QTimer.singleShot(0, self.on_post_added)
 
+        except post_store.NoFaceError:
+            def show_err():
+                QMessageBox.critical(self, "No faces", "No faces detected.")
+            QTimer.singleShot(0, show_err)
+
         except Exception as e:
             print(f"[ERROR] Failed to process post: {e}")
             import traceback
@@ -167,64 +166,4 @@ class AddPostWidget(QWidget):
             QTimer.singleShot(0, show_err)
 
     def _recompute_all_matches(self, posts):
-        if self.chroma_manager is not None and self.chroma_manager.get_count() > 0:
-            print("[INFO] Using ChromaDB for matching...")
-            post_dict = {p['post_id']: p for p in posts}
-            
-            for p1 in posts:
-                try:
-                    emb1 = np.array(p1["embedding"], dtype=np.float32)
-
-                    results = self.chroma_manager.query_similar(emb1, n_results=100)
-
-                    matches = []
-                    if results and results.get('ids') and len(results['ids'][0]) > 0:
-                        for i, post_id_str in enumerate(results['ids'][0]):
-                            post_id = int(post_id_str.split('_')[1])
-
-                            if post_id == p1['post_id']:
-                                continue
-
-                            emb2 = np.array(post_dict[post_id]['embedding'], dtype=np.float32)
-                            similarity = cosine_similarity(emb1, emb2) 
-                            
-                            if similarity >= SIMILARITY_THRESHOLD:
-                                matches.append({
-                                    "post_id": post_id,
-                                    "similarity": round(float(similarity), 4)
-                                })
-
-                    p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
-                    print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
-
-                except Exception as e:
-                    print(f"[ERROR] Failed to compute matches for post {p1.get('post_id')}: {e}")
-                    p1["matches"] = []
-        else:
-            print("[INFO] Using cosine similarity (no ChromaDB)...")
-            for i, p1 in enumerate(posts):
-                matches = []
-                try:
-                    emb1 = np.array(p1["embedding"], dtype=np.float32)
-                except Exception:
-                    p1["matches"] = []
-                    continue
-
-                for j, p2 in enumerate(posts):
-                    if i == j:
-                        continue
-
-                    try:
-                        emb2 = np.array(p2["embedding"], dtype=np.float32)
-                    except Exception:
-                        continue
-
-                    sim = cosine_similarity(emb1, emb2)
-                    if sim >= SIMILARITY_THRESHOLD:
-                        matches.append({
-                            "post_id": p2["post_id"],
-                            "similarity": round(float(sim), 4)
-                        })
-
-                p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
-                print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
\ No newline at end of file
+        post_store.recompute_matches(posts, self.chroma_manager)
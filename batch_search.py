@@ -0,0 +1,314 @@
+# ============================================================================
+# Batch Search - Check a Folder of Photos against the Database
+# ============================================================================
+#
+# Usage:
+#   python batch_search.py intake/ more.jpg list.txt --report report.csv
+#   python batch_search.py intake/ --report report.json --top-k 10
+#
+# Sources are image files, folders (searched recursively) or .txt files with
+# one path per line. Images flow through a pipeline with bounded queues:
+#
+#   decode threads -> embed (inference workers) -> batched Chroma query -> report
+#
+# Every finished image is appended to <report>.progress.jsonl, so an
+# interrupted run continues where it stopped when started again with the same
+# report path. The CSV or JSON report is written when all images are done.
+
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import metrics
+from config import (
+    SIMILARITY_THRESHOLD, BATCH_SEARCH_TOP_K, BATCH_SEARCH_DECODE_THREADS,
+    BATCH_SEARCH_QUEUE_SIZE, BATCH_SEARCH_EMBED_BATCH
+)
+from matching import rank_search_hits
+from post_metadata import add_filter_arguments, filters_from_args
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+PROGRESS_INTERVAL_S = 1.0
+SEARCH_FAILED = "search failed"  # error of images whose index query raised
+_DONE = object()
+
+
+def collect_images(sources):
+    """Image paths from files, folders and .txt path lists, in order, without repeats"""
+    paths = []
+    for source in sources:
+        source = Path(source)
+        if source.is_dir():
+            paths.extend(str(p) for p in sorted(source.rglob("*")) if p.suffix.lower() in IMAGE_EXTENSIONS)
+        elif source.suffix.lower() == ".txt":
+            with open(source, 'r', encoding='utf-8') as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        else:
+            paths.append(str(source))
+    return list(dict.fromkeys(paths))
+
+
+def progress_path(report_path):
+    return Path(str(report_path) + ".progress.jsonl")
+
+
+def load_progress(report_path):
+    """path -> record of the images already finished by an earlier run"""
+    done = {}
+    path = progress_path(report_path)
+    if not path.exists():
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record.get('error') != SEARCH_FAILED:  # retried on resume
+                    done[record['image']] = record
+            except Exception:
+                continue  # a line cut short by the interruption
+    return done
+
+
+def write_report(report_path, paths, records, filters=None):
+    report_path = Path(report_path)
+    ordered = [records[p] for p in paths if p in records]
+
+    if report_path.suffix.lower() == ".csv":
+        with open(report_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['image', 'face_found', 'rank', 'post_id', 'similarity', 'error'])
+            for record in ordered:
+                if not record['matches']:
+                    writer.writerow([record['image'], int(record['face']), '', '', '', record['error'] or ''])
+                for rank, match in enumerate(record['matches'], 1):
+                    writer.writerow([record['image'], 1, rank, match['post_id'], f"{match['similarity']:.4f}", ''])
+    else:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'threshold': SIMILARITY_THRESHOLD,
+                'filters': filters,
+                'images': len(ordered),
+                'results': ordered,
+            }, f, indent=2)
+
+
+class BatchSearch:
+    def __init__(self, chroma_manager, top_k=BATCH_SEARCH_TOP_K, decode_threads=BATCH_SEARCH_DECODE_THREADS,
+                 queue_size=BATCH_SEARCH_QUEUE_SIZE, embed_batch=BATCH_SEARCH_EMBED_BATCH, filters=None):
+        self.chroma_manager = chroma_manager
+        self.filters = filters
+        self.top_k = top_k
+        self.decode_threads = max(1, decode_threads)
+        self.queue_size = max(1, queue_size)
+        self.embed_batch = max(1, embed_batch)
+        self.stats = {}
+
+    @staticmethod
+    def _take_batch(q, size):
+        """Block for one item, then take whatever else is ready, up to size"""
+        batch = [q.get()]
+        while len(batch) < size and batch[-1] is not _DONE:
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _decode(self, todo, decoded, remaining):
+        try:
+            while True:
+                try:
+                    path = todo.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    with metrics.span("image.decode"):
+                        img = cv2.imread(path)
+                    decoded.put((path, img, None if img is not None else "could not read image"))
+                except Exception as e:
+                    decoded.put((path, None, str(e)))
+        finally:
+            with remaining['lock']:
+                remaining['count'] -= 1
+                if remaining['count'] == 0:
+                    decoded.put(_DONE)
+
+    def _embed(self, decoded, embedded):
+        from face_model import get_face_embeddings_cached
+
+        try:
+            finished = False
+            while not finished:
+                batch = self._take_batch(decoded, self.embed_batch)
+                if batch[-1] is _DONE:
+                    batch.pop()
+                    finished = True
+                readable = [item for item in batch if item[1] is not None]
+                try:
+                    results = get_face_embeddings_cached([img for _, img, _ in readable]) if readable else []
+                    embeddings = {path: emb for (path, _, _), (emb, _) in zip(readable, results)}
+                    for path, _, error in batch:
+                        embedded.put((path, embeddings.get(path), error))
+                except Exception as e:
+                    print(f"[ERROR] Embedding batch of {len(readable)} images failed: {e}")
+                    for path, _, error in batch:
+                        embedded.put((path, None, error or f"embedding failed: {e}"))
+        finally:
+            embedded.put(_DONE)
+
+    def _match(self, batch):
+        with_face = [(path, emb) for path, emb, _ in batch if emb is not None]
+        ranges = []
+        if with_face and self.chroma_manager.get_count() > 0:
+            with metrics.span("batch_search.query", images=len(with_face)):
+                ranges = self.chroma_manager.query_range(
+                    [emb for _, emb in with_face], threshold=SIMILARITY_THRESHOLD, filters=self.filters
+                )
+        hits = {
+            path: rank_search_hits([emb], [found], verify=False)[:self.top_k]
+            for (path, emb), found in zip(with_face, ranges)
+        }
+
+        failed = {path for (path, _), found in zip(with_face, ranges) if found['failed']}
+        records = []
+        for path, emb, error in batch:
+            if error is None and emb is None:
+                error = "no face detected"
+            if path in failed:
+                error = SEARCH_FAILED
+            records.append({
+                'image': path,
+                'face': emb is not None,
+                'matches': [
+                    {'post_id': post_id, 'similarity': round(float(similarity), 4)}
+                    for post_id, similarity, _ in hits.get(path, [])
+                ],
+                'error': error if emb is None or path in failed else None,
+            })
+        return records
+
+    def _count(self, record):
+        self.stats['faces'] += int(record['face'])
+        self.stats['matched'] += int(bool(record['matches']))
+        self.stats['errors'] += int(record['error'] is not None)
+
+    def run(self, paths, report_path, resume=True, on_record=None, on_progress=None):
+        """Search every image in paths and write the report; returns the run statistics"""
+        records = load_progress(report_path) if resume else {}
+        if not resume and progress_path(report_path).exists():
+            progress_path(report_path).unlink()
+        pending = [p for p in paths if p not in records]
+        if records:
+            print(f"[INFO] Resuming: {len(paths) - len(pending)} of {len(paths)} images already done")
+
+        self.stats = {
+            'total': len(paths), 'done': len(paths) - len(pending), 'processed': 0,
+            'faces': 0, 'matched': 0, 'errors': 0, 'elapsed': 0.0, 'images_per_sec': 0.0,
+        }
+        for record in records.values():
+            self._count(record)
+        start = time.perf_counter()
+
+        if pending:
+            todo = queue.Queue()
+            for p in pending:
+                todo.put(p)
+            decoded = queue.Queue(maxsize=self.queue_size)
+            embedded = queue.Queue(maxsize=self.queue_size)
+            remaining = {'count': self.decode_threads, 'lock': threading.Lock()}
+
+            for i in range(self.decode_threads):
+                threading.Thread(target=self._decode, args=(todo, decoded, remaining),
+                                 name=f"batch-decode-{i}", daemon=True).start()
+            threading.Thread(target=self._embed, args=(decoded, embedded), name="batch-embed", daemon=True).start()
+
+            last_progress = start
+            with open(progress_path(report_path), 'a', encoding='utf-8') as progress_file:
+                finished = False
+                while not finished:
+                    batch = self._take_batch(embedded, self.queue_size)
+                    if batch[-1] is _DONE:
+                        batch.pop()
+                        finished = True
+                    if not batch:
+                        continue
+
+                    for record in self._match(batch):
+                        records[record['image']] = record
+                        progress_file.write(json.dumps(record) + "\n")
+                        self.stats['done'] += 1
+                        self.stats['processed'] += 1
+                        self._count(record)
+                        if on_record:
+                            on_record(record)
+                    progress_file.flush()
+
+                    now = time.perf_counter()
+                    self.stats['elapsed'] = now - start
+                    self.stats['images_per_sec'] = self.stats['processed'] / self.stats['elapsed']
+                    if on_progress and now - last_progress >= PROGRESS_INTERVAL_S:
+                        last_progress = now
+                        on_progress(self.stats)
+
+        write_report(report_path, paths, records, self.filters)
+        progress_path(report_path).unlink(missing_ok=True)
+
+        self.stats['elapsed'] = time.perf_counter() - start
+        if self.stats['processed']:
+            self.stats['images_per_sec'] = self.stats['processed'] / self.stats['elapsed']
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search many photos against the database and write a report")
+    parser.add_argument('sources', nargs='+', help="image files, folders or .txt files listing image paths")
+    parser.add_argument('--report', required=True, help="report file (.csv or .json)")
+    parser.add_argument('--top-k', type=int, default=BATCH_SEARCH_TOP_K)
+    parser.add_argument('--fresh', action='store_true', help="ignore the progress of an earlier interrupted run")
+    parser.add_argument('--jsonl', action='store_true', help="print one JSON object per finished image/progress line")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    from sharded_index import open_index
+    from face_model import start_inference
+
+    paths = collect_images(args.sources)
+    if not paths:
+        print("[ERROR] No images found")
+        sys.exit(1)
+    print(f"[INFO] {len(paths)} images to search")
+
+    start_inference()
+    search = BatchSearch(open_index(), top_k=args.top_k, filters=filters_from_args(args))
+
+    if args.jsonl:
+        on_record = lambda record: print(json.dumps({'image': record}), flush=True)
+        on_progress = lambda stats: print(json.dumps({'progress': stats}), flush=True)
+    else:
+        on_record = None
+        on_progress = lambda stats: print(
+            f"[INFO] {stats['done']}/{stats['total']} images, {stats['images_per_sec']:.1f} images/s, "
+            f"{stats['matched']} with matches", flush=True
+        )
+
+    stats = search.run(paths, args.report, resume=not args.fresh, on_record=on_record, on_progress=on_progress)
+    if args.jsonl:
+        print(json.dumps({'done': stats}), flush=True)
+    print(f"[INFO] Searched {stats['processed']} images in {stats['elapsed']:.1f}s "
+          f"({stats['images_per_sec']:.1f} images/s): {stats['faces']} with a face, {stats['matched']} with matches, "
+          f"{stats['errors']} skipped. Report: {os.path.abspath(args.report)}")
+
+
+if __name__ == "__main__":
+    main()
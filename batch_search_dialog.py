@@ -0,0 +1,111 @@
+# ============================================================================
+# Batch Search Dialog - Progress and Matches from batch_search.py
+# ============================================================================
+#
+# Runs batch_search.py --jsonl as a child process; started again with the same
+# report file, it resumes an interrupted run.
+
+import json
+import sys
+from pathlib import Path
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton, QProgressBar
+)
+from PyQt5.QtCore import Qt, QProcess
+
+SCRIPT = Path(__file__).resolve().parent / "batch_search.py"
+
+
+class BatchSearchDialog(QDialog):
+    def __init__(self, sources, report_path, view_post_callback, parent=None):
+        super().__init__(parent)
+        self.view_post_callback = view_post_callback
+        self.report_path = report_path
+        self.buffer = b""
+
+        self.setWindowTitle("Batch search")
+        self.setStyleSheet("background-color: #1C1E21; color: white;")
+        self.resize(560, 600)
+
+        layout = QVBoxLayout()
+        self.status_label = QLabel("Starting batch search...")
+        self.progress_bar = QProgressBar()
+        self.list_widget = QListWidget()
+        self.list_widget.setStyleSheet("background-color: #242526; color: white;")
+        self.list_widget.itemDoubleClicked.connect(self.open_match)
+
+        bottom_layout = QHBoxLayout()
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setStyleSheet("background-color: #e74c3c; color: white; font-weight: bold;")
+        self.stop_btn.clicked.connect(self.stop)
+        bottom_layout.addWidget(QLabel("Double-click an image to open its best match"))
+        bottom_layout.addStretch()
+        bottom_layout.addWidget(self.stop_btn)
+
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.list_widget)
+        layout.addLayout(bottom_layout)
+        self.setLayout(layout)
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.ForwardedErrorChannel)
+        self.process.readyReadStandardOutput.connect(self._read_output)
+        self.process.finished.connect(self._finished)
+        self.process.start(sys.executable, [str(SCRIPT), *map(str, sources), "--report", str(report_path), "--jsonl"])
+
+    def _read_output(self):
+        self.buffer += bytes(self.process.readAllStandardOutput())
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            line = line.decode('utf-8', errors='replace').strip()
+            if not line.startswith("{"):
+                if line:
+                    print(line)
+                continue
+            try:
+                message = json.loads(line)
+            except Exception:
+                continue
+            if 'image' in message:
+                self._add_record(message['image'])
+            elif 'progress' in message:
+                self._show_progress(message['progress'], "Searching")
+            elif 'done' in message:
+                self._show_progress(message['done'], "Finished")
+
+    def _add_record(self, record):
+        if not record['matches']:
+            return
+        matches = ", ".join(f"post {m['post_id']} ({m['similarity'] * 100:.1f}%)" for m in record['matches'])
+        item = QListWidgetItem(f"{Path(record['image']).name}  →  {matches}")
+        item.setToolTip(record['image'])
+        item.setData(Qt.UserRole, record['matches'][0]['post_id'])
+        self.list_widget.addItem(item)
+
+    def _show_progress(self, stats, state):
+        self.progress_bar.setMaximum(max(1, stats['total']))
+        self.progress_bar.setValue(stats['done'])
+        self.status_label.setText(
+            f"{state}: {stats['done']}/{stats['total']} images, {stats['images_per_sec']:.1f} images/s, "
+            f"{stats['matched']} with matches, {stats['errors']} skipped"
+        )
+
+    def _finished(self, exit_code, _status):
+        self.stop_btn.setEnabled(False)
+        if exit_code == 0:
+            self.status_label.setText(self.status_label.text() + f"\nReport: {self.report_path}")
+        else:
+            self.status_label.setText(f"Batch search stopped (exit code {exit_code}); run it again with the same report to resume")
+
+    def open_match(self, item):
+        self.view_post_callback(item.data(Qt.UserRole))
+
+    def stop(self):
+        if self.process.state() != QProcess.NotRunning:
+            self.process.kill()
+            self.process.waitForFinished(3000)
+
+    def closeEvent(self, event):
+        self.stop()
+        super().closeEvent(event)
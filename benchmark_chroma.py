@@ -0,0 +1,197 @@
+# ============================================================================
+# ChromaDB HNSW Benchmark - Query Latency and Recall vs Exact Search
+# ============================================================================
+#
+# Usage:
+#   python benchmark_chroma.py
+#   python benchmark_chroma.py --sizes 1000 10000 100000 --search-ef 10 50 100 200
+#   python benchmark_chroma.py --real --json hnsw_results.json
+#
+# Every run builds throw-away collections in a temporary directory; the
+# application's chroma_db is never touched.
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+from config import SIMILARITY_THRESHOLD, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF
+from chroma_manager import ChromaManager
+from utils import load_posts
+
+EMBEDDING_DIM = 512
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def synthetic_embeddings(size, rng, images_per_person=4, noise=0.045):
+    """Unit-norm embeddings grouped into identities, so true matches exist"""
+    num_people = max(1, size // images_per_person)
+    centers = normalize(rng.standard_normal((num_people, EMBEDDING_DIM)))
+    owners = rng.integers(0, num_people, size=size)
+    samples = centers[owners] + noise * rng.standard_normal((size, EMBEDDING_DIM))
+    return normalize(samples)
+
+
+def real_embeddings():
+    posts = load_posts()
+    embeddings = [p['embedding'] for p in posts if p.get('embedding')]
+    if not embeddings:
+        return None
+    return normalize(np.array(embeddings, dtype=np.float32))
+
+
+def make_queries(database, num_queries, rng, noise=0.045):
+    """Perturbed copies of database vectors, like a new photo of a known person"""
+    picks = rng.integers(0, len(database), size=num_queries)
+    queries = database[picks] + noise * rng.standard_normal((num_queries, EMBEDDING_DIM))
+    return normalize(queries)
+
+
+def exact_search(database, queries, k):
+    sims = queries @ database.T
+    k = min(k, database.shape[0])
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    return sims, top
+
+
+def run_size(database, queries, k_values, ef_values, m, construction_ef):
+    size = len(database)
+    results = []
+    workdir = tempfile.mkdtemp(prefix="hnsw_bench_")
+
+    def open_manager(search_ef):
+        # Chroma keeps a loaded index per process, so a new search_ef only
+        # applies to a freshly opened client
+        SharedSystemClient.clear_system_cache()
+        return ChromaManager(
+            persist_directory=workdir,
+            hnsw_params={'M': m, 'construction_ef': construction_ef, 'search_ef': search_ef},
+            auto_rebuild=False
+        )
+
+    try:
+        cm = open_manager(ef_values[0])
+
+        ids = [f"post_{i}" for i in range(size)]
+        metadatas = [{'post_id': i, 'num_images': 1} for i in range(size)]
+
+        start = time.perf_counter()
+        cm.add_embeddings(ids, database.tolist(), metadatas)
+        build_seconds = time.perf_counter() - start
+        print(f"[BENCH] Built index with {size} vectors in {build_seconds:.2f}s")
+
+        max_k = max(k_values)
+        sims, _ = exact_search(database, queries, max_k)
+
+        for ef in ef_values:
+            cm = open_manager(ef)
+
+            for k in k_values:
+                k_eff = min(k, size)
+                exact_top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+
+                latencies = []
+                recalls = []
+                threshold_hits = 0
+                threshold_total = 0
+
+                for qi, query in enumerate(queries):
+                    t0 = time.perf_counter()
+                    res = cm.query_similar(query, n_results=k_eff)
+                    latencies.append(time.perf_counter() - t0)
+
+                    if not res or not res.get('ids'):
+                        recalls.append(0.0)
+                        continue
+
+                    found = {int(pid.split('_')[1]) for pid in res['ids'][0]}
+                    recalls.append(len(found & set(exact_top[qi].tolist())) / k_eff)
+
+                    # True matches above the app threshold that fit in k results
+                    above = np.nonzero(sims[qi] >= SIMILARITY_THRESHOLD)[0]
+                    if len(above) > k_eff:
+                        above = above[np.argsort(-sims[qi][above])[:k_eff]]
+                    threshold_total += len(above)
+                    threshold_hits += len(found & set(above.tolist()))
+
+                lat_ms = np.array(latencies) * 1000.0
+                row = {
+                    'size': size,
+                    'M': m,
+                    'construction_ef': construction_ef,
+                    'search_ef': ef,
+                    'k': k_eff,
+                    'build_seconds': round(build_seconds, 4),
+                    'latency_ms_p50': round(float(np.percentile(lat_ms, 50)), 4),
+                    'latency_ms_p95': round(float(np.percentile(lat_ms, 95)), 4),
+                    'latency_ms_mean': round(float(lat_ms.mean()), 4),
+                    'recall_at_k': round(float(np.mean(recalls)), 4),
+                    'threshold_recall': round(threshold_hits / threshold_total, 4) if threshold_total else None,
+                }
+                results.append(row)
+                print(
+                    f"[BENCH] n={size:>7} ef={ef:>4} k={k_eff:>4} "
+                    f"p50={row['latency_ms_p50']:.2f}ms p95={row['latency_ms_p95']:.2f}ms "
+                    f"recall@k={row['recall_at_k']:.4f} threshold_recall={row['threshold_recall']}"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure HNSW query latency and recall@k against exact search")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help="database sizes for synthetic embeddings")
+    parser.add_argument('--queries', type=int, default=200, help="number of queries per setting")
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 100], help="n_results values")
+    parser.add_argument('--search-ef', type=int, nargs='+', default=[10, 50, 100, 200],
+                        help="search_ef values to sweep")
+    parser.add_argument('--m', type=int, default=HNSW_M)
+    parser.add_argument('--construction-ef', type=int, default=HNSW_CONSTRUCTION_EF)
+    parser.add_argument('--real', action='store_true',
+                        help="use embeddings from posts.json instead of synthetic ones")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', help="write results to this JSON file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    if args.real:
+        database = real_embeddings()
+        if database is None:
+            print("[ERROR] No embeddings found in posts.json")
+            return
+        databases = [database]
+    else:
+        databases = [synthetic_embeddings(size, rng) for size in args.sizes]
+
+    print(f"[BENCH] M={args.m} construction_ef={args.construction_ef} "
+          f"(configured search_ef={HNSW_SEARCH_EF})")
+
+    all_results = []
+    for database in databases:
+        queries = make_queries(database, args.queries, rng)
+        all_results.extend(run_size(database, queries, args.k, args.search_ef,
+                                    args.m, args.construction_ef))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({
+                'source': 'posts.json' if args.real else 'synthetic',
+                'similarity_threshold': SIMILARITY_THRESHOLD,
+                'results': all_results
+            }, f, indent=2)
+        print(f"[BENCH] Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
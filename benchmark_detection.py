@@ -0,0 +1,129 @@
+# ============================================================================
+# Detection Benchmark - Full-Size vs Downscaled Detection
+# ============================================================================
+#
+# Usage:
+#   python benchmark_detection.py photos/
+#   python benchmark_detection.py photos/ --sides 640 1280 1920 --upscale 4000 --json det.json
+#
+# For every image, embeds the first face with app.get on the full image (the
+# old path) and with face_model.detect_and_embed at each working size, then
+# reports the latency of both and how close the results are: cosine between
+# the embeddings and the largest landmark offset in full-image pixels.
+# --upscale resizes the inputs so their long side is that many pixels, to
+# stand in for phone and scanner photos when only small test images exist.
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def collect_images(sources):
+    paths = []
+    for source in map(Path, sources):
+        if source.is_dir():
+            paths.extend(p for p in sorted(source.rglob("*")) if p.suffix.lower() in IMAGE_EXTENSIONS)
+        else:
+            paths.append(source)
+    return paths
+
+
+def timed(fn, repeats):
+    timings, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-size and downscaled face detection")
+    parser.add_argument('sources', nargs='+', help="image files or folders")
+    parser.add_argument('--sides', type=int, nargs='+', default=[640, 1280, 1920], help="working sizes to test")
+    parser.add_argument('--upscale', type=int, help="resize inputs to this long side first")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', dest='json_path', help="write per-image results to this JSON file")
+    args = parser.parse_args()
+
+    from face_model import load_face_app, detect_and_embed
+    from model_version import get_active_model
+
+    app = load_face_app(get_active_model()['model'])
+    if app is None:
+        print("[ERROR] Face model could not be loaded")
+        sys.exit(1)
+
+    rows = []
+    for path in collect_images(args.sources):
+        decode_s, image = timed(lambda: cv2.imread(str(path)), args.repeats)
+        if image is None:
+            print(f"[WARN] Could not read {path}")
+            continue
+        if args.upscale:
+            scale = args.upscale / max(image.shape[:2])
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+        full_s, faces = timed(lambda: app.get(image), args.repeats)
+        if not faces:
+            print(f"[WARN] No face in {path.name} at full size, skipped")
+            continue
+        reference = faces[0]
+
+        row = {'image': str(path), 'size': list(image.shape[:2][::-1]), 'decode_ms': decode_s * 1000,
+               'full_ms': full_s * 1000, 'sides': {}}
+        for side in args.sides:
+            fast_s, found = timed(lambda: detect_and_embed(app, image, max_side=side), args.repeats)
+            result = {'ms': fast_s * 1000, 'found': bool(found)}
+            if found:
+                result['cosine'] = cosine(reference.embedding, found[0].embedding)
+                result['kps_px'] = float(np.abs(np.asarray(found[0].kps) - np.asarray(reference.kps)).max())
+            row['sides'][side] = result
+        rows.append(row)
+
+        parts = [f"{path.name} {row['size'][0]}x{row['size'][1]}: decode {row['decode_ms']:.0f}ms, "
+                 f"full {row['full_ms']:.0f}ms"]
+        for side, r in row['sides'].items():
+            parts.append(f"{side}: {r['ms']:.0f}ms cos {r['cosine']:.4f} kps {r['kps_px']:.1f}px"
+                         if r['found'] else f"{side}: no face")
+        print("[BENCH] " + " | ".join(parts))
+
+    if not rows:
+        print("[ERROR] No images with a face")
+        sys.exit(1)
+
+    print(f"[BENCH] {len(rows)} images, median full-size path {statistics.median(r['full_ms'] for r in rows):.1f}ms")
+    for side in args.sides:
+        results = [r['sides'][side] for r in rows]
+        found = [r for r in results if r['found']]
+        line = (f"[BENCH] max side {side:>5}: median {statistics.median(r['ms'] for r in results):8.1f}ms "
+                f"(speedup x{statistics.median(row['full_ms'] / r['ms'] for row, r in zip(rows, results)):.2f}), "
+                f"faces missed {len(results) - len(found)}")
+        if found:
+            line += (f", cosine to full-size min {min(r['cosine'] for r in found):.4f} "
+                     f"median {statistics.median(r['cosine'] for r in found):.4f}, "
+                     f"landmarks within {max(r['kps_px'] for r in found):.1f}px")
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'sides': args.sides, 'upscale': args.upscale, 'results': rows}, f, indent=2)
+        print(f"[BENCH] Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# ============================================================================
+# Recognition Benchmark - One Call per Face vs Batched Calls
+# ============================================================================
+#
+# Usage:
+#   python benchmark_recognition.py photos/
+#   python benchmark_recognition.py photos/ --batch-sizes 1 8 16 32 64 --first-face --json rec.json
+#
+# Detects every face in the images once, then embeds the aligned crops with
+# one recognition call per face (what FaceAnalysis.get does) and with
+# face_model.embed_chips at each batch size, and reports faces per second and
+# the lowest cosine between the batched and the per-face embeddings. The last
+# line times the whole path per image (detect_and_embed in a loop) against
+# detect_and_embed_batch over all images at RECOGNITION_BATCH_SIZE.
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def collect_images(sources):
+    paths = []
+    for source in map(Path, sources):
+        if source.is_dir():
+            paths.extend(p for p in sorted(source.rglob("*")) if p.suffix.lower() in IMAGE_EXTENSIONS)
+        else:
+            paths.append(source)
+    return paths
+
+
+def timed(fn, repeats):
+    timings, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-face and batched face recognition")
+    parser.add_argument('sources', nargs='+', help="image files or folders")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--first-face', action='store_true', help="only the first face of each image, as the app uses")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--json', dest='json_path', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    from config import RECOGNITION_BATCH_SIZE
+    from face_model import load_face_app, detect_faces, detect_and_embed, detect_and_embed_batch, embed_chips
+    from insightface.utils import face_align
+    from model_version import get_active_model
+
+    app = load_face_app(get_active_model()['model'])
+    if app is None or not hasattr(app, 'det_model'):
+        print("[ERROR] Face model could not be loaded")
+        sys.exit(1)
+    recognizer = app.models['recognition']
+
+    images = []
+    for path in collect_images(args.sources):
+        image = cv2.imread(str(path))
+        if image is None:
+            print(f"[WARN] Could not read {path}")
+            continue
+        images.append(image)
+
+    max_faces = 1 if args.first_face else 0
+    chips = []
+    for image in images:
+        for face in detect_faces(app, image, max_faces=max_faces):
+            if face.kps is not None:
+                chips.append(face_align.norm_crop(image, landmark=face.kps, image_size=recognizer.input_size[0]))
+    if not chips:
+        print("[ERROR] No faces found")
+        sys.exit(1)
+    print(f"[BENCH] {len(images)} images, {len(chips)} faces")
+
+    embed_chips(chips[:max(args.batch_sizes)], app)  # warm up the session
+    single_s, reference = timed(
+        lambda: np.stack([np.asarray(recognizer.get_feat(chip), dtype=np.float32).ravel() for chip in chips]),
+        args.repeats
+    )
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    print(f"[BENCH] one call per face: {single_s * 1000:8.1f}ms ({len(chips) / single_s:7.1f} faces/s)")
+
+    results = {'images': len(images), 'faces': len(chips), 'per_face_ms': single_s * 1000, 'batches': {}}
+    for batch_size in args.batch_sizes:
+        batch_s, embeddings = timed(lambda: embed_chips(chips, app, batch_size), args.repeats)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        min_cosine = float((embeddings * reference).sum(axis=1).min())
+        results['batches'][batch_size] = {'ms': batch_s * 1000, 'cosine_min': min_cosine}
+        print(f"[BENCH] batch {batch_size:>4}: {batch_s * 1000:8.1f}ms ({len(chips) / batch_s:7.1f} faces/s, "
+              f"x{single_s / batch_s:.2f}), cosine to per-face min {min_cosine:.6f}")
+
+    loop_s, _ = timed(lambda: [detect_and_embed(app, image) for image in images], args.repeats)
+    batched_s, _ = timed(lambda: detect_and_embed_batch(app, images), args.repeats)
+    results['end_to_end'] = {'per_image_ms': loop_s * 1000, 'batched_ms': batched_s * 1000,
+                             'batch_size': RECOGNITION_BATCH_SIZE}
+    print(f"[BENCH] first face of every image: per image {loop_s * 1000:.1f}ms, "
+          f"batched ({RECOGNITION_BATCH_SIZE}) {batched_s * 1000:.1f}ms (x{loop_s / batched_s:.2f})")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[BENCH] Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
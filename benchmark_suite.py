@@ -0,0 +1,302 @@
+# ============================================================================
+# Hot Path Benchmark Suite (headless)
+# ============================================================================
+#
+# Usage:
+#   python benchmark_suite.py
+#   python benchmark_suite.py --sizes 1000 10000 --repeats 5 --output before.json
+#   python benchmark_suite.py --output after.json --compare before.json
+#
+# Builds synthetic databases (random unit-norm 512-dim embeddings plus a pool
+# of dummy JPEGs) in a temporary data directory, then times the application's
+# hot paths with a mocked face model and the offscreen Qt platform.
+# Results are written as JSON so runs from different versions can be compared.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+_DATA_DIR = tempfile.mkdtemp(prefix="findme_bench_")
+os.environ["FINDME_DATA_DIR"] = _DATA_DIR
+# The mocked face model lives in this process
+os.environ["FINDME_INFERENCE_WORKERS"] = "0"
+
+sys.path.append(str(Path(__file__).parent))
+
+import numpy as np
+
+# Paths that grow quadratically or build one widget per post are capped by
+# default so a full run finishes; --no-limits lifts the caps.
+SIZE_LIMITS = {
+    'recompute_matches_linear': 2000,
+    'recompute_matches_chroma': 10000,
+    'feed_refresh': 10000,
+}
+
+DUMMY_IMAGE_COUNT = 50
+QUERY_IMAGES = 3
+
+
+class FakeFaceApp:
+    """Stands in for FaceAnalysis: one face with a random unit embedding per image"""
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+    def get(self, image):
+        emb = self.rng.standard_normal(512).astype(np.float32)
+        emb /= np.linalg.norm(emb)
+        return [types.SimpleNamespace(embedding=emb)]
+
+
+def install_fake_face_model():
+    try:
+        import insightface.app  # noqa: F401
+    except ImportError:
+        stub = types.ModuleType("insightface")
+        stub_app = types.ModuleType("insightface.app")
+        stub_app.FaceAnalysis = FakeFaceApp
+        stub.app = stub_app
+        sys.modules["insightface"] = stub
+        sys.modules["insightface.app"] = stub_app
+
+    import face_model
+    face_model._face_app = FakeFaceApp()
+    return face_model
+
+
+def write_dummy_images(folder, count, rng):
+    import cv2
+
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        img = rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+        path = folder / f"dummy_{i}.jpg"
+        cv2.imwrite(str(path), img)
+        paths.append(str(path))
+    return paths
+
+
+def build_database(size, image_paths, rng):
+    from benchmark_chroma import synthetic_embeddings
+    from utils import save_posts
+
+    embeddings = synthetic_embeddings(size, rng)
+    posts = []
+    for i in range(size):
+        posts.append({
+            "post_id": i + 1,
+            "images": [image_paths[i % len(image_paths)]],
+            "embedding": embeddings[i].tolist(),
+            "matches": []
+        })
+    save_posts(posts)
+    return embeddings
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, timeout=10
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def time_call(fn, repeats):
+    timings = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(name, size, timings):
+    return {
+        'path': name,
+        'size': size,
+        'status': 'ok',
+        'repeats': len(timings),
+        'min_s': round(min(timings), 6),
+        'median_s': round(statistics.median(timings), 6),
+        'mean_s': round(statistics.mean(timings), 6),
+    }
+
+
+def run_size(size, args, image_paths, rng, qt_app):
+    import utils
+    from chroma_manager import ChromaManager
+    from search_cache import get_search_cache
+    from ui.add_post_widget import AddPostWidget
+    from ui.feed_widget import FeedWidget
+    from ui.search_results_widget import SearchResultsWidget
+    from ui.search_widget import SearchWidget
+
+    face_model = sys.modules['face_model']
+    results = []
+
+    def allowed(name):
+        if args.paths and name not in args.paths:
+            return False
+        limit = SIZE_LIMITS.get(name)
+        if limit is not None and size > limit and not args.no_limits:
+            print(f"[BENCH] {name:<28} n={size:>7} skipped (limit {limit}, use --no-limits)")
+            results.append({'path': name, 'size': size, 'status': 'skipped'})
+            return False
+        return True
+
+    def record(name, fn, repeats=None):
+        if not allowed(name):
+            return
+        timings = time_call(fn, repeats or args.repeats)
+        row = summarize(name, size, timings)
+        results.append(row)
+        print(f"[BENCH] {name:<28} n={size:>7} median={row['median_s'] * 1000:10.2f}ms "
+              f"min={row['min_s'] * 1000:10.2f}ms")
+
+    print(f"[BENCH] Building synthetic database with {size} posts...")
+    embeddings = build_database(size, image_paths, rng)
+
+    chroma_dir = Path(_DATA_DIR) / f"chroma_{size}"
+    holder = {}
+
+    def build_chroma():
+        shutil.rmtree(chroma_dir, ignore_errors=True)
+        holder['cm'] = ChromaManager(persist_directory=str(chroma_dir))
+
+    record('chroma_rebuild', build_chroma, repeats=1)
+    if 'cm' not in holder:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            build_chroma()
+    cm = holder['cm']
+
+    query_idx = rng.integers(0, size, size=QUERY_IMAGES)
+    noise = 0.045 * rng.standard_normal((QUERY_IMAGES, embeddings.shape[1]))
+    queries = [(embeddings[i] + n).astype(np.float32) for i, n in zip(query_idx, noise)]
+
+    record('load_posts', utils.load_posts)
+    record('compare_embedding_with_posts', lambda: face_model.compare_embedding_with_posts(queries[0]))
+
+    results_widget = SearchResultsWidget(lambda pid: None)
+    search = SearchWidget(results_widget, cm)
+    search_cache = get_search_cache()
+
+    def search_uncached():
+        # Every repeat after the first would otherwise be a search_cache hit
+        search_cache.clear()
+        return search._search_with_chroma(queries)
+
+    record('search_with_chroma', search_uncached)
+    search_cache.clear()
+    search._search_with_chroma(queries)
+    record('search_with_chroma_cached', lambda: search._search_with_chroma(queries))
+    record('search_linear', lambda: search._search_linear(queries))
+
+    add_widget = AddPostWidget(None, cm)
+    record('recompute_matches_chroma', lambda: add_widget._recompute_all_matches(utils.load_posts()), repeats=1)
+
+    add_linear = AddPostWidget(None, None)
+    record('recompute_matches_linear', lambda: add_linear._recompute_all_matches(utils.load_posts()), repeats=1)
+
+    if allowed('feed_refresh'):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            feed = FeedWidget(cm)
+            feed.timer.stop()
+        timings = time_call(lambda: (feed.refresh(), qt_app.processEvents()), args.repeats)
+        row = summarize('feed_refresh', size, timings)
+        results.append(row)
+        print(f"[BENCH] {'feed_refresh':<28} n={size:>7} median={row['median_s'] * 1000:10.2f}ms "
+              f"min={row['min_s'] * 1000:10.2f}ms")
+        feed.deleteLater()
+
+    for w in (results_widget, search, add_widget, add_linear):
+        w.deleteLater()
+    qt_app.processEvents()
+
+    return results
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+
+    base = {(r['path'], r['size']): r for r in baseline.get('results', []) if r.get('status') == 'ok'}
+    print(f"\n[BENCH] Comparison with {baseline_path} ({baseline.get('meta', {}).get('git_commit')})")
+    for row in current:
+        if row.get('status') != 'ok':
+            continue
+        old = base.get((row['path'], row['size']))
+        if not old or not old['median_s']:
+            continue
+        ratio = row['median_s'] / old['median_s']
+        flag = "  REGRESSION" if ratio > 1.2 else ""
+        print(f"  {row['path']:<28} n={row['size']:>7} {old['median_s'] * 1000:10.2f}ms -> "
+              f"{row['median_s'] * 1000:10.2f}ms  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the application's hot paths on synthetic databases")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--paths', nargs='+', help="only run these hot paths")
+    parser.add_argument('--no-limits', action='store_true', help="run slow paths at every size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default="benchmark_results.json")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    from PyQt5.QtWidgets import QApplication
+
+    qt_app = QApplication.instance() or QApplication(sys.argv)
+    install_fake_face_model()
+
+    rng = np.random.default_rng(args.seed)
+    all_results = []
+
+    try:
+        image_paths = write_dummy_images(Path(_DATA_DIR) / "dummy_images", DUMMY_IMAGE_COUNT, rng)
+        for size in args.sizes:
+            all_results.extend(run_size(size, args, image_paths, rng, qt_app))
+    finally:
+        shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeats': args.repeats,
+            'seed': args.seed,
+        },
+        'results': all_results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCH] Results written to {args.output}")
+
+    if args.compare:
+        compare(all_results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
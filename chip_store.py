@@ -0,0 +1,255 @@
+# ============================================================================
+# Face-Chip Store - Aligned Face Crops for Re-Embedding without Detection
+# ============================================================================
+#
+# The aligned CHIP_SIZE x CHIP_SIZE crop the recognition model sees is kept for
+# every stored image, together with the detector's bbox and 5 landmarks.
+# Chips are fixed-size rows in one raw file (read via memmap); the row
+# metadata lives in chips_meta.npz, which also names the data file. Deleting a
+# post only marks its rows dead; save() compacts once most rows are dead by
+# writing a new data file (chips-<generation>.bin) and then the metadata that
+# points to it, so a crash in between leaves the old pair intact.
+#
+# Other processes add chips too: call refresh() under the store lock before
+# changing the store, so new rows go after theirs.
+#
+# Usage:
+#   python chip_store.py backfill   # detect and store chips for images that have none
+#   python chip_store.py stats
+
+import glob
+import os
+import sys
+import threading
+import numpy as np
+from config import CHIP_STORE_DIR, CHIP_SIZE
+
+CHIP_SHAPE = (CHIP_SIZE, CHIP_SIZE, 3)
+CHIP_BYTES = int(np.prod(CHIP_SHAPE))
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class ChipStore:
+    def __init__(self, directory=CHIP_STORE_DIR):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "chips_meta.npz")
+        self.generation = 0
+        self.data_path = self._data_path(0)
+        self.signature = None  # (mtime_ns, size) of the metadata this copy matches
+        self.lock = threading.RLock()
+        self.post_ids = np.zeros(0, dtype=np.int64)
+        self.paths = []
+        self.bboxes = np.zeros((0, 4), dtype=np.float32)
+        self.kps = np.zeros((0, 5, 2), dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)
+        self.load()
+
+    def __len__(self):
+        return int(self.live.sum())
+
+    def _data_path(self, generation):
+        # Generation 0 is the chips.bin of stores written before compaction was versioned
+        name = "chips.bin" if generation == 0 else f"chips-{generation}.bin"
+        return os.path.join(self.directory, name)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.meta_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """Reload if another process saved since this copy was loaded; call under the store lock"""
+        with self.lock:
+            if self._file_signature() != self.signature:
+                self.load()
+
+    def load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            signature = self._file_signature()
+            data = np.load(self.meta_path, allow_pickle=False)
+            self.generation = int(data['generation']) if 'generation' in data.files else 0
+            self.data_path = self._data_path(self.generation)
+            self.post_ids = data['post_ids'].astype(np.int64)
+            self.paths = [str(p) for p in data['paths']]
+            self.bboxes = data['bboxes'].astype(np.float32)
+            self.kps = data['kps'].astype(np.float32)
+            self.live = data['live'].astype(bool)
+            self.signature = signature
+            print(f"[INFO] Loaded face-chip store with {len(self)} chips")
+        except Exception as e:
+            print(f"[WARN] Could not load face-chip store: {e}")
+
+    def save(self):
+        with self.lock:
+            if len(self.live) and (~self.live).sum() > len(self.live) // 2:
+                self.compact()
+            else:
+                self._write_meta()
+
+    def _write_meta(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.meta_path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            post_ids=self.post_ids,
+            paths=np.array(self.paths, dtype=str),
+            bboxes=self.bboxes,
+            kps=self.kps,
+            live=self.live,
+            generation=np.array(self.generation)
+        )
+        os.replace(tmp_path, self.meta_path)
+        self.signature = self._file_signature()
+
+    def add(self, post_id, path, chip, bbox, kps):
+        chip = np.ascontiguousarray(chip, dtype=np.uint8)
+        if chip.shape != CHIP_SHAPE:
+            raise ValueError(f"Chip must be {CHIP_SHAPE}, got {chip.shape}")
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            row = len(self.live)
+            # Write at the row offset, not append: rows past the saved metadata
+            # (from an interrupted run) are simply overwritten. Callers refresh()
+            # under the store lock first, so row counts the other processes' rows
+            with open(self.data_path, 'r+b' if os.path.exists(self.data_path) else 'wb') as f:
+                f.seek(row * CHIP_BYTES)
+                f.write(chip.tobytes())
+
+            self.post_ids = np.append(self.post_ids, np.int64(post_id))
+            self.paths.append(str(path))
+            self.bboxes = np.vstack([self.bboxes, np.asarray(bbox, dtype=np.float32).reshape(1, 4)])
+            self.kps = np.concatenate([self.kps, np.asarray(kps, dtype=np.float32).reshape(1, 5, 2)])
+            self.live = np.append(self.live, True)
+            return row
+
+    def remove_post(self, post_id):
+        with self.lock:
+            hit = self.live & (self.post_ids == post_id)
+            self.live[hit] = False
+            return int(hit.sum())
+
+    def has(self, post_id, path):
+        with self.lock:
+            rows = np.nonzero(self.live & (self.post_ids == post_id))[0]
+            return any(self.paths[i] == str(path) for i in rows)
+
+    def copy_for_path(self, post_id, path):
+        """Reuse the chip of an identical stored image for another post; False if there is none"""
+        with self.lock:
+            for i in np.nonzero(self.live)[0]:
+                if self.paths[i] == str(path):
+                    self.add(post_id, path, self.read([i])[0], self.bboxes[i], self.kps[i])
+                    return True
+            return False
+
+    def rows(self):
+        """Indexes of live rows"""
+        with self.lock:
+            return np.nonzero(self.live)[0]
+
+    def read(self, rows):
+        """(len(rows), 112, 112, 3) uint8 array of the given rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros((0,) + CHIP_SHAPE, dtype=np.uint8)
+        with self.lock:
+            data = np.memmap(self.data_path, dtype=np.uint8, mode='r', shape=(len(self.live),) + CHIP_SHAPE)
+            return np.array(data[rows])
+
+    def iter_batches(self, batch_size=64, rows=None):
+        """Yield (rows, post_ids, paths, chips) over live rows in batches"""
+        rows = self.rows() if rows is None else np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            yield batch, self.post_ids[batch], [self.paths[i] for i in batch], self.read(batch)
+
+    def compact(self):
+        """Copy the live rows into a new data file, then save metadata pointing to it"""
+        with self.lock:
+            keep = np.nonzero(self.live)[0]
+            generation = self.generation + 1
+            new_path = self._data_path(generation)
+            with open(new_path, 'wb') as f:
+                for start in range(0, len(keep), 1024):
+                    f.write(self.read(keep[start:start + 1024]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.post_ids = self.post_ids[keep]
+            self.paths = [self.paths[i] for i in keep]
+            self.bboxes = self.bboxes[keep]
+            self.kps = self.kps[keep]
+            self.live = np.ones(len(keep), dtype=bool)
+            self.generation = generation
+            self.data_path = new_path
+            self._write_meta()
+            self._remove_stale_data()
+            print(f"[INFO] Compacted face-chip store to {len(keep)} chips")
+
+    def _remove_stale_data(self):
+        for path in glob.glob(os.path.join(self.directory, "chips*.bin")):
+            if os.path.abspath(path) != os.path.abspath(self.data_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # still mapped by another process (Windows); removed on a later compaction
+
+
+def get_chip_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChipStore()
+        return _store
+
+
+def backfill_from_posts():
+    """Detect and store chips for post images that do not have one yet"""
+    import cv2
+    from utils import load_posts
+    from face_model import get_face_embedding_from_image
+    from store_lock import get_store_lock
+
+    store = get_chip_store()
+    found = []
+    missing = 0
+    for post in load_posts():
+        for path in post.get('images', []):
+            if store.has(post['post_id'], path):
+                continue
+            img = cv2.imread(path)
+            face = {}
+            if img is None or get_face_embedding_from_image(img, face_info=face) is None or not face:
+                missing += 1
+                continue
+            found.append((post['post_id'], path, face))
+
+    # Detection ran without the lock; only the append blocks the app
+    added = 0
+    with get_store_lock():
+        store.refresh()
+        for post_id, path, face in found:
+            if not store.has(post_id, path):
+                store.add(post_id, path, face['chip'], face['bbox'], face['kps'])
+                added += 1
+        store.save()
+    print(f"[INFO] Stored {added} new chips ({missing} images without a usable face), {len(store)} total")
+    return added
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        backfill_from_posts()
+    elif len(sys.argv) > 1 and sys.argv[1] == "stats":
+        store = get_chip_store()
+        size = os.path.getsize(store.data_path) if os.path.exists(store.data_path) else 0
+        print(f"{len(store)} live chips, {len(store.live) - len(store)} dead rows, {size / (1024 * 1024):.1f} MB")
+    else:
+        print("Usage: python chip_store.py backfill|stats")
@@ -1,44 +1,238 @@
 # ============================================================================
 # ChromaDB Manager
 # ============================================================================
+#
+# Each embedding version has a main collection with every post, plus one
+# partition collection per region holding a copy of that region's posts.
+# Unfiltered searches use the main collection; a search filtered by region
+# only queries the matching (much smaller) partitions. The other filters
+# (date, sex, age band) become a `where` clause on whichever is searched.
+#
+# Chroma keeps the HNSW index in memory, so one process does not see vectors
+# another process (the GUI, the service, reembed.py, snapshot.py) added to the
+# same directory. Every write holds INDEX_LOCK and rewrites INDEX_STAMP; a
+# manager that finds the stamp changed by someone else reopens its client,
+# which loads the index again from disk, before it next reads or writes.
 
+import contextlib
+import hashlib
+import os
+import re
+import time
+import uuid
 import chromadb
 import numpy as np
-from pathlib import Path
-import sys
-from config import SIMILARITY_THRESHOLD
+import metrics
+from config import (
+    CHROMA_DIR, SIMILARITY_THRESHOLD, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF,
+    RANGE_QUERY_INITIAL_K, RANGE_QUERY_MAX_K
+)
 from utils import load_posts
+from model_version import get_active_version, collection_name, post_version
+from post_metadata import chroma_metadata, build_where, normalize_region
+from store_lock import StoreLock
+
+PARTITION_SEPARATOR = "__r_"
+PARTITION_REFRESH_S = 5.0
+INDEX_LOCK = "index.lock"     # held while writing, in the persist directory
+INDEX_STAMP = "index.stamp"   # new token after every write
+
+
+def partition_name(base, region):
+    """Collection name for a region partition (Chroma allows [A-Za-z0-9._-])"""
+    slug = re.sub(r'[^a-z0-9]+', '-', region).strip('-')[:48]
+    digest = hashlib.sha1(region.encode('utf-8')).hexdigest()[:8]
+    return f"{base}{PARTITION_SEPARATOR}{slug + '-' if slug else ''}{digest}"
+
 
 class ChromaManager:
-    def __init__(self, persist_directory=None):
+    def __init__(self, persist_directory=None, hnsw_params=None, auto_rebuild=True, version=None, post_filter=None):
+        """version=None follows the active embedding version (see model_version.py);
+        post_filter(post) limits rebuilds to some posts (used by the shards of sharded_index.py)"""
         if persist_directory is None:
-            if getattr(sys, 'frozen', False):
-                base_dir = Path(sys.executable).parent
-            else:
-                base_dir = Path(__file__).parent
-            
-            persist_directory = str(base_dir / "chroma_db")
+            persist_directory = str(CHROMA_DIR)
         
         print(f"[INFO] ChromaDB storage path: {persist_directory}")
         
+        self.hnsw_params = {
+            'M': HNSW_M,
+            'construction_ef': HNSW_CONSTRUCTION_EF,
+            'search_ef': HNSW_SEARCH_EF,
+        }
+        if hnsw_params:
+            self.hnsw_params.update(hnsw_params)
+        
+        self.follow_active = version is None
+        self.version = get_active_version() if version is None else version
+        self.post_filter = post_filter
+        
+        self.persist_directory = persist_directory
+        self.index_lock = StoreLock(os.path.join(persist_directory, INDEX_LOCK), span="chroma.lock_wait")
+        self.stamp = self._read_stamp()
         self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection(
-            name="face_embeddings",
-            metadata={"hnsw:space": "cosine"}
-        )
+        self._open_collection()
         
-        if self.get_count() == 0:
+        if auto_rebuild and self.get_count() == 0:
             self.rebuild_from_posts()
     
+    def _open_collection(self):
+        """Open the version's main collection and its region partitions"""
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name(self.version),
+            metadata=self._collection_metadata()
+        )
+        self.partitions = {}
+        self._load_partitions()
+        self.set_search_ef(self.hnsw_params['search_ef'])
+    
+    def _load_partitions(self):
+        """Pick up region partitions, including ones created by another process"""
+        base = collection_name(self.version)
+        self._partitions_loaded = time.monotonic()
+        try:
+            for collection in self.client.list_collections():
+                metadata = collection.metadata or {}
+                region = metadata.get('findme:region')
+                if metadata.get('findme:partition_of') == base and region not in self.partitions:
+                    self.partitions[region] = collection
+        except Exception as e:
+            print(f"[WARN] Could not list region partitions: {e}")
+    
+    def _partition(self, region, create=False):
+        """Collection holding the copies of region's posts"""
+        region = normalize_region(region)
+        collection = self.partitions.get(region)
+        if collection is None and create:
+            base = collection_name(self.version)
+            metadata = self._collection_metadata()
+            metadata.update({'findme:partition_of': base, 'findme:region': region})
+            collection = self.client.get_or_create_collection(name=partition_name(base, region), metadata=metadata)
+            self.partitions[region] = collection
+            print(f"[INFO] Created ChromaDB partition for region '{region}'")
+        return collection
+    
+    def _collections(self, regions=None):
+        """Collections to search: the main one, or the partitions of regions"""
+        if regions is None:
+            return [self.collection]
+        regions = [normalize_region(r) for r in regions]
+        if any(r not in self.partitions for r in regions):
+            self._load_partitions()
+        return [self.partitions[r] for r in regions if r in self.partitions]
+    
+    def _read_stamp(self):
+        try:
+            with open(os.path.join(self.persist_directory, INDEX_STAMP), 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def _refresh(self):
+        """Reopen the client if another process wrote to the index since this one last looked"""
+        if self._read_stamp() == self.stamp:
+            return False
+        with self.index_lock:
+            stamp = self._read_stamp()
+            if stamp == self.stamp:
+                return False
+            print("[INFO] ChromaDB was changed by another process, reloading the index")
+            self.client.close()
+            self.client = chromadb.PersistentClient(path=self.persist_directory)
+            self._open_collection()
+            self.stamp = stamp
+            return True
+    
+    @contextlib.contextmanager
+    def _writing(self):
+        """Hold the index lock, catch up with other processes first and tell them about this write"""
+        with self.index_lock:
+            self._sync_version()
+            try:
+                yield
+            finally:
+                stamp = uuid.uuid4().hex
+                tmp_path = os.path.join(self.persist_directory, INDEX_STAMP + ".tmp")
+                with open(tmp_path, 'w') as f:
+                    f.write(stamp)
+                os.replace(tmp_path, os.path.join(self.persist_directory, INDEX_STAMP))
+                self.stamp = stamp
+    
+    def _sync_version(self):
+        """Switch to the newly promoted collection if the active version changed"""
+        self._refresh()
+        if self.follow_active:
+            active = get_active_version()
+            if active != self.version:
+                print(f"[INFO] Embedding version changed {self.version} -> {active}, switching collection")
+                self.version = active
+                self._open_collection()
+                return
+        if time.monotonic() - self._partitions_loaded > PARTITION_REFRESH_S:
+            self._load_partitions()
+    
+    def _collection_metadata(self):
+        """HNSW settings used when the collection is created"""
+        return {
+            "hnsw:space": "cosine",
+            "hnsw:M": int(self.hnsw_params['M']),
+            "hnsw:construction_ef": int(self.hnsw_params['construction_ef']),
+            "hnsw:search_ef": int(self.hnsw_params['search_ef']),
+        }
+    
+    def set_search_ef(self, search_ef: int):
+        """Change the HNSW search breadth (applies when the index is next loaded)"""
+        search_ef = int(search_ef)
+        self.hnsw_params['search_ef'] = search_ef
+        changed = 0
+        try:
+            for collection in [self.collection, *self.partitions.values()]:
+                current = (collection.configuration_json or {}).get('hnsw') or {}
+                if current.get('ef_search') != search_ef:
+                    collection.modify(configuration={'hnsw': {'ef_search': search_ef}})
+                    changed += 1
+            if changed:
+                print(f"[INFO] HNSW search_ef set to {search_ef}")
+            return True
+        except Exception as e:
+            print(f"[WARN] Could not update HNSW search_ef: {e}")
+            return False
+    
+    def add_embeddings(self, ids, embeddings, metadatas, upsert=False):
+        """Add embeddings (and the region partition copies) in chunks that fit the client's max batch size"""
+        with self._writing():
+            try:
+                batch_size = self.client.get_max_batch_size()
+            except Exception:
+                batch_size = 5000
+            
+            groups = {None: list(range(len(ids)))}
+            for i, metadata in enumerate(metadatas):
+                if metadata.get('region'):
+                    groups.setdefault(metadata['region'], []).append(i)
+            
+            for region, indices in groups.items():
+                collection = self.collection if region is None else self._partition(region, create=True)
+                write = collection.upsert if upsert else collection.add
+                for start in range(0, len(indices), batch_size):
+                    chunk = indices[start:start + batch_size]
+                    write(
+                        ids=[ids[i] for i in chunk],
+                        embeddings=[embeddings[i] for i in chunk],
+                        metadatas=[metadatas[i] for i in chunk]
+                    )
+    
     def rebuild_from_posts(self):
         """Rebuild ChromaDB from existing posts.json"""
         try:
-            posts = load_posts()
+            posts = [
+                p for p in load_posts()
+                if post_version(p) == self.version and (self.post_filter is None or self.post_filter(p))
+            ]
             if not posts:
-                print("[INFO] No posts to add to ChromaDB")
+                print(f"[INFO] No {self.version} posts to add to ChromaDB")
                 return
             
-            print(f"[INFO] Rebuilding ChromaDB with {len(posts)} posts...")
+            print(f"[INFO] Rebuilding ChromaDB ({self.version}) with {len(posts)} posts...")
             
             ids = []
             embeddings = []
@@ -56,21 +250,15 @@ class ChromaManager:
                     
                     ids.append(f"post_{post_id}")
                     embeddings.append(embedding)
-                    metadatas.append({
-                        'num_images': len(post.get('images', [])),
-                        'post_id': post_id
-                    })
+                    metadatas.append(chroma_metadata(post))
                     
                 except Exception as e:
                     print(f"[WARN] Failed to process post {post_id}: {e}")
                     continue
             
             if ids:
-                self.collection.add(
-                    ids=ids,
-                    embeddings=embeddings,
-                    metadatas=metadatas
-                )
+                with metrics.span("chroma.rebuild"):
+                    self.add_embeddings(ids, embeddings, metadatas)
                 print(f"[INFO] Successfully added {len(ids)} posts to ChromaDB")
             else:
                 print("[WARN] No valid posts found to add to ChromaDB")
@@ -86,11 +274,9 @@ class ChromaManager:
             
             metadata['post_id'] = post_id
             
-            self.collection.add(
-                ids=[f"post_{post_id}"],
-                embeddings=[embedding.tolist()],
-                metadatas=[metadata]
-            )
+            self._sync_version()
+            with metrics.span("chroma.add"):
+                self.add_embeddings([f"post_{post_id}"], [embedding.tolist()], [metadata])
             print(f"[INFO] Added post {post_id} to ChromaDB")
             return True
         except Exception as e:
@@ -100,29 +286,146 @@ class ChromaManager:
     def delete_post(self, post_id: int):
         """Delete post from ChromaDB"""
         try:
-            self.collection.delete(ids=[f"post_{post_id}"])
+            self._sync_version()
+            with metrics.span("chroma.delete"):
+                self.delete_ids([f"post_{post_id}"])
             print(f"[INFO] Deleted post {post_id} from ChromaDB")
             return True
         except Exception as e:
             print(f"[ERROR] Failed to delete post {post_id} from ChromaDB: {e}")
             return False
     
-    def query_similar(self, query_embedding: np.ndarray, n_results: int = 100):
-        """Query similar posts using cosine similarity"""
+    def delete_ids(self, ids):
+        """Delete entries by id from the main collection and the region partitions"""
+        with self._writing():
+            for collection in [self.collection, *self.partitions.values()]:
+                collection.delete(ids=ids)
+    
+    def query_similar(self, query_embedding: np.ndarray, n_results: int = 100, include_embeddings: bool = False):
+        """Query similar posts using cosine similarity (distance = 1 - similarity)"""
         try:
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=n_results,
-                include=["distances", "metadatas"]
-            )
+            include = ["distances", "metadatas"]
+            if include_embeddings:
+                include.append("embeddings")
+            
+            self._sync_version()
+            with metrics.span("chroma.query"):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding.tolist()],
+                    n_results=n_results,
+                    include=include
+                )
             return results
         except Exception as e:
             print(f"[ERROR] ChromaDB query failed: {e}")
             return None
     
+    def query_range(self, query_embeddings, threshold: float = SIMILARITY_THRESHOLD,
+                    initial_k: int = RANGE_QUERY_INITIAL_K, max_k: int = RANGE_QUERY_MAX_K,
+                    include_embeddings: bool = False, filters=None):
+        """Find every post with similarity >= threshold for each query embedding.
+
+        k starts at initial_k and doubles for the queries whose farthest result
+        is still inside the threshold. Returns one dict per query with
+        post_ids, similarities (descending), optionally embeddings, and
+        truncated=True when max_k was reached before the threshold.
+        failed=True (and truncated=True) when Chroma raised for that query,
+        so its hits are incomplete rather than "no matches".
+        filters (see post_metadata.py) select the region partitions and the
+        where clause applied inside them.
+        """
+        results = [
+            {'post_ids': [], 'similarities': [], 'embeddings': [], 'truncated': False, 'failed': False}
+            for _ in query_embeddings
+        ]
+        if not results:
+            return results
+        
+        self._sync_version()
+        where = build_where(filters)
+        collections = self._collections(filters.get('regions') if filters else None)
+        include = ["distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        
+        searched = 0
+        for collection in collections:
+            count = collection.count()
+            if count == 0:
+                continue
+            searched += 1
+            part = self._range_query(
+                collection, count, query_embeddings, 1.0 - threshold, initial_k, max_k, include, where
+            )
+            for out, found in zip(results, part):
+                out['post_ids'].extend(found['post_ids'])
+                out['similarities'].extend(found['similarities'])
+                out['embeddings'].extend(found['embeddings'])
+                out['truncated'] = out['truncated'] or found['truncated']
+                out['failed'] = out['failed'] or found['failed']
+        
+        if searched > 1:
+            for out in results:
+                order = sorted(range(len(out['post_ids'])), key=lambda j: out['similarities'][j], reverse=True)
+                out['post_ids'] = [out['post_ids'][j] for j in order]
+                out['similarities'] = [out['similarities'][j] for j in order]
+                if include_embeddings:
+                    out['embeddings'] = [out['embeddings'][j] for j in order]
+        return results
+    
+    def _range_query(self, collection, count, query_embeddings, max_distance, initial_k, max_k, include, where):
+        """query_range on one collection"""
+        results = [
+            {'post_ids': [], 'similarities': [], 'embeddings': [], 'truncated': False, 'failed': False}
+            for _ in query_embeddings
+        ]
+        limit = min(max_k, count)
+        k = max(1, min(initial_k, limit))
+        pending = list(range(len(query_embeddings)))
+        include_embeddings = "embeddings" in include
+        
+        try:
+            while pending:
+                with metrics.span("chroma.query", filtered=where is not None):
+                    res = collection.query(
+                        query_embeddings=[np.asarray(query_embeddings[i], dtype=np.float32).tolist() for i in pending],
+                        n_results=k,
+                        where=where,
+                        include=include
+                    )
+                
+                widen = []
+                for row, qi in enumerate(pending):
+                    ids = res['ids'][row]
+                    distances = res['distances'][row]
+                    full = len(ids) >= k and len(distances) > 0 and distances[-1] <= max_distance
+                    
+                    if full and k < limit:
+                        widen.append(qi)
+                        continue
+                    
+                    keep = [j for j, d in enumerate(distances) if d <= max_distance]
+                    out = results[qi]
+                    out['post_ids'] = [int(ids[j].split('_')[1]) for j in keep]
+                    out['similarities'] = [1.0 - float(distances[j]) for j in keep]
+                    if include_embeddings:
+                        out['embeddings'] = [res['embeddings'][row][j] for j in keep]
+                    out['truncated'] = bool(full and limit < count)
+                
+                pending = widen
+                k = min(k * 2, limit)
+        except Exception as e:
+            print(f"[ERROR] ChromaDB range query failed: {e}")
+            for qi in pending:
+                results[qi]['truncated'] = True
+                results[qi]['failed'] = True
+        
+        return results
+    
     def get_count(self) -> int:
         """Get total number of posts in ChromaDB"""
         try:
+            self._sync_version()
             return self.collection.count()
         except:
             return 0
@@ -130,7 +433,8 @@ class ChromaManager:
     def get_all_ids(self):
         """Get all post IDs in ChromaDB for debugging"""
         try:
-            results = self.collection.get()
+            self._refresh()
+            results = self.collection.get(include=[])
             return results['ids'] if results and 'ids' in results else []
         except:
             return []
@@ -139,7 +443,7 @@ class ChromaManager:
         """Verify that ChromaDB embeddings match JSON embeddings"""
         try:
             posts = load_posts()
-            chroma_data = self.collection.get()
+            chroma_data = self.collection.get(include=["embeddings"])
             
             print(f"[VERIFY] JSON posts: {len(posts)}, ChromaDB posts: {len(chroma_data['ids'])}")
             
@@ -165,17 +469,26 @@ class ChromaManager:
         except Exception as e:
             print(f"[ERROR] Verification failed: {e}")
     
+    def drop(self):
+        """Delete the version's collection and all its region partitions"""
+        with self._writing():
+            for collection in [self.collection, *self.partitions.values()]:
+                self.client.delete_collection(collection.name)
+            self.partitions = {}
+    
+    def reset(self):
+        """Empty the index (drop and recreate the active version's collections)"""
+        with self._writing():
+            self.drop()
+            self._open_collection()
+    
     def force_rebuild(self):
-        """Force rebuild ChromaDB from scratch"""
+        """Force rebuild ChromaDB from scratch; other processes wait for it before they reload the index"""
         try:
-            self.client.delete_collection("face_embeddings")
-            
-            self.collection = self.client.get_or_create_collection(
-                name="face_embeddings", 
-                metadata={"hnsw:space": "cosine"}
-            )
-            
-            self.rebuild_from_posts()
+            with self._writing():
+                self.reset()
+                
+                self.rebuild_from_posts()
             print("[INFO] ChromaDB force rebuild completed")
             
         except Exception as e:
@@ -0,0 +1,130 @@
+# ============================================================================
+# Duplicate-Case Clusters - Union-Find over the Match Graph
+# ============================================================================
+#
+# Posts are nodes, matches at or above CLUSTER_LINK_THRESHOLD are edges, and a
+# cluster is a connected component: if 12 matches 48 and 48 matches 301, all
+# three are one case. Adding a post only unions its own matches; deleting one
+# reclusters from scratch, which is a single O(posts + matches) pass.
+#
+# A cluster is identified by its smallest post ID ("case 12").
+
+import threading
+from config import CLUSTER_LINK_THRESHOLD
+from utils import load_posts, posts_signature
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+        self.smallest = {}
+
+    def add(self, x):
+        if x not in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+            self.smallest[x] = x
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # path halving
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        self.add(a)
+        self.add(b)
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size.pop(rb)
+        self.smallest[ra] = min(self.smallest[ra], self.smallest.pop(rb))
+        return ra
+
+    def groups(self):
+        groups = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return groups
+
+
+class ClusterIndex:
+    def __init__(self, posts=(), link_threshold=CLUSTER_LINK_THRESHOLD):
+        self.link_threshold = link_threshold
+        self.signature = None
+        self.recluster(posts)
+
+    def recluster(self, posts):
+        self.uf = UnionFind()
+        self._groups = None
+        for post in posts:
+            self.add_post(post)
+
+    def add_post(self, post):
+        post_id = post['post_id']
+        self._groups = None
+        self.uf.add(post_id)
+        for m in post.get('matches', []):
+            if m.get('similarity', 0) >= self.link_threshold:
+                self.uf.union(post_id, m['post_id'])
+
+    def cluster_id(self, post_id):
+        if post_id not in self.uf.parent:
+            return None
+        return self.uf.smallest[self.uf.find(post_id)]
+
+    def cluster_size(self, post_id):
+        if post_id not in self.uf.parent:
+            return 0
+        return self.uf.size[self.uf.find(post_id)]
+
+    def _sorted_groups(self):
+        if self._groups is None:
+            self._groups = {root: sorted(g) for root, g in self.uf.groups().items()}
+        return self._groups
+
+    def members(self, post_id):
+        if post_id not in self.uf.parent:
+            return []
+        return self._sorted_groups()[self.uf.find(post_id)]
+
+    def clusters(self, min_size=2):
+        """Sorted member lists, largest cluster first"""
+        groups = [g for g in self._sorted_groups().values() if len(g) >= min_size]
+        return sorted(groups, key=lambda g: (-len(g), g[0]))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_cluster_index():
+    """Shared index, rebuilt when posts.json was changed by someone else"""
+    global _index
+    with _index_lock:
+        signature = posts_signature()
+        if _index is None or _index.signature != signature:
+            _index = ClusterIndex(load_posts())
+            _index.signature = signature
+        return _index
+
+
+def note_post_added(post):
+    """Call after saving posts.json with a new post (and its matches)"""
+    with _index_lock:
+        if _index is not None:
+            _index.add_post(post)
+            _index.signature = posts_signature()
+
+
+def note_posts_changed(posts):
+    """Call after saving posts.json with posts removed or matches rewritten"""
+    with _index_lock:
+        if _index is not None:
+            _index.recluster(posts)
+            _index.signature = posts_signature()
@@ -14,22 +14,148 @@ else:
     # إذا شغال كـ Python
     BASE_DIR = Path(__file__).parent
 
-# Directories
-KNOWN_DIR = BASE_DIR / "posts"
+# Directories (FINDME_DATA_DIR points the app at another data set, e.g. for benchmarks)
+DATA_DIR = Path(os.environ.get("FINDME_DATA_DIR", BASE_DIR))
+
+KNOWN_DIR = DATA_DIR / "posts"
 KNOWN_DIR.mkdir(parents=True, exist_ok=True)
 
-POSTS_JSON = BASE_DIR / "posts.json"
+POSTS_JSON = DATA_DIR / "posts.json"
+
+# Held by whichever process (GUI, service, reembed.py, snapshot.py) is changing
+# posts.json, the image refs, the perceptual-hash index or the chip store
+STORE_LOCK_PATH = DATA_DIR / "store.lock"
+
+# Content-addressed image store (one file per unique image, shared by posts)
+OBJECTS_DIR = KNOWN_DIR / "objects"
+IMAGE_REFS_JSON = DATA_DIR / "image_refs.json"
+
+# Perceptual-hash index of stored images (64-bit pHash, Hamming distance)
+PHASH_INDEX_PATH = DATA_DIR / "phash_index.npz"
+PHASH_DUPLICATE_DISTANCE = 10   # flag "already exists in post X"
+PHASH_REUSE_DISTANCE = 4        # reuse the cached embedding instead of running the model
+
+# Aligned face chips (CHIP_SIZE x CHIP_SIZE BGR) kept for recognition-only re-embedding
+CHIP_STORE_DIR = DATA_DIR / "chips"
+CHIP_SIZE = 112
+
+CHROMA_DIR = DATA_DIR / "chroma_db"
+
+# Face model. Every embedding is tagged with the version that produced it;
+# active_model.json (written by reembed.py promote) overrides the default.
+FACE_MODEL_NAME = "buffalo_l"
+ACTIVE_MODEL_JSON = DATA_DIR / "active_model.json"
+REEMBED_DIR = DATA_DIR / "reembed"
+REEMBED_BATCH_SIZE = 64
+
+# Faces are detected on a copy of each image scaled to at most this many pixels
+# per side, then aligned from the full-resolution image (0 = detect on the full
+# image). The buffalo_l detector works at 640x640, so larger values buy nothing.
+FACE_DETECT_MAX_SIDE = 640
+
+# Aligned face crops embedded per recognition model call. Faces of several
+# images (a multi-image post, a folder search batch) are gathered first, so one
+# ONNX Runtime call replaces one call per face. Larger batches pay off with
+# more CPU cores; measure with benchmark_recognition.py.
+RECOGNITION_BATCH_SIZE = 8
+
+# Face inference runs in this many worker processes (0 = inside the calling process)
+INFERENCE_WORKERS = int(os.environ.get("FINDME_INFERENCE_WORKERS", "2"))
 
 # Thresholds
 SIMILARITY_THRESHOLD = 0.20
 OUTLIER_HIGH_THRESHOLD = 0.85
 OUTLIER_LOW_THRESHOLD = 0.25
 
+# Duplicate-case clusters: posts linked by a match at or above this similarity
+# share a cluster (raise it above SIMILARITY_THRESHOLD to limit chaining)
+CLUSTER_LINK_THRESHOLD = SIMILARITY_THRESHOLD
+
+# Search
+SEARCH_RESULTS_LIMIT = 100
+# Recent search results (search_cache.py), dropped whenever posts change
+SEARCH_CACHE_SIZE = 128
+SEARCH_CACHE_QUANT_LEVELS = 256     # unit embedding components are rounded to 1/256 for the cache key
+# Recompute each Chroma similarity from the stored vector and warn on mismatch
+VERIFY_CHROMA_SIMILARITY = False
+
+# Range queries start with RANGE_QUERY_INITIAL_K neighbours and double k until
+# the farthest one falls below SIMILARITY_THRESHOLD or RANGE_QUERY_MAX_K is hit
+RANGE_QUERY_INITIAL_K = 32
+RANGE_QUERY_MAX_K = 10000
+
+# Sharded index (sharded_index.py): with more than one shard, posts are spread
+# over CHROMA_SHARDS Chroma stores by post_id hash, each served by its own
+# process; queries go to all shards in parallel and the results are merged.
+CHROMA_SHARDS = int(os.environ.get("FINDME_CHROMA_SHARDS", "1"))
+CHROMA_SHARD_DIR = DATA_DIR / "chroma_shards"
+
+# Binary snapshots (snapshot.py): id of the last snapshot imported or exported here
+SNAPSHOT_STATE_JSON = DATA_DIR / "snapshot_state.json"
+
+# HNSW index (ChromaDB)
+# M and construction_ef only take effect when the collection is created
+# (use force_rebuild after changing them); search_ef is applied on startup.
+HNSW_M = 16
+HNSW_CONSTRUCTION_EF = 100
+HNSW_SEARCH_EF = 100
+
+# Post metadata (post_metadata.py)
+SEX_VALUES = ("F", "M", "U")
+AGE_BANDS = ("0-12", "13-17", "18-29", "30-44", "45-64", "65+")
+
+# Face quality (face_quality.py): a multi-image post is embedded as the
+# quality-weighted mean of its faces; faces scoring below KEEP_RATIO of the
+# best one are left out
+FACE_QUALITY_FULL_SIZE = 112        # face box side (px) that gets the full size score
+FACE_QUALITY_SHARP_VAR = 150.0      # Laplacian variance of the chip that counts as sharp
+FACE_QUALITY_MAX_YAW = 0.6          # nose offset / eye distance at which the pose score reaches 0
+FACE_QUALITY_MAX_PITCH = 0.35       # nose height offset (eyes->mouth) at which the pose score reaches 0
+FACE_QUALITY_KEEP_RATIO = 0.5
+
 # Settings
 MAX_IMAGES = 5
 AUTO_REFRESH_MS = 3000
 
+# Image display
+THUMBNAIL_SIZE = (100, 75)
+VIEWER_MAX_SIDE = 2560
+VIEWER_PREVIEW_DIVISOR = 8
+# Decoded pixmaps shared by all widgets (LRU, evicted above this many bytes)
+PIXMAP_CACHE_BYTES = 256 * 1024 * 1024
+
+# Video scanning (video_scan.py)
+VIDEO_SAMPLE_FPS = 5.0              # frames per second of footage that are examined
+VIDEO_FRAME_DIFF_THRESHOLD = 3.0    # largest per-cell mean abs difference (0-255) of a repeated frame
+VIDEO_MIN_DET_SCORE = 0.5
+VIDEO_TRACK_IOU = 0.3               # box overlap that continues a track
+VIDEO_TRACK_MAX_GAP_S = 1.5         # a track ends after this long without a detection
+VIDEO_TRACK_MIN_HITS = 3            # embed a track after this many detections (or when it ends)
+VIDEO_EMBED_BATCH = 16
+
+# Batch folder search (batch_search.py)
+BATCH_SEARCH_TOP_K = 5              # matches reported per image
+BATCH_SEARCH_DECODE_THREADS = 2
+BATCH_SEARCH_QUEUE_SIZE = 32        # images buffered between pipeline stages
+BATCH_SEARCH_EMBED_BATCH = 8        # images handed to the inference workers together
+
+# Headless service (service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_BATCH_MAX = 32
+SERVICE_BATCH_WAIT_MS = 10
+SERVICE_MAX_LIMIT = 1000            # largest "limit" a search request may ask for
+
+# Metrics (timing spans and counters; FINDME_METRICS=1 turns them on)
+METRICS_ENABLED = os.environ.get("FINDME_METRICS", "0") == "1"
+METRICS_DIR = DATA_DIR / "metrics"
+METRICS_RECENT_OPS = 200
+METRICS_JSONL_MAX_BYTES = 5 * 1024 * 1024
+METRICS_JSONL_BACKUPS = 3
+METRICS_PROM_INTERVAL_S = 5.0
+
 print(f"[CONFIG] Running as EXE: {getattr(sys, 'frozen', False)}")
 print(f"[CONFIG] Base directory: {BASE_DIR}")
+print(f"[CONFIG] Data directory: {DATA_DIR}")
 print(f"[CONFIG] SIMILARITY_THRESHOLD = {SIMILARITY_THRESHOLD}")
 print(f"[CONFIG] AUTO_REFRESH_MS = {AUTO_REFRESH_MS}")
\ No newline at end of file
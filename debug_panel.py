@@ -0,0 +1,109 @@
+# ============================================================================
+# Debug Panel - Recent Operations and Stage Timings
+# ============================================================================
+
+from datetime import datetime
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QCheckBox, QListWidget, QPushButton
+)
+from PyQt5.QtCore import QTimer
+import metrics
+import search_cache
+from ui import pixmap_cache
+from config import METRICS_RECENT_OPS
+
+REFRESH_MS = 1000
+
+
+class DebugPanel(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Debug - Timings")
+        self.setStyleSheet("background-color: #1C1E21; color: white;")
+
+        layout = QVBoxLayout()
+
+        top_layout = QHBoxLayout()
+        self.enabled_box = QCheckBox("Collect metrics")
+        self.enabled_box.setChecked(metrics.is_enabled())
+        self.enabled_box.toggled.connect(metrics.enable)
+
+        self.reset_btn = QPushButton("Reset")
+        self.reset_btn.setStyleSheet("background-color: #e74c3c; color: white; font-weight: bold;")
+        self.reset_btn.clicked.connect(self.reset)
+
+        self.export_btn = QPushButton("Write Prometheus file")
+        self.export_btn.setStyleSheet("background-color: #365899; color: white; font-weight: bold;")
+        self.export_btn.clicked.connect(lambda: metrics.write_prometheus())
+
+        top_layout.addWidget(self.enabled_box)
+        top_layout.addStretch()
+        top_layout.addWidget(self.reset_btn)
+        top_layout.addWidget(self.export_btn)
+
+        ops_label = QLabel(f"Last {METRICS_RECENT_OPS} operations (newest first)")
+        ops_label.setStyleSheet("font-weight: bold; color: white;")
+        self.ops_list = QListWidget()
+        self.ops_list.setStyleSheet("background-color: #242526; color: white; font-family: monospace;")
+
+        self.cache_label = QLabel()
+        self.cache_label.setStyleSheet("color: #ADD8E6;")
+
+        totals_label = QLabel("Stage totals")
+        totals_label.setStyleSheet("font-weight: bold; color: white;")
+        self.totals_list = QListWidget()
+        self.totals_list.setStyleSheet("background-color: #242526; color: #ADD8E6; font-family: monospace;")
+
+        layout.addLayout(top_layout)
+        layout.addWidget(ops_label)
+        layout.addWidget(self.ops_list, 2)
+        layout.addWidget(self.cache_label)
+        layout.addWidget(totals_label)
+        layout.addWidget(self.totals_list, 1)
+        self.setLayout(layout)
+        self.resize(900, 600)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(REFRESH_MS)
+        self.refresh()
+
+    def refresh(self):
+        ops = metrics.recent_operations()
+        self.ops_list.clear()
+        for op in reversed(ops):
+            when = datetime.fromtimestamp(op['ts']).strftime("%H:%M:%S")
+            stages = sorted(op.get('stages', {}).items(), key=lambda x: x[1]['ms'], reverse=True)
+            breakdown = ", ".join(
+                f"{name} {s['ms']:.1f}ms" + (f" x{s['count']}" if s['count'] > 1 else "")
+                for name, s in stages
+            )
+            line = f"{when}  {op['name']:<18} {op['duration_ms']:>10.1f}ms"
+            if op.get('labels'):
+                line += "  " + " ".join(f"{k}={v}" for k, v in op['labels'].items())
+            if op.get('error'):
+                line += f"  ERROR {op['error']}"
+            if breakdown:
+                line += f"\n    {breakdown}"
+            self.ops_list.addItem(line)
+
+        self.cache_label.setText(pixmap_cache.describe() + "\n" + search_cache.describe())
+
+        snap = metrics.snapshot()
+        self.totals_list.clear()
+        for name, stats in sorted(snap['spans'].items(), key=lambda x: x[1]['sum'], reverse=True):
+            mean_ms = stats['sum'] * 1000.0 / stats['count'] if stats['count'] else 0.0
+            self.totals_list.addItem(
+                f"{name:<26} n={stats['count']:<7} total={stats['sum'] * 1000.0:>10.1f}ms "
+                f"mean={mean_ms:>8.2f}ms max={stats['max'] * 1000.0:>8.2f}ms"
+            )
+        for name, value in sorted(snap['counters'].items()):
+            self.totals_list.addItem(f"{name:<26} count={value}")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        super().closeEvent(event)
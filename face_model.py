@@ -1,56 +1,292 @@
 # ============================================================================
-# Face Model - Direct Database Comparison
+# Face Model - Image and Post Embeddings
 # ============================================================================
 
 import cv2
 import numpy as np
 import threading
-from insightface.app import FaceAnalysis
+from concurrent.futures import Future
+import metrics
+from config import CHIP_SIZE, INFERENCE_WORKERS, FACE_DETECT_MAX_SIDE, RECOGNITION_BATCH_SIZE
+from model_version import get_active_model
+from phash_index import get_phash_index, image_phash
 from utils import load_posts, cosine_similarity
 
 _face_app = None
+_face_app_model = None
 _face_app_lock = threading.Lock()
 
 
+def load_face_app(model_name):
+    """New FaceAnalysis for model_name (CUDA, then CPU), or None"""
+    # Imported here: insightface takes most of a second to import and the GUI
+    # and service processes only need it when inference runs in-process
+    from insightface.app import FaceAnalysis
+
+    try:
+        print(f"[INFO] Preparing face model {model_name} with CUDA...")
+        app = FaceAnalysis(name=model_name, providers=['CUDAExecutionProvider'])
+        app.prepare(ctx_id=0)
+        print("[INFO] Model ready (CUDA).")
+        return app
+    except Exception as e_cuda:
+        print(f"[WARN] CUDA failed: {e_cuda}. Trying CPU...")
+
+    try:
+        app = FaceAnalysis(name=model_name, providers=['CPUExecutionProvider'])
+        app.prepare(ctx_id=0)
+        print("[INFO] Model ready (CPU).")
+        return app
+    except Exception as e_cpu:
+        print(f"[ERROR] Failed to prepare face model: {e_cpu}")
+        return None
+
+
 def get_face_app():
-    global _face_app
+    """Shared model of the active embedding version (reloaded after a promote)"""
+    global _face_app, _face_app_model
+    model_name = get_active_model()['model']
     with _face_app_lock:
-        if _face_app is not None:
+        # _face_app_model is None when a model was injected directly (benchmarks)
+        if _face_app is not None and _face_app_model in (None, model_name):
             return _face_app
 
-        try:
-            print("[INFO] Preparing face model with CUDA...")
-            _face_app = FaceAnalysis(name='buffalo_l', providers=['CUDAExecutionProvider'])
-            _face_app.prepare(ctx_id=0)
-            print("[INFO] Model ready (CUDA).")
-            return _face_app
-        except Exception as e_cuda:
-            print(f"[WARN] CUDA failed: {e_cuda}. Trying CPU...")
+        if _face_app is not None:
+            print(f"[INFO] Active face model changed to {model_name}")
+        _face_app = load_face_app(model_name)
+        _face_app_model = model_name
+        return _face_app
 
-        try:
-            _face_app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-            _face_app.prepare(ctx_id=0)
-            print("[INFO] Model ready (CPU).")
-            return _face_app
-        except Exception as e_cpu:
-            print(f"[ERROR] Failed to prepare face model: {e_cpu}")
-            _face_app = None
-            return None
 
+def extract_face_chip(image, face):
+    """{'chip', 'bbox', 'kps', 'det_score'} for a detected face: the aligned crop the recognition model embeds"""
+    kps = getattr(face, 'kps', None)
+    if kps is None:
+        return {}
+    try:
+        from insightface.utils import face_align
+        chip = face_align.norm_crop(image, landmark=np.asarray(kps, dtype=np.float32), image_size=CHIP_SIZE)
+        return {
+            'chip': chip,
+            'bbox': np.asarray(face.bbox, dtype=np.float32),
+            'kps': np.asarray(kps, dtype=np.float32),
+            'det_score': float(getattr(face, 'det_score', 1.0))
+        }
+    except Exception as e:
+        print(f"[WARN] Could not align face chip: {e}")
+        return {}
+
+
+def detect_faces(app, image, max_side=FACE_DETECT_MAX_SIDE, max_faces=1):
+    """Detected faces (bbox, kps, det_score; no embedding yet) in full-image coordinates.
+
+    Detection runs on a copy scaled down to max_side and the box and
+    landmarks are scaled back. max_faces=0 keeps every face.
+    """
+    from insightface.app.common import Face
+
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width)) if max_side > 0 else 1.0
+    with metrics.span("face.detect", scaled=scale < 1.0):
+        # Linear, as the detector resizes its input itself: INTER_AREA costs
+        # ~10x more on a 12 MP photo and the detector would not see the difference
+        work = image if scale >= 1.0 else cv2.resize(
+            image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_LINEAR
+        )
+        bboxes, kpss = app.det_model.detect(work, max_num=0, metric='default')
+
+    count = bboxes.shape[0] if max_faces <= 0 else min(max_faces, bboxes.shape[0])
+    return [
+        Face(bbox=bboxes[i, :4] / scale, kps=None if kpss is None else kpss[i] / scale, det_score=bboxes[i, 4])
+        for i in range(count)
+    ]
 
-def get_face_embedding_from_image(image):
+
+def detect_and_embed_batch(app, images, max_side=FACE_DETECT_MAX_SIDE, max_faces=1,
+                           batch_size=RECOGNITION_BATCH_SIZE):
+    """faces[i][j] = face j of images[i], with an embedding, like app.get per image.
+
+    All images are detected first, then the aligned crops of every face are
+    embedded together, batch_size per recognition call, instead of one call
+    per face. Only the recognition model runs (not the landmark/attribute
+    models FaceAnalysis also loads). max_faces=1 keeps the first face, which
+    is all the app uses; 0 keeps every face. An app without a separate
+    detector falls back to app.get.
+    """
+    if not hasattr(app, 'det_model') or 'recognition' not in getattr(app, 'models', {}):
+        return [list(app.get(image))[:max_faces or None] for image in images]
+    from insightface.utils import face_align
+
+    recognizer = app.models['recognition']
+    found = [[f for f in detect_faces(app, image, max_side, max_faces) if f.kps is not None] for image in images]
+    pairs, chips = [], []
+    for i, faces in enumerate(found):
+        for j, face in enumerate(faces):
+            pairs.append((i, j))
+            chips.append(face_align.norm_crop(images[i], landmark=face.kps, image_size=recognizer.input_size[0]))
+
+    for (i, j), embedding in zip(pairs, embed_chips(chips, app, batch_size)):
+        found[i][j].embedding = embedding
+    return found
+
+
+def detect_and_embed(app, image, max_side=FACE_DETECT_MAX_SIDE):
+    """[face] with an embedding, like app.get(image) for the first face.
+
+    The face is detected on a copy scaled down to max_side and aligned and
+    embedded from the full-resolution image (see detect_and_embed_batch).
+    max_side=0 detects on the full image.
+    """
+    return detect_and_embed_batch(app, [image], max_side)[0]
+
+
+def embed_locally_batch(images, want_face=False):
+    """[(embedding or None, face dict or None)] for the first face of each image, computed in this process"""
     app = get_face_app()
     if app is None:
-        return None
+        return [(None, None)] * len(images)
 
     try:
-        faces = app.get(image)
+        with metrics.span("face.detect_embed", images=len(images)):
+            found = detect_and_embed_batch(app, images)
+    except Exception as e:
+        if len(images) == 1:
+            print(f"[ERROR] Embedding extraction failed: {e}")
+            return [(None, None)]
+        print(f"[WARN] Batched embedding failed ({e}), embedding images one at a time")
+        return [embed_locally_batch([image], want_face)[0] for image in images]
+
+    results = []
+    for image, faces in zip(images, found):
         if len(faces) == 0:
-            return None
-        return np.array(faces[0].embedding, dtype=np.float32)
+            metrics.incr("face.no_face")
+            results.append((None, {} if want_face else None))
+            continue
+        face = extract_face_chip(image, faces[0]) if want_face else None
+        results.append((np.array(faces[0].embedding, dtype=np.float32), face))
+    return results
+
+
+def embed_locally(image, face_info=None):
+    """Embedding of the first detected face, computed in this process"""
+    emb, face = embed_locally_batch([image], face_info is not None)[0]
+    if face_info is not None and face:
+        face_info.update(face)
+    return emb
+
+
+def _use_workers():
+    # A model injected directly (benchmarks, tests) runs in-process
+    injected = _face_app is not None and _face_app_model is None
+    return INFERENCE_WORKERS > 0 and not injected
+
+
+def start_inference():
+    """Start the worker processes early so the model is loaded before the first request"""
+    if _use_workers():
+        from inference_worker import get_inference_pool
+        get_inference_pool()
+
+
+def inference_ready():
+    if _use_workers():
+        from inference_worker import get_inference_pool
+        return get_inference_pool().is_ready()
+    return get_face_app() is not None
+
+
+def submit_face_embeddings(images, want_face=False):
+    """Futures of (embedding or None, face dict or None), one per image, embedded as batches;
+    runs on the inference workers if enabled"""
+    if _use_workers():
+        from inference_worker import get_inference_pool
+        return get_inference_pool().submit_many(images, want_face)
+
+    futures = [Future() for _ in images]
+    for future, result in zip(futures, embed_locally_batch(images, want_face) if futures else []):
+        future.set_result(result)
+    return futures
+
+
+def submit_face_embedding(image, want_face=False):
+    """Future of (embedding or None, face dict or None) for one image"""
+    return submit_face_embeddings([image], want_face)[0]
+
+
+def _wait_embedding(future, face_info=None):
+    try:
+        with metrics.span("face.wait"):
+            emb, face = future.result()
     except Exception as e:
         print(f"[ERROR] Embedding extraction failed: {e}")
         return None
+    if face_info is not None and face:
+        face_info.update(face)
+    return emb
+
+
+def get_face_embedding_from_image(image, face_info=None):
+    """Embedding of the first detected face; its aligned chip goes into face_info if given"""
+    return _wait_embedding(submit_face_embedding(image, face_info is not None), face_info)
+
+
+def embed_chips(chips, app=None, batch_size=RECOGNITION_BATCH_SIZE):
+    """Recognition only: (N, 512) embeddings for aligned chips, batch_size chips per model call"""
+    if app is None:
+        app = get_face_app()
+    if app is None or len(chips) == 0:
+        return np.zeros((0, 512), dtype=np.float32)
+
+    recognizer = app.models['recognition']
+    # Models exported with a fixed batch dimension take exactly that many chips per call
+    fixed = getattr(recognizer, 'input_shape', [None])[0]
+    step = fixed if isinstance(fixed, int) and fixed > 0 else max(1, int(batch_size))
+
+    parts = []
+    with metrics.span("face.embed_chips", chips=len(chips), calls=-(-len(chips) // step)):
+        for start in range(0, len(chips), step):
+            batch = list(chips[start:start + step])
+            count = len(batch)
+            if step == fixed and count < step:
+                batch += [batch[-1]] * (step - count)
+            feats = np.asarray(recognizer.get_feat(batch), dtype=np.float32)
+            parts.append(feats.reshape(len(batch), -1)[:count])
+    return np.concatenate(parts)
+
+
+def _cached_embedding(phash):
+    cached = get_phash_index().cached_embedding(phash, version=get_active_model()['version'])
+    if cached is not None:
+        metrics.incr("face.embedding_reused")
+        print("[INFO] Near-duplicate of a stored image, reusing its embedding")
+    return cached
+
+
+def get_face_embedding_cached(image, face_info=None):
+    """(embedding, phash): reuses the stored embedding of a near-identical image"""
+    return get_face_embeddings_cached([image], None if face_info is None else [face_info])[0]
+
+
+def get_face_embeddings_cached(images, face_infos=None):
+    """[(embedding, phash)] for several images; the uncached ones are embedded as one batch"""
+    jobs, uncached = [], []
+    for i, image in enumerate(images):
+        phash = image_phash(image)
+        cached = _cached_embedding(phash)
+        jobs.append((cached, phash, None))
+        if cached is None:
+            uncached.append(i)
+
+    futures = submit_face_embeddings([images[i] for i in uncached], face_infos is not None) if uncached else []
+    for i, future in zip(uncached, futures):
+        jobs[i] = (None, jobs[i][1], future)
+
+    results = []
+    for i, (emb, phash, future) in enumerate(jobs):
+        if future is not None:
+            emb = _wait_embedding(future, face_infos[i] if face_infos is not None else None)
+        results.append((emb, phash))
+    return results
 
 
 def compare_embedding_with_posts(embedding: np.ndarray) -> float:
@@ -61,14 +297,15 @@ def compare_embedding_with_posts(embedding: np.ndarray) -> float:
             return 0.0
 
         max_similarity = 0.0
-        for post in posts:
-            try:
-                post_emb = np.array(post['embedding'], dtype=np.float32)
-                sim = cosine_similarity(embedding, post_emb)
-                if sim > max_similarity:
-                    max_similarity = sim
-            except Exception:
-                continue
+        with metrics.span("face.compare_database"):
+            for post in posts:
+                try:
+                    post_emb = np.array(post['embedding'], dtype=np.float32)
+                    sim = cosine_similarity(embedding, post_emb)
+                    if sim > max_similarity:
+                        max_similarity = sim
+                except Exception:
+                    continue
 
         return float(max_similarity)
     except Exception as e:
@@ -76,21 +313,38 @@ def compare_embedding_with_posts(embedding: np.ndarray) -> float:
         return 0.0
 
 
-def images_to_embedding_list(image_paths, index_manager=None):
+def images_to_embedding_list(image_paths, index_manager=None, image_info=None):
+    """Post embedding for image_paths: the quality-weighted mean of their faces
+    (see face_quality.py). If image_info is a list, one
+    {'path', 'phash', 'embedding', 'face', 'quality'} dict per readable image is appended to it."""
 
-    from config import SIMILARITY_THRESHOLD
+    from face_quality import face_quality, fuse_embeddings
 
-    embeddings = []
-    for i, p in enumerate(image_paths):
-        img = cv2.imread(p)
+    paths, images = [], []
+    for p in image_paths:
+        with metrics.span("image.decode"):
+            img = cv2.imread(p)
         if img is None:
             print(f"[WARN] Could not read image: {p}")
             continue
+        paths.append(p)
+        images.append(img)
 
-        emb = get_face_embedding_from_image(img)
+    faces = [{} for _ in images]
+    embeddings, qualities = [], []
+    for i, (p, (emb, phash)) in enumerate(zip(paths, get_face_embeddings_cached(images, faces))):
+        scored = face_quality(faces[i]) if emb is not None else None
+        if image_info is not None:
+            image_info.append({'path': p, 'phash': phash, 'embedding': emb, 'face': faces[i],
+                               'quality': scored[0] if scored else None})
         if emb is not None:
             embeddings.append(emb)
-            print(f"[INFO] Extracted embedding {i+1}/{len(image_paths)}")
+            qualities.append(scored[0] if scored else None)
+            if scored:
+                details = ", ".join(f"{k} {v:.2f}" for k, v in scored[1].items())
+                print(f"[INFO] Extracted embedding {i+1}/{len(image_paths)}: quality {scored[0]:.2f} ({details})")
+            else:
+                print(f"[INFO] Extracted embedding {i+1}/{len(image_paths)} (reused, quality unknown)")
 
     if not embeddings:
         print("[ERROR] No embeddings extracted!")
@@ -100,34 +354,8 @@ def images_to_embedding_list(image_paths, index_manager=None):
         print("[INFO] Single image, using directly")
         return embeddings[0]
 
-    try:
-        posts = load_posts()
-        if posts and len(posts) > 0:
-            print(f"[INFO] Comparing {len(embeddings)} images with {len(posts)} posts...")
-
-            candidates = []
-            for i, emb in enumerate(embeddings):
-                max_sim = compare_embedding_with_posts(emb)
-                candidates.append((i, emb, max_sim))
-                print(f"  Image {i+1}: max database similarity = {max_sim:.4f}")
-
-            candidates.sort(key=lambda x: x[2], reverse=True)
-
-            best_idx, best_emb, best_sim = candidates[0]
-
-            if best_sim >= SIMILARITY_THRESHOLD:
-                print(f"[INFO] Selected image {best_idx+1} with similarity {best_sim:.4f}")
-                return best_emb
-            else:
-                print(f"[INFO] All images < {SIMILARITY_THRESHOLD}, using mean of all")
-                return np.mean(np.stack(embeddings), axis=0).astype(np.float32)
-        else:
-            print("[INFO] No posts in database, using mean of all embeddings")
-            return np.mean(np.stack(embeddings), axis=0).astype(np.float32)
-
-    except Exception as e:
-        print(f"[ERROR] Failed to process embeddings: {e}")
-        import traceback
-        traceback.print_exc()
-        print("[INFO] Falling back to simple mean")
-        return np.mean(np.stack(embeddings), axis=0).astype(np.float32)
+    with metrics.span("face.fuse", images=len(embeddings)):
+        fused, weights = fuse_embeddings(embeddings, qualities)
+    used = int((weights > 0).sum())
+    print(f"[INFO] Post embedding from {used} of {len(embeddings)} faces, weighted by quality")
+    return fused
@@ -0,0 +1,93 @@
+# ============================================================================
+# Face Quality - Scoring Detected Faces for Post Embeddings
+# ============================================================================
+#
+# Scores a face from what detection already returned (the face dict of
+# face_model.extract_face_chip: det_score, bbox, 5 landmarks, aligned chip):
+#
+#   detection  det_score of the detector
+#   size       shorter side of the box, relative to FACE_QUALITY_FULL_SIZE
+#   pose       head turn (yaw) and tilt (pitch) estimated from the landmarks
+#   sharpness  variance of the Laplacian of the aligned chip
+#
+# Each term is in [0, 1] and the quality is their product. A multi-image post
+# is embedded as the quality-weighted mean of its faces, so the cost does not
+# depend on the size of the database.
+
+import cv2
+import numpy as np
+from config import (
+    FACE_QUALITY_FULL_SIZE, FACE_QUALITY_SHARP_VAR, FACE_QUALITY_MAX_YAW,
+    FACE_QUALITY_MAX_PITCH, FACE_QUALITY_KEEP_RATIO
+)
+
+# Nose height between the eyes and the mouth of a frontal face (ArcFace template)
+_FRONTAL_PITCH = 0.5
+
+
+def size_score(bbox):
+    width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    return float(np.clip(min(width, height) / FACE_QUALITY_FULL_SIZE, 0.0, 1.0))
+
+
+def pose_angles(kps):
+    """(yaw, pitch) offsets from frontal: 0 for a frontal face, larger when turned/tilted"""
+    kps = np.asarray(kps, dtype=np.float32)
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    mouth = (kps[3] + kps[4]) / 2
+    eyes = (left_eye + right_eye) / 2
+
+    # Undo roll so yaw and pitch are measured along the face's own axes
+    dx, dy = right_eye - left_eye
+    eye_dist = float(np.hypot(dx, dy))
+    if eye_dist < 1e-6:
+        return 1.0, 1.0
+    cos, sin = dx / eye_dist, dy / eye_dist
+    to_face = np.array([[cos, sin], [-sin, cos]], dtype=np.float32)
+    nose_off = to_face @ (nose - eyes)
+    mouth_off = to_face @ (mouth - eyes)
+
+    yaw = abs(float(nose_off[0])) / eye_dist
+    pitch = abs(float(nose_off[1]) / float(mouth_off[1]) - _FRONTAL_PITCH) if mouth_off[1] > 1e-6 else 1.0
+    return yaw, pitch
+
+
+def pose_score(kps):
+    yaw, pitch = pose_angles(kps)
+    return float(max(0.0, 1 - yaw / FACE_QUALITY_MAX_YAW) * max(0.0, 1 - pitch / FACE_QUALITY_MAX_PITCH))
+
+
+def sharpness_score(chip):
+    gray = cv2.cvtColor(chip, cv2.COLOR_BGR2GRAY) if chip.ndim == 3 else chip
+    variance = cv2.Laplacian(gray, cv2.CV_64F).var()
+    return float(min(1.0, variance / FACE_QUALITY_SHARP_VAR))
+
+
+def face_quality(face):
+    """Quality in [0, 1] of a face dict, with its parts; None if the face dict is empty"""
+    if not face or face.get('kps') is None:
+        return None
+    parts = {
+        'detection': float(face.get('det_score', 1.0)),
+        'size': size_score(face['bbox']) if face.get('bbox') is not None else 1.0,
+        'pose': pose_score(face['kps']),
+        'sharpness': sharpness_score(face['chip']) if face.get('chip') is not None else 1.0,
+    }
+    return float(np.prod(list(parts.values()))), parts
+
+
+def fuse_embeddings(embeddings, qualities):
+    """Quality-weighted mean of unit embeddings; faces well below the best are left out.
+
+    qualities may contain None (no face data, e.g. a reused embedding); those
+    count as the median of the known qualities.
+    """
+    known = [q for q in qualities if q is not None]
+    default = float(np.median(known)) if known else 1.0
+    weights = np.array([default if q is None else q for q in qualities], dtype=np.float32)
+    if weights.max() <= 0:
+        weights = np.ones_like(weights)
+    weights[weights < FACE_QUALITY_KEEP_RATIO * weights.max()] = 0
+
+    units = np.stack([e / (np.linalg.norm(e) or 1.0) for e in embeddings]).astype(np.float32)
+    return (weights @ units / weights.sum()).astype(np.float32), weights
@@ -2,24 +2,27 @@
 # Feed Widget 
 # ============================================================================
 
-import shutil
-import cv2
-import numpy as np
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
-    QLineEdit, QListWidget, QListWidgetItem, QMessageBox, QFrame, QDialog, QScrollArea
+    QLineEdit, QListWidget, QListWidgetItem, QMessageBox, QFrame, QDialog, QScrollArea, QCheckBox
 )
 from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QPixmap, QImage
-from config import KNOWN_DIR, AUTO_REFRESH_MS, SIMILARITY_THRESHOLD
-from utils import load_posts, save_posts, cosine_similarity
+import metrics
+from ui.image_loader import load_thumbnail
+from config import AUTO_REFRESH_MS
+from utils import load_posts
+import post_store
+from clusters import get_cluster_index
+from post_metadata import describe_metadata
 from ui.image_viewer import ImageViewer
 
 class FeedWidget(QWidget):
-    def __init__(self, chroma_manager=None):
+    def __init__(self, chroma_manager=None, load_now=True):
+        """load_now=False leaves the first refresh to the caller (e.g. after the window is shown)"""
         super().__init__()
         self.chroma_manager = chroma_manager
+        self.index_error = None  # set by the main window if the index failed to open
         self.setWindowTitle("Feed")
         self.setStyleSheet("background-color: #1C1E21; color: white;")
 
@@ -34,8 +37,13 @@ class FeedWidget(QWidget):
         self.search_btn.setStyleSheet("background-color: #f39c12; color: white; font-weight: bold;")
         self.search_btn.clicked.connect(self.search_by_id)
 
+        self.group_checkbox = QCheckBox("Group by case")
+        self.group_checkbox.setStyleSheet("color: white;")
+        self.group_checkbox.toggled.connect(self.refresh)
+
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_btn)
+        search_layout.addWidget(self.group_checkbox)
         self.layout.addLayout(search_layout)
 
         self.list_widget = QListWidget()
@@ -50,21 +58,28 @@ class FeedWidget(QWidget):
         self.timer.timeout.connect(self.refresh)
         self.timer.start(AUTO_REFRESH_MS)
 
-        self.refresh()
+        if load_now:
+            self.refresh()
 
     def refresh(self):
         
         if not hasattr(self, "list_widget") or self.list_widget is None:
             return
     
+        with metrics.span("feed.refresh"):
+            self._refresh()
+
+    def _refresh(self):
         scroll_bar = self.list_widget.verticalScrollBar()
         current_scroll = scroll_bar.value() if scroll_bar else 0
     
         posts = load_posts()
+        cluster_index = get_cluster_index()
         self.list_widget.clear()
     
-        for p in sorted(posts, key=lambda x: x.get("post_id", 0), reverse=True):
-            widget = self._create_post_card(p)
+        for p in self._ordered_posts(posts, cluster_index):
+            with metrics.span("feed.render_card"):
+                widget = self._create_post_card(p, cluster_index)
             item = QListWidgetItem()
             item.setSizeHint(widget.sizeHint())
             try:
@@ -77,7 +92,28 @@ class FeedWidget(QWidget):
             QTimer.singleShot(0, lambda: scroll_bar.setValue(current_scroll))
 
 
-    def _create_post_card(self, post):
+    def _ordered_posts(self, posts, cluster_index):
+        posts = sorted(posts, key=lambda x: x.get("post_id", 0), reverse=True)
+        if not self.group_checkbox.isChecked():
+            return posts
+
+        # Each case is placed where its newest post would be
+        groups = {}
+        for p in posts:
+            case_id = cluster_index.cluster_id(p["post_id"])
+            groups.setdefault(p["post_id"] if case_id is None else case_id, []).append(p)
+        return [p for group in groups.values() for p in group]
+
+    def _case_label(self, post_id, cluster_index):
+        members = cluster_index.members(post_id)
+        if len(members) < 2:
+            return None
+        label = QLabel(f"Case {members[0]} · {len(members)} posts: {', '.join(str(m) for m in members)}")
+        label.setStyleSheet("color: #f39c12; font-weight: bold;")
+        label.setWordWrap(True)
+        return label
+
+    def _create_post_card(self, post, cluster_index=None):
         frame = QFrame()
         frame.setStyleSheet("background-color: #1C1E21; border: 1px solid #4E4F50; border-radius: 5px;")
         layout = QVBoxLayout()
@@ -86,6 +122,16 @@ class FeedWidget(QWidget):
         id_label.setStyleSheet("font-weight: bold; font-size: 16px; color: white;")
         layout.addWidget(id_label)
 
+        details = describe_metadata(post.get('metadata'))
+        if details:
+            details_label = QLabel(details)
+            details_label.setStyleSheet("color: #B0B3B8;")
+            layout.addWidget(details_label)
+
+        case_label = self._case_label(post['post_id'], cluster_index or get_cluster_index())
+        if case_label is not None:
+            layout.addWidget(case_label)
+
         if post.get("images"):
             images_scroll = QScrollArea()
             images_scroll.setWidgetResizable(True)
@@ -102,14 +148,10 @@ class FeedWidget(QWidget):
             for img_path in post["images"]:
                 try:
                     if Path(img_path).exists():
-                        img = cv2.imread(img_path)
-                        if img is None:
+                        with metrics.span("image.decode"):
+                            pix = load_thumbnail(img_path)
+                        if pix.isNull():
                             continue
-                        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                        h, w, ch = img.shape
-                        bytes_per_line = ch * w
-                        qimg = QImage(img.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                        pix = QPixmap.fromImage(qimg).scaled(100, 75, Qt.KeepAspectRatio)
                         lbl = QLabel()
                         lbl.setPixmap(pix)
                         lbl.setCursor(Qt.PointingHandCursor)
@@ -186,6 +228,10 @@ class FeedWidget(QWidget):
         id_label.setStyleSheet("font-weight: bold; font-size: 16px; color: white;")
         frame_layout.addWidget(id_label)
 
+        case_label = self._case_label(post['post_id'], get_cluster_index())
+        if case_label is not None:
+            frame_layout.addWidget(case_label)
+
         if post.get("images"):
             images_scroll = QScrollArea()
             images_scroll.setWidgetResizable(True)
@@ -198,7 +244,7 @@ class FeedWidget(QWidget):
 
             for img_path in post["images"]:
                 if Path(img_path).exists():
-                    pix = QPixmap(img_path).scaled(100, 75, Qt.KeepAspectRatio)
+                    pix = load_thumbnail(img_path)
                     lbl = QLabel()
                     lbl.setPixmap(pix)
                     lbl.setCursor(Qt.PointingHandCursor)
@@ -253,6 +299,15 @@ class FeedWidget(QWidget):
         dialog.accept()
 
     def delete_post(self, post_id):
+        if self.chroma_manager is None:
+            if self.index_error:
+                QMessageBox.critical(self, "Index Unavailable",
+                                     f"The search index could not be opened ({self.index_error}), so posts "
+                                     f"cannot be deleted. Restart the app to try again.")
+            else:
+                QMessageBox.warning(self, "Index Not Ready", "Search index is still loading. Please wait...")
+            return
+
         confirm = QMessageBox.question(
             self, "Confirm Delete", f"Delete post ID {post_id}?",
             QMessageBox.Yes | QMessageBox.No
@@ -261,89 +316,9 @@ class FeedWidget(QWidget):
         if confirm != QMessageBox.Yes:
             return
 
-        posts = load_posts()
-        posts = [p for p in posts if p["post_id"] != post_id]
-
-        # Remove from ChromaDB
-        if self.chroma_manager is not None:
-            try:
-                self.chroma_manager.delete_post(post_id)
-                print(f"[INFO] Deleted post {post_id} from ChromaDB")
-            except Exception as e:
-                print(f"[ERROR] Failed to delete from ChromaDB: {e}")
-
-        folder = KNOWN_DIR / str(post_id)
-        if folder.exists():
-            try:
-                shutil.rmtree(folder)
-            except Exception as e:
-                print(f"[WARN] failed to remove folder: {e}")
-
-        self._recompute_all_matches(posts)
-
-        save_posts(posts)
+        post_store.delete_post(post_id, self.chroma_manager)
         self.refresh()
         QMessageBox.information(self, "Deleted", f"Post {post_id} deleted.")
 
     def _recompute_all_matches(self, posts):
-        if self.chroma_manager is not None and self.chroma_manager.get_count() > 0:
-            print("[INFO] Using ChromaDB for matching...")
-            post_dict = {p['post_id']: p for p in posts}
-            
-            for p1 in posts:
-                try:
-                    emb1 = np.array(p1["embedding"], dtype=np.float32)
-
-                    results = self.chroma_manager.query_similar(emb1, n_results=100)
-
-                    matches = []
-                    if results and results.get('ids') and len(results['ids'][0]) > 0:
-                        for i, post_id_str in enumerate(results['ids'][0]):
-                            post_id = int(post_id_str.split('_')[1])
-
-                            if post_id == p1['post_id']:
-                                continue
-
-                            emb2 = np.array(post_dict[post_id]['embedding'], dtype=np.float32)
-                            similarity = cosine_similarity(emb1, emb2)  # نفس الحساب القديم بالضبط
-
-                            if similarity >= SIMILARITY_THRESHOLD:
-                                matches.append({
-                                    "post_id": post_id,
-                                    "similarity": round(float(similarity), 4)
-                                })
-
-                    p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
-                    print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
-
-                except Exception as e:
-                    print(f"[ERROR] Failed to compute matches for post {p1.get('post_id')}: {e}")
-                    p1["matches"] = []
-        else:
-            print("[INFO] Using cosine similarity (no ChromaDB)...")
-            for i, p1 in enumerate(posts):
-                matches = []
-                try:
-                    emb1 = np.array(p1["embedding"], dtype=np.float32)
-                except Exception:
-                    p1["matches"] = []
-                    continue
-
-                for j, p2 in enumerate(posts):
-                    if i == j:
-                        continue
-
-                    try:
-                        emb2 = np.array(p2["embedding"], dtype=np.float32)
-                    except Exception:
-                        continue
-
-                    sim = cosine_similarity(emb1, emb2)
-                    if sim >= SIMILARITY_THRESHOLD:
-                        matches.append({
-                            "post_id": p2["post_id"],
-                            "similarity": round(float(sim), 4)
-                        })
-
-                p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
-                print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
\ No newline at end of file
+        post_store.recompute_matches(posts, self.chroma_manager)
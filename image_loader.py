@@ -0,0 +1,104 @@
+# ============================================================================
+# Image Loader - Reduced-Resolution Decoding for Display
+# ============================================================================
+#
+# QImageReader.setScaledSize lets the JPEG decoder scale in the DCT domain, so a
+# 12 MP photo drawn as a 100x75 thumbnail is decoded at a fraction of its size
+# instead of being fully decoded and then scaled down. Pixmaps are shared
+# through the process-wide cache in pixmap_cache.py.
+
+import os
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QImageReader, QPixmap, QImageIOHandler
+from config import THUMBNAIL_SIZE
+from ui.pixmap_cache import get_pixmap_cache
+
+
+def _open_reader(image_path):
+    reader = QImageReader(str(image_path))
+    reader.setAutoTransform(True)
+    return reader
+
+
+def _stored_box(reader, max_width, max_height):
+    """Target box in stored (pre-rotation) orientation"""
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        return max_height, max_width
+    return max_width, max_height
+
+
+def fit_size(width, height, max_width, max_height):
+    """Largest size with the same aspect ratio that fits the box (never upscales)"""
+    if width <= 0 or height <= 0:
+        return QSize()
+    scale = min(max_width / width, max_height / height, 1.0)
+    return QSize(max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def image_size(image_path):
+    """Pixel size from the file header, without decoding"""
+    reader = _open_reader(image_path)
+    size = reader.size()
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size = size.transposed()
+    return size
+
+
+def load_qimage(image_path, max_width, max_height):
+    """Decode at the smallest scale that still fills the box; null QImage on failure"""
+    reader = _open_reader(image_path)
+    size = reader.size()
+    if size.isValid():
+        box_w, box_h = _stored_box(reader, max_width, max_height)
+        target = fit_size(size.width(), size.height(), box_w, box_h)
+        if target.width() < size.width():
+            reader.setScaledSize(target)
+
+    img = reader.read()
+    if img.isNull():
+        print(f"[WARN] Could not read {image_path}: {reader.errorString()}")
+    return img
+
+
+def _cache_key(image_path, max_width, max_height):
+    try:
+        mtime = os.stat(image_path).st_mtime_ns
+    except OSError:
+        return None
+    return (str(image_path), int(max_width), int(max_height), mtime)
+
+
+def cached_pixmap(image_path, max_width, max_height):
+    """Pixmap already in the cache for this box, or None (never decodes)"""
+    key = _cache_key(image_path, max_width, max_height)
+    return None if key is None else get_pixmap_cache().get(key, count_miss=False)
+
+
+def load_pixmap(image_path, max_width=None, max_height=None):
+    """Pixmap fitting the box, from the shared cache when this size was decoded before"""
+    if max_width is None or max_height is None:
+        max_width, max_height = THUMBNAIL_SIZE
+    key = _cache_key(image_path, max_width, max_height)
+    if key is None:
+        return QPixmap()
+
+    cache = get_pixmap_cache()
+    pix = cache.get(key)
+    if pix is not None:
+        return pix
+
+    img = load_qimage(image_path, max_width, max_height)
+    if img.isNull():
+        return QPixmap()
+    pix = QPixmap.fromImage(img)
+    cache.put(key, pix)
+    return pix
+
+
+def load_thumbnail(image_path):
+    return load_pixmap(image_path, *THUMBNAIL_SIZE)
+
+
+def scaled_to(pixmap, max_width, max_height):
+    """Stretch a low-resolution preview to the size the full image will have"""
+    return pixmap.scaled(max_width, max_height, Qt.KeepAspectRatio, Qt.FastTransformation)
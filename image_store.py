@@ -0,0 +1,225 @@
+# ============================================================================
+# Image Store - Content-Addressed Storage with Reference Counting
+# ============================================================================
+#
+# Images are stored once under OBJECTS_DIR/<sha256[:2]>/<sha256><ext> with a
+# plain byte copy. image_refs.json counts how many post images point at each
+# object; an object is deleted when its count drops to zero.
+#
+# Usage:
+#   python image_store.py migrate   # move the legacy per-post folders into the store
+
+import json
+import os
+import shutil
+import sys
+import hashlib
+from pathlib import Path
+from config import KNOWN_DIR, OBJECTS_DIR, IMAGE_REFS_JSON
+from store_lock import get_store_lock
+
+CHUNK_SIZE = 1024 * 1024
+_EXT_ALIASES = {'.jpeg': '.jpg'}
+
+
+class ImageRefsError(RuntimeError):
+    pass
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _normalized_ext(path):
+    ext = Path(path).suffix.lower()
+    return _EXT_ALIASES.get(ext, ext)
+
+
+def object_path(digest, ext):
+    return OBJECTS_DIR / digest[:2] / (digest + ext)
+
+
+def _object_key(path):
+    """Refcount key of a stored image, or None if the path is outside the store"""
+    try:
+        return Path(path).resolve().relative_to(OBJECTS_DIR.resolve()).as_posix()
+    except (ValueError, OSError):
+        return None
+
+
+def is_stored(path):
+    return _object_key(path) is not None
+
+
+def _load_refs():
+    """Reference counts by object key; raises ImageRefsError if image_refs.json is unreadable.
+
+    Saving over an unreadable file would drop every other count and let the
+    next release delete images other posts still use.
+    """
+    if not IMAGE_REFS_JSON.exists():
+        return {}
+    try:
+        with open(IMAGE_REFS_JSON, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        raise ImageRefsError(
+            f"Could not read image refs, run 'python image_store.py migrate' to rebuild them from posts.json: {e}"
+        ) from e
+
+
+def _save_refs(refs):
+    tmp_path = f"{IMAGE_REFS_JSON}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(refs, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, IMAGE_REFS_JSON)
+
+
+def _copy_into_store(src, digest):
+    dst = object_path(digest, _normalized_ext(src))
+    if not dst.exists():
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dst.with_name(dst.name + ".tmp")
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    return dst
+
+
+def add_image(src):
+    """Store src (if its content is new) and take a reference; returns the stored path"""
+    digest = file_sha256(src)
+    with get_store_lock():
+        refs = _load_refs()
+        dst = _copy_into_store(src, digest)
+        key = _object_key(dst)
+        refs[key] = refs.get(key, 0) + 1
+        _save_refs(refs)
+    return str(dst)
+
+
+def release_images(paths):
+    """Drop one reference per path and delete objects nobody references.
+
+    An object with no count is left on disk: its references are unknown
+    until 'python image_store.py migrate' recounts them from posts.json.
+    """
+    removed = 0
+    with get_store_lock():
+        refs = _load_refs()
+        for path in paths:
+            key = _object_key(path)
+            if key is None:
+                continue
+
+            if key not in refs:
+                print(f"[WARN] No reference count for {path}, keeping it; "
+                      f"run 'python image_store.py migrate' to rebuild the counts")
+                continue
+
+            count = refs[key] - 1
+            if count > 0:
+                refs[key] = count
+                continue
+
+            refs.pop(key, None)
+            try:
+                Path(path).unlink(missing_ok=True)
+                removed += 1
+            except Exception as e:
+                print(f"[WARN] Failed to remove image {path}: {e}")
+        _save_refs(refs)
+    return removed
+
+
+def rebuild_refs(posts):
+    """Recount references from the posts (the source of truth)"""
+    refs = {}
+    for post in posts:
+        for path in post.get('images', []):
+            key = _object_key(path)
+            if key is not None:
+                refs[key] = refs.get(key, 0) + 1
+    with get_store_lock():
+        _save_refs(refs)
+    return refs
+
+
+def migrate_known_dir():
+    """Move every post image into the content-addressed store, deduplicating identical files.
+
+    Images are copied into the store and posts.json is saved before any
+    original is deleted, so an interrupted migration never leaves posts
+    pointing at missing files; running it again finishes the job.
+    """
+    from utils import load_posts, save_posts
+
+    with get_store_lock():
+        posts = load_posts(strict=True)
+        # Objects left by an interrupted run exist but are not referenced yet
+        try:
+            known = set(_load_refs())
+        except ImageRefsError as e:
+            print(f"[WARN] {e}")
+            known = set()  # recounted from posts.json below
+        moved = 0
+        duplicates = 0
+        bytes_saved = 0
+        migrated = {}
+
+        for post in posts:
+            new_paths = []
+            for path in post.get('images', []):
+                if path in migrated:
+                    new_paths.append(migrated[path])
+                    continue
+
+                p = Path(path)
+                if is_stored(p) or not p.exists():
+                    new_paths.append(path)
+                    continue
+
+                dst = _copy_into_store(p, file_sha256(p))
+                if _object_key(dst) in known:
+                    duplicates += 1
+                    bytes_saved += p.stat().st_size
+                else:
+                    moved += 1
+                    known.add(_object_key(dst))
+                migrated[path] = str(dst)
+                new_paths.append(migrated[path])
+            post['images'] = new_paths
+
+        save_posts(posts)
+        refs = rebuild_refs(posts)
+
+        legacy_folders = set()
+        for path in migrated:
+            p = Path(path)
+            legacy_folders.add(p.parent)
+            try:
+                p.unlink(missing_ok=True)
+            except Exception as e:
+                print(f"[WARN] Could not remove migrated image {p}: {e}")
+
+    for folder in legacy_folders:
+        try:
+            if folder != OBJECTS_DIR and folder.parent == KNOWN_DIR and not any(folder.iterdir()):
+                folder.rmdir()
+        except Exception as e:
+            print(f"[WARN] Could not remove folder {folder}: {e}")
+
+    print(f"[INFO] Migration done: {moved} images moved, {duplicates} duplicates removed "
+          f"({bytes_saved / (1024 * 1024):.1f} MB saved), {len(refs)} unique images stored")
+    return {'moved': moved, 'duplicates': duplicates, 'bytes_saved': bytes_saved, 'unique': len(refs)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        print("[INFO] Close the admin app before migrating.")
+        migrate_known_dir()
+    else:
+        print("Usage: python image_store.py migrate")
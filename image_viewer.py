@@ -3,8 +3,9 @@
 # ============================================================================
 
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QScrollArea
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import Qt, QTimer
+from config import VIEWER_MAX_SIDE, VIEWER_PREVIEW_DIVISOR
+from ui.image_loader import image_size, fit_size, load_pixmap, cached_pixmap, scaled_to
 
 
 class ImageViewer(QDialog):
@@ -13,18 +14,40 @@ class ImageViewer(QDialog):
         self.setWindowTitle("Image Viewer")
         self.setModal(True)
         self.setStyleSheet("background-color: #1C1E21;")
-        
+        self.image_path = image_path
+
         layout = QVBoxLayout()
-        
+
         scroll = QScrollArea()
-        lbl = QLabel()
-        pix = QPixmap(image_path)
-        lbl.setPixmap(pix)
-        lbl.setAlignment(Qt.AlignCenter)
-        
-        scroll.setWidget(lbl)
+        self.lbl = QLabel()
+        self.lbl.setAlignment(Qt.AlignCenter)
+
+        # Never hold more than VIEWER_MAX_SIDE x VIEWER_MAX_SIDE pixels per image
+        size = image_size(image_path)
+        self.target = fit_size(size.width(), size.height(), VIEWER_MAX_SIDE, VIEWER_MAX_SIDE)
+
+        full = cached_pixmap(image_path, self.target.width(), self.target.height()) if self.target.isValid() else None
+        if full is not None:
+            self.lbl.setPixmap(full)
+        elif self.target.isValid():
+            # Fast low-resolution preview first, the sharp version once the dialog is up
+            preview = load_pixmap(
+                image_path,
+                max(1, self.target.width() // VIEWER_PREVIEW_DIVISOR),
+                max(1, self.target.height() // VIEWER_PREVIEW_DIVISOR)
+            )
+            if not preview.isNull():
+                self.lbl.setPixmap(scaled_to(preview, self.target.width(), self.target.height()))
+            QTimer.singleShot(0, self._refine)
+
+        scroll.setWidget(self.lbl)
         scroll.setWidgetResizable(True)
-        
+
         layout.addWidget(scroll)
         self.setLayout(layout)
         self.resize(800, 600)
+
+    def _refine(self):
+        pix = load_pixmap(self.image_path, self.target.width(), self.target.height())
+        if not pix.isNull():
+            self.lbl.setPixmap(pix)
@@ -0,0 +1,293 @@
+# ============================================================================
+# Inference Worker Pool - Face Model in Separate Processes
+# ============================================================================
+#
+# INFERENCE_WORKERS processes each own a FaceAnalysis instance, so detection
+# and recognition neither hold the GUI's GIL nor take the app down if native
+# code crashes. Decoded images travel through shared memory: the client copies
+# the pixels into a SharedMemory block per image and only its name, shape and
+# dtype go through the queue. Results (a 512-float embedding and the 112x112
+# chip) are small enough to pickle.
+#
+# submit_many() returns a concurrent.futures.Future per image and queues the
+# images on the least busy workers in jobs of up to RECOGNITION_BATCH_SIZE,
+# each embedded with one batched recognition call. A monitor thread restarts
+# dead workers and retries the jobs they were holding once, one image per
+# job, so a single image that crashes the model does not fail its batch.
+
+import itertools
+import multiprocessing as mp
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+from config import INFERENCE_WORKERS, RECOGNITION_BATCH_SIZE
+
+MAX_ATTEMPTS = 2
+MAX_STARTUP_CRASHES = 3
+MONITOR_INTERVAL_S = 0.5
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _worker_main(worker_id, model_name, jobs, results, running):
+    import face_model
+
+    app = face_model.load_face_app(model_name)
+    results.put(('ready', worker_id, app is not None))
+    if app is None:
+        return
+    face_model._face_app = app
+    face_model._face_app_model = model_name
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, specs, want_face = job
+        running.value = job_id
+        try:
+            images = []
+            for shm_name, shape, dtype in specs:
+                # Spawned workers share the client's resource tracker; the client unlinks
+                shm = shared_memory.SharedMemory(name=shm_name)
+                try:
+                    images.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy())
+                finally:
+                    shm.close()
+            results.put(('done', worker_id, job_id, face_model.embed_locally_batch(images, want_face), None))
+        except Exception as e:
+            results.put(('done', worker_id, job_id, None, str(e)))
+        running.value = -1
+
+
+class InferencePool:
+    def __init__(self, workers=INFERENCE_WORKERS, model_name=None):
+        from model_version import get_active_model
+
+        self.ctx = mp.get_context('spawn')
+        self.size = max(1, int(workers))
+        self.model_name = model_name or get_active_model()['model']
+        self.results = self.ctx.Queue()
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.pending = {}     # job_id -> [futures, shms, job, attempts], one future and shm per image
+        self.assigned = {}    # worker_id -> set of job_ids
+        self.ready = {}       # worker_id -> bool once the model is loaded (or failed)
+        self.startup_crashes = {}
+        self.workers = {}
+        self.queues = {}
+        self.running = {}     # worker_id -> shared job_id the worker is processing (-1 when idle)
+        self.closed = False
+
+        for worker_id in range(self.size):
+            self._start_worker(worker_id)
+
+        threading.Thread(target=self._collect, name="inference-results", daemon=True).start()
+        threading.Thread(target=self._monitor, name="inference-monitor", daemon=True).start()
+        print(f"[INFO] Started {self.size} inference workers ({self.model_name})")
+
+    def _start_worker(self, worker_id):
+        # A fresh queue per worker: one killed mid-read may leave its queue unusable
+        jobs = self.ctx.Queue()
+        # Shared memory rather than a message, so it survives a crash mid-job
+        running = self.ctx.Value('q', -1, lock=False)
+        proc = self.ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.model_name, jobs, self.results, running),
+            name=f"inference-{worker_id}",
+            daemon=True
+        )
+        proc.start()
+        self.queues[worker_id] = jobs
+        self.running[worker_id] = running
+        self.workers[worker_id] = proc
+        self.assigned.setdefault(worker_id, set())
+
+    def is_ready(self):
+        return any(self.ready.values())
+
+    def has_failed(self):
+        return len(self.ready) == self.size and not any(self.ready.values())
+
+    def _dispatch(self, job_id):
+        """Queue a pending job on the least busy usable worker (call with self.lock held)"""
+        usable = [w for w in self.workers if self.ready.get(w) is not False]
+        if not usable:
+            return False
+        worker_id = min(usable, key=lambda w: len(self.assigned[w]))
+        self.assigned[worker_id].add(job_id)
+        self.queues[worker_id].put(self.pending[job_id][2])
+        return True
+
+    def submit(self, image, want_face=False):
+        """Future of (embedding or None, face dict or None) for a decoded BGR image"""
+        return self.submit_many([image], want_face)[0]
+
+    def submit_many(self, images, want_face=False):
+        """One future per image; the images are split into jobs across the workers"""
+        futures = [Future() for _ in images]
+        if self.has_failed():
+            for future in futures:
+                future.set_exception(RuntimeError("face model could not be loaded in any inference worker"))
+            return futures
+
+        per_job = max(1, min(RECOGNITION_BATCH_SIZE, -(-len(images) // self.size)))
+        for start in range(0, len(images), per_job):
+            self._submit_job(images[start:start + per_job], futures[start:start + per_job], want_face)
+        return futures
+
+    def _submit_job(self, images, futures, want_face):
+        shms, specs = [], []
+        for image in images:
+            image = np.ascontiguousarray(image)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            shms.append(shm)
+            specs.append((shm.name, image.shape, image.dtype.str))
+
+        job_id = next(self.ids)
+        with self.lock:
+            self.pending[job_id] = [futures, shms, (job_id, specs, want_face), 1]
+            dispatched = self._dispatch(job_id)
+        if not dispatched:
+            self._finish(job_id, error="no inference worker available")
+
+    def _split(self, job_id):
+        """Replace a multi-image pending job by one job per image (call with self.lock held)"""
+        futures, shms, (_, specs, want_face), attempts = self.pending[job_id]
+        if len(futures) == 1:
+            return [job_id]
+        del self.pending[job_id]
+        job_ids = []
+        for future, shm, spec in zip(futures, shms, specs):
+            new_id = next(self.ids)
+            self.pending[new_id] = [[future], [shm], (new_id, [spec], want_face), attempts]
+            job_ids.append(new_id)
+        return job_ids
+
+    def _finish(self, job_id, results=None, error=None):
+        with self.lock:
+            entry = self.pending.pop(job_id, None)
+        if entry is None:
+            return
+        futures, shms = entry[0], entry[1]
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+        if error is None and (results is None or len(results) != len(futures)):
+            error = "inference worker returned an incomplete batch"
+        for i, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(results[i])
+
+    def _collect(self):
+        while True:
+            try:
+                msg = self.results.get()
+            except (EOFError, OSError):
+                return
+            kind, worker_id = msg[0], msg[1]
+            if kind == 'ready':
+                self.ready[worker_id] = msg[2]
+                self.startup_crashes[worker_id] = 0
+                if not msg[2]:
+                    print(f"[ERROR] Inference worker {worker_id} could not load the face model")
+                    self._fail_worker_jobs(worker_id, "face model could not be loaded")
+            elif kind == 'done':
+                _, _, job_id, outputs, error = msg
+                with self.lock:
+                    self.assigned[worker_id].discard(job_id)
+                self._finish(job_id, outputs, error)
+
+    def _fail_worker_jobs(self, worker_id, reason, crashed_job=None):
+        """Move a worker's unfinished jobs elsewhere, one image per job, or fail them after MAX_ATTEMPTS.
+
+        Only crashed_job (the one the worker was running) uses up an attempt;
+        without it, every job does.
+        """
+        failed = []
+        with self.lock:
+            job_ids = self.assigned[worker_id]
+            self.assigned[worker_id] = set()
+            for job_id in job_ids:
+                entry = self.pending.get(job_id)
+                if entry is None:
+                    continue
+                if crashed_job is None or job_id == crashed_job:
+                    entry[3] += 1
+                if entry[3] > MAX_ATTEMPTS:
+                    failed.append(job_id)
+                    continue
+                for part in self._split(job_id):
+                    if not self._dispatch(part):
+                        failed.append(part)
+        for job_id in failed:
+            self._finish(job_id, error=reason)
+
+    def _monitor(self):
+        while not self.closed:
+            time.sleep(MONITOR_INTERVAL_S)
+            for worker_id, proc in list(self.workers.items()):
+                if proc.is_alive() or self.closed:
+                    continue
+                if self.ready.get(worker_id) is False:
+                    continue  # model failed to load; restarting would not help
+
+                reason = f"inference worker crashed (exit code {proc.exitcode})"
+                if worker_id not in self.ready:
+                    crashes = self.startup_crashes.get(worker_id, 0) + 1
+                    self.startup_crashes[worker_id] = crashes
+                    if crashes >= MAX_STARTUP_CRASHES:
+                        print(f"[ERROR] Inference worker {worker_id} crashed {crashes} times while starting, giving up")
+                        self.ready[worker_id] = False
+                        self._fail_worker_jobs(worker_id, reason)
+                        continue
+
+                print(f"[WARN] Inference worker {worker_id} exited with code {proc.exitcode}, restarting")
+                crashed_job = self.running[worker_id].value
+                self.ready.pop(worker_id, None)
+                with self.lock:
+                    self._start_worker(worker_id)
+                self._fail_worker_jobs(worker_id, reason, crashed_job if crashed_job >= 0 else None)
+
+    def shutdown(self):
+        self.closed = True
+        for jobs in self.queues.values():
+            jobs.put(None)
+        for proc in self.workers.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        with self.lock:
+            job_ids = list(self.pending)
+        for job_id in job_ids:
+            self._finish(job_id, error="inference pool shut down")
+
+
+def get_inference_pool():
+    """Shared pool, restarted when a new face model has been promoted"""
+    global _pool
+    from model_version import get_active_model
+
+    model_name = get_active_model()['model']
+    with _pool_lock:
+        if _pool is not None and _pool.model_name != model_name:
+            print(f"[INFO] Active face model changed to {model_name}, restarting inference workers")
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            _pool = InferencePool(model_name=model_name)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
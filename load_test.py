@@ -0,0 +1,340 @@
+# ============================================================================
+# Load Test - Concurrent Adds, Deletes and Searches (headless)
+# ============================================================================
+#
+# Usage:
+#   python load_test.py
+#   python load_test.py --threads 4 --ops 200 --mix add=1 delete=1 search=6
+#   python load_test.py --processes 2 --threads 2 --initial 2000 --json load.json
+#
+# Builds a synthetic database in a temporary data directory, then replays a
+# random mix of operations from several threads (and optionally several
+# processes) through the real post_store, index and search code, with the
+# face model replaced by one that returns a random embedding per image.
+#
+# Each worker adds posts with its own ids and deletes only posts it owns, so
+# the final set of posts is known exactly. After the run the report gives
+# ops/sec and latency percentiles per operation, plus consistency violations:
+#
+#   lost_add          an add that returned but whose post is not in posts.json
+#   undead_delete     a delete that returned True but whose post is still there
+#   unexpected_post   a post in posts.json that no worker should have left
+#   duplicate_post    a post_id stored more than once
+#   missing_in_index  a post in posts.json without a vector in the index
+#   orphan_in_index   a vector in the index without a post in posts.json
+#   missed_search     a search with a post's own stored embedding that did not
+#                     return the post, though it was still in posts.json
+#
+# Search hits on posts that posts.json does not contain (yet, or any more)
+# are counted as stale hits: expected while an add or delete is between the
+# index update and the save, so not a violation.
+# The exit code is 1 if there are violations.
+
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime
+from pathlib import Path
+
+# Spawned worker processes inherit the environment, so they share the directory
+_DATA_DIR = os.environ.get("FINDME_LOADTEST_DIR") or tempfile.mkdtemp(prefix="findme_load_")
+os.environ["FINDME_LOADTEST_DIR"] = _DATA_DIR
+os.environ["FINDME_DATA_DIR"] = _DATA_DIR
+os.environ["FINDME_INFERENCE_WORKERS"] = "0"
+
+sys.path.append(str(Path(__file__).parent))
+
+import numpy as np
+
+OPERATIONS = ('add', 'delete', 'search')
+FIRST_NEW_ID = 1_000_000
+
+
+class FakeFaceApp:
+    """Stands in for FaceAnalysis: one face with a random unit embedding per image"""
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+    def get(self, image):
+        with self.lock:
+            emb = self.rng.standard_normal(512).astype(np.float32)
+        emb /= np.linalg.norm(emb)
+        return [types.SimpleNamespace(embedding=emb)]
+
+
+def parse_mix(items):
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS or not weight:
+            raise argparse.ArgumentTypeError(f"bad --mix entry '{item}', expected e.g. search=4")
+        mix[name] = float(weight)
+    return mix
+
+
+def build_database(size, seed):
+    from benchmark_chroma import synthetic_embeddings
+    from utils import save_posts
+
+    embeddings = synthetic_embeddings(size, np.random.default_rng(seed))
+    save_posts([
+        {"post_id": i + 1, "images": [], "embedding": embeddings[i].tolist(), "matches": []}
+        for i in range(size)
+    ])
+
+
+def run_worker(worker, workers, args, index, incoming):
+    """Run one worker's operations; returns its records and the ids it added/deleted"""
+    import cv2
+    import post_store
+    from config import SIMILARITY_THRESHOLD
+    from matching import rank_search_hits
+    from search_cache import cached_search
+    from store_lock import get_store_lock
+    from utils import get_posts_by_ids, load_posts_index
+
+    rng = np.random.default_rng(args.seed * 1000 + worker)
+    owned = [post_id for post_id in range(1, args.initial + 1) if post_id % workers == worker]
+    next_id = FIRST_NEW_ID + worker
+    names = list(args.mix)
+    weights = np.array([args.mix[n] for n in names], dtype=np.float64)
+    weights /= weights.sum()
+
+    records, added, deleted, missed = [], [], [], []
+    stale_hits = 0
+    for _ in range(args.ops):
+        op = names[rng.choice(len(names), p=weights)]
+        if op == 'delete' and not owned:
+            op = 'add'
+        start = time.perf_counter()
+        error = None
+        try:
+            if op == 'add':
+                path = Path(incoming) / f"w{worker}_{next_id}.jpg"
+                cv2.imwrite(str(path), rng.integers(0, 256, size=(96, 96, 3), dtype=np.uint8))
+                start = time.perf_counter()
+                post_store.add_post(next_id, [str(path)], index)
+                added.append(next_id)
+                owned.append(next_id)
+                next_id += workers
+            elif op == 'delete':
+                post_id = owned.pop(rng.integers(len(owned)))
+                if post_store.delete_post(post_id, index):
+                    deleted.append(post_id)
+            else:
+                posts = load_posts_index()
+                if posts:
+                    # New posts half the time: they are the ones another process may not see
+                    new_ids = [post_id for post_id in posts if post_id >= FIRST_NEW_ID]
+                    ids = new_ids if new_ids and rng.random() < 0.5 else list(posts)
+                    target = posts[ids[rng.integers(len(ids))]]
+                    query = np.asarray(target['embedding'], dtype=np.float32)
+
+                    def search():
+                        result = index.query_range([query])[0]
+                        return rank_search_hits([query], [result], verify=False), not result['truncated']
+
+                    ranked, _ = cached_search([query], SIMILARITY_THRESHOLD, None, search)
+                    found = get_posts_by_ids([post_id for post_id, _, _ in ranked])
+                    stale_hits += sum(1 for post_id, _, _ in ranked if post_id not in found)
+                    if target['post_id'] not in {post_id for post_id, _, _ in ranked}:
+                        # A delete holds the lock from the index update to the save,
+                        # so a post still in posts.json now was in the index during the search
+                        with get_store_lock():
+                            if target['post_id'] in load_posts_index():
+                                missed.append(target['post_id'])
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        records.append((op, time.perf_counter() - start, error))
+    return {'records': records, 'added': added, 'deleted': deleted, 'missed': missed, 'stale_hits': stale_hits}
+
+
+def run_threads(process, args, workers):
+    """Start args.threads workers in this process; returns their combined results"""
+    import face_model
+    from sharded_index import open_index
+
+    face_model._face_app = FakeFaceApp(seed=args.seed + process)
+    incoming = Path(_DATA_DIR) / "incoming"
+    incoming.mkdir(parents=True, exist_ok=True)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        index = open_index()
+        results = [None] * args.threads
+        threads = []
+
+        def run(slot):
+            results[slot] = run_worker(process * args.threads + slot, workers, args, index, incoming)
+
+        for slot in range(args.threads):
+            threads.append(threading.Thread(target=run, args=(slot,), name=f"load-{process}-{slot}"))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if hasattr(index, 'shutdown'):
+            index.shutdown()
+    return results
+
+
+def _process_main(process, args, workers, out):
+    try:
+        out.put((process, run_threads(process, args, workers), None))
+    except Exception as e:
+        out.put((process, None, f"{type(e).__name__}: {e}"))
+
+
+def check_consistency(initial, added, deleted, missed):
+    from sharded_index import open_index
+    from utils import load_posts
+
+    posts = load_posts()
+    stored = [p['post_id'] for p in posts]
+    store = set(stored)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        index = open_index(auto_rebuild=False)
+        indexed = {int(entry_id.split('_')[1]) for entry_id in index.get_all_ids()}
+        if hasattr(index, 'shutdown'):
+            index.shutdown()
+
+    expected = (set(initial) | added) - deleted
+    return {
+        'lost_add': sorted((added - deleted) - store),
+        'undead_delete': sorted(deleted & store),
+        'unexpected_post': sorted(store - expected),
+        'duplicate_post': sorted({post_id for post_id in stored if stored.count(post_id) > 1})
+        if len(stored) != len(store) else [],
+        'missing_in_index': sorted(store - indexed),
+        'orphan_in_index': sorted(indexed - store),
+        'missed_search': sorted(missed),
+    }, len(store), len(indexed)
+
+
+def summarize(records, elapsed):
+    summary = {}
+    for op in OPERATIONS:
+        latencies = np.array([t for name, t, _ in records if name == op])
+        if latencies.size == 0:
+            continue
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        summary[op] = {
+            'count': int(latencies.size),
+            'errors': sum(1 for name, _, error in records if name == op and error),
+            'ops_per_sec': round(latencies.size / elapsed, 2),
+            'p50_ms': round(float(p50), 2),
+            'p90_ms': round(float(p90), 2),
+            'p99_ms': round(float(p99), 2),
+            'max_ms': round(float(latencies.max() * 1000), 2),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay concurrent adds, deletes and searches and check consistency")
+    parser.add_argument('--initial', type=int, default=500, help="posts in the database before the run")
+    parser.add_argument('--threads', type=int, default=4, help="worker threads per process")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--ops', type=int, default=50, help="operations per worker thread")
+    parser.add_argument('--mix', nargs='+', default=['add=1', 'delete=1', 'search=4'],
+                        help="operation weights, e.g. add=1 delete=1 search=4")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', help="write the report to this JSON file")
+    parser.add_argument('--keep', action='store_true', help="keep the temporary data directory")
+    args = parser.parse_args()
+    args.mix = parse_mix(args.mix)
+
+    workers = args.processes * args.threads
+    try:
+        print(f"[LOAD] Data directory: {_DATA_DIR}")
+        print(f"[LOAD] Building database with {args.initial} posts...")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            build_database(args.initial, args.seed)
+            from sharded_index import open_index
+            index = open_index()
+            if hasattr(index, 'shutdown'):
+                index.shutdown()
+
+        print(f"[LOAD] {args.processes} process(es) x {args.threads} thread(s), {args.ops} ops each, "
+              f"mix {args.mix}")
+        start = time.perf_counter()
+        results, failures = [], []
+        if args.processes == 1:
+            results = run_threads(0, args, workers)
+        else:
+            ctx = mp.get_context('spawn')
+            out = ctx.Queue()
+            procs = [ctx.Process(target=_process_main, args=(p, args, workers, out), daemon=True)
+                     for p in range(args.processes)]
+            for proc in procs:
+                proc.start()
+            for _ in procs:
+                process, part, error = out.get()
+                if error:
+                    failures.append(f"process {process}: {error}")
+                else:
+                    results.extend(part)
+            for proc in procs:
+                proc.join()
+        elapsed = time.perf_counter() - start
+
+        records = [r for part in results for r in part['records']]
+        added = {post_id for part in results for post_id in part['added']}
+        deleted = {post_id for part in results for post_id in part['deleted']}
+        missed = [post_id for part in results for post_id in part['missed']]
+        violations, stored, indexed = check_consistency(range(1, args.initial + 1), added, deleted, missed)
+        summary = summarize(records, elapsed)
+        errors = sorted({error for _, _, error in records if error})
+
+        print(f"[LOAD] {len(records)} operations in {elapsed:.1f}s ({len(records) / elapsed:.1f} ops/s)")
+        for op, s in summary.items():
+            print(f"[LOAD] {op:<7} n={s['count']:>5} {s['ops_per_sec']:>8.1f} ops/s  p50={s['p50_ms']:8.1f}ms "
+                  f"p90={s['p90_ms']:8.1f}ms  p99={s['p99_ms']:8.1f}ms  max={s['max_ms']:8.1f}ms  errors={s['errors']}")
+        print(f"[LOAD] Stale search hits: {sum(part['stale_hits'] for part in results)}")
+        print(f"[LOAD] Final state: {stored} posts in posts.json, {indexed} in the index")
+        for error in errors[:10]:
+            print(f"[LOAD] Error: {error}")
+        for failure in failures:
+            print(f"[LOAD] Worker failed: {failure}")
+        total_violations = sum(len(ids) for ids in violations.values())
+        for name, ids in violations.items():
+            if ids:
+                print(f"[LOAD] VIOLATION {name}: {len(ids)} (e.g. {ids[:5]})")
+        print(f"[LOAD] {'No consistency violations' if total_violations == 0 else f'{total_violations} consistency violations'}")
+
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump({
+                    'meta': {
+                        'timestamp': datetime.now().isoformat(timespec='seconds'),
+                        'initial': args.initial, 'processes': args.processes, 'threads': args.threads,
+                        'ops_per_worker': args.ops, 'mix': args.mix, 'seed': args.seed,
+                        'cpu_count': os.cpu_count(),
+                    },
+                    'elapsed_s': round(elapsed, 3),
+                    'ops_per_sec': round(len(records) / elapsed, 2),
+                    'operations': summary,
+                    'stale_hits': sum(part['stale_hits'] for part in results),
+                    'final': {'posts': stored, 'indexed': indexed},
+                    'errors': errors,
+                    'violations': violations,
+                }, f, indent=2)
+            print(f"[LOAD] Report written to {args.json_path}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(_DATA_DIR, ignore_errors=True)
+
+    sys.exit(1 if total_violations or failures else 0)
+
+
+if __name__ == "__main__":
+    main()
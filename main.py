@@ -1,55 +1,160 @@
 # ============================================================================
-# Main 
+# Main
 # ============================================================================
+#
+# The window is shown before the face model and the search index are loaded:
+# both start on a background thread (importing chromadb and opening or
+# rebuilding the index can take seconds) and a status line shows progress.
+# Until the index is ready, searches fall back to a linear scan and adding or
+# deleting posts waits. Run with --startup-report to print where launch time
+# goes and exit.
 
 import sys
+import threading
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
-from PyQt5.QtWidgets import QApplication, QWidget, QHBoxLayout, QVBoxLayout
-from ui.feed_widget import FeedWidget
-from ui.search_results_widget import SearchResultsWidget
-from ui.search_widget import SearchWidget
-from ui.add_post_widget import AddPostWidget
-from chroma_manager import ChromaManager
+import startup_profile
 
+with startup_profile.stage("import Qt"):
+    from PyQt5.QtWidgets import QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel
+    from PyQt5.QtCore import QTimer
+
+with startup_profile.stage("import widgets (numpy, cv2)"):
+    from ui.feed_widget import FeedWidget
+    from ui.search_results_widget import SearchResultsWidget
+    from ui.search_widget import SearchWidget
+    from ui.add_post_widget import AddPostWidget
+    from ui.debug_panel import DebugPanel
+
+LOADER_POLL_MS = 100
+
+
+class BackendLoader:
+    """Starts inference and opens the vector index off the UI thread"""
 
-class MainWindow(QWidget):
     def __init__(self):
+        self.status = "Starting face model..."
+        self.index = None
+        self.error = None
+        self.done = False
+        threading.Thread(target=self._run, name="backend-loader", daemon=True).start()
+
+    def _run(self):
+        try:
+            with startup_profile.stage("start inference"):
+                from face_model import start_inference
+                start_inference()
+            self.status = "Opening search index..."
+            with startup_profile.stage("import chromadb"):
+                import chroma_manager  # noqa: F401
+            self.status = "Opening search index (rebuilding it if needed)..."
+            with startup_profile.stage("open index"):
+                from sharded_index import open_index
+                self.index = open_index()
+        except Exception as e:
+            print(f"[ERROR] Failed to load the search index: {e}")
+            self.error = str(e)
+        self.done = True
+
+
+class MainWindow(QWidget):
+    def __init__(self, on_ready=None):
         super().__init__()
         self.setWindowTitle("Missing Persons Finder - Admin")
         self.setStyleSheet("background-color: #1C1E21; color: white;")
-        
-        self.chroma_manager = ChromaManager()
-        
+        self.on_ready = on_ready
+
+        self.chroma_manager = None
+        self.loader = BackendLoader()
+
         main_layout = QHBoxLayout()
         left_layout = QVBoxLayout()
-        
-        self.feed = FeedWidget(self.chroma_manager)
-        self.results_widget = SearchResultsWidget(self.feed.show_post_by_id)
-        self.search = SearchWidget(self.results_widget, self.chroma_manager)
-        self.add = AddPostWidget(self.feed_refresh, self.chroma_manager)
-        
+
+        with startup_profile.stage("build widgets"):
+            self.feed = FeedWidget(self.chroma_manager, load_now=False)
+            self.results_widget = SearchResultsWidget(self.feed.show_post_by_id)
+            self.search = SearchWidget(self.results_widget, self.chroma_manager)
+            self.add = AddPostWidget(self.feed_refresh, self.chroma_manager)
+
+        self.status_label = QLabel(self.loader.status)
+        self.status_label.setStyleSheet("color: #f1c40f;")
+        left_layout.addWidget(self.status_label)
+
         left_layout.addWidget(self.search)
         left_layout.addWidget(self.results_widget)
         left_layout.addWidget(self.add)
-        
+
+        self.debug_btn = QPushButton("Timings")
+        self.debug_btn.setStyleSheet("background-color: #4E4F50; color: white; font-weight: bold;")
+        self.debug_btn.clicked.connect(self.show_debug_panel)
+        left_layout.addWidget(self.debug_btn)
+        self.debug_panel = None
+
         main_layout.addLayout(left_layout)
         main_layout.addWidget(self.feed)
-        
+
         self.setLayout(main_layout)
-    
+
+        self.loader_timer = QTimer(self)
+        self.loader_timer.timeout.connect(self.check_loader)
+        self.loader_timer.start(LOADER_POLL_MS)
+
+    def check_loader(self):
+        if not self.loader.done:
+            self.status_label.setText(self.loader.status)
+            return
+
+        self.loader_timer.stop()
+        if self.loader.error:
+            self.status_label.setText(f"Search index unavailable ({self.loader.error}); using linear search, "
+                                      f"adding and deleting posts is disabled")
+            self.status_label.setStyleSheet("color: #e74c3c;")
+            for widget in (self.feed, self.add):
+                widget.index_error = self.loader.error
+        else:
+            self.chroma_manager = self.loader.index
+            for widget in (self.feed, self.search, self.add):
+                widget.chroma_manager = self.chroma_manager
+            self.status_label.hide()
+        startup_profile.mark("backend ready")
+        if self.on_ready:
+            self.on_ready()
+
+    def load_feed(self):
+        with startup_profile.stage("first feed render"):
+            self.feed.refresh()
+
     def feed_refresh(self):
         self.feed.refresh()
 
+    def show_debug_panel(self):
+        if self.debug_panel is None:
+            self.debug_panel = DebugPanel(self)
+        self.debug_panel.timer.start()
+        self.debug_panel.show()
+        self.debug_panel.raise_()
+
 
 def main():
+    startup_report = "--startup-report" in sys.argv
+    if startup_report:
+        sys.argv.remove("--startup-report")
+
     app_qt = QApplication(sys.argv)
-    w = MainWindow()
+
+    def ready():
+        print(startup_profile.report())
+        if startup_report:
+            app_qt.quit()
+
+    w = MainWindow(on_ready=ready)
     w.resize(1200, 700)
     w.show()
+    startup_profile.mark("window shown")
+    QTimer.singleShot(0, w.load_feed)
     sys.exit(app_qt.exec_())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,137 @@
+# ============================================================================
+# Match Recomputation and Search Ranking
+# ============================================================================
+
+import numpy as np
+from config import SIMILARITY_THRESHOLD, VERIFY_CHROMA_SIMILARITY
+from model_version import get_active_version, post_version
+from utils import cosine_similarity
+
+QUERY_BATCH_SIZE = 256
+
+
+def recompute_all_matches(posts, chroma_manager=None):
+    """Fill every post's "matches" list with the posts above SIMILARITY_THRESHOLD.
+
+    Only posts embedded by the index's version are compared; the others
+    (posts the new model found no face in) get no matches until re-added.
+    """
+    use_chroma = chroma_manager is not None and chroma_manager.get_count() > 0
+    version = chroma_manager.version if chroma_manager is not None else get_active_version()
+    current = []
+    for p in posts:
+        if post_version(p) == version:
+            current.append(p)
+        else:
+            p["matches"] = []
+            p.pop("matches_truncated", None)
+    if len(current) < len(posts):
+        print(f"[WARN] {len(posts) - len(current)} posts are not embedded by {version} and get no matches")
+
+    if use_chroma:
+        _recompute_with_chroma(current, chroma_manager)
+    else:
+        _recompute_linear(current)
+
+
+def _recompute_with_chroma(posts, chroma_manager):
+    print("[INFO] Using ChromaDB range queries for matching...")
+    known_ids = {p['post_id'] for p in posts}
+
+    for start in range(0, len(posts), QUERY_BATCH_SIZE):
+        batch = []
+        for p1 in posts[start:start + QUERY_BATCH_SIZE]:
+            try:
+                batch.append((p1, np.array(p1["embedding"], dtype=np.float32)))
+            except Exception as e:
+                print(f"[ERROR] Failed to compute matches for post {p1.get('post_id')}: {e}")
+                p1["matches"] = []
+
+        if not batch:
+            continue
+
+        ranges = chroma_manager.query_range([emb for _, emb in batch], threshold=SIMILARITY_THRESHOLD)
+
+        for (p1, _), found in zip(batch, ranges):
+            if found['failed']:
+                # A failed query is not "no matches"; keep what was found before
+                print(f"[WARN] Post {p1['post_id']}: range query failed, keeping its previous matches")
+                p1["matches"] = [m for m in p1.get("matches", []) if m["post_id"] in known_ids]
+                continue
+
+            matches = []
+            for post_id, similarity in zip(found['post_ids'], found['similarities']):
+                if post_id == p1['post_id'] or post_id not in known_ids:
+                    continue
+                matches.append({
+                    "post_id": post_id,
+                    "similarity": round(float(similarity), 4)
+                })
+
+            p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
+            if found['truncated']:
+                p1["matches_truncated"] = True
+                print(f"[WARN] Post {p1['post_id']}: match list truncated at {len(matches)} matches")
+            else:
+                p1.pop("matches_truncated", None)
+            print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
+
+
+def _recompute_linear(posts):
+    print("[INFO] Using cosine similarity (no ChromaDB)...")
+    for i, p1 in enumerate(posts):
+        matches = []
+        try:
+            emb1 = np.array(p1["embedding"], dtype=np.float32)
+        except Exception:
+            p1["matches"] = []
+            continue
+
+        for j, p2 in enumerate(posts):
+            if i == j:
+                continue
+
+            try:
+                emb2 = np.array(p2["embedding"], dtype=np.float32)
+            except Exception:
+                continue
+
+            sim = cosine_similarity(emb1, emb2)
+            if sim >= SIMILARITY_THRESHOLD:
+                matches.append({
+                    "post_id": p2["post_id"],
+                    "similarity": round(float(sim), 4)
+                })
+
+        p1["matches"] = sorted(matches, key=lambda x: x["similarity"], reverse=True)
+        p1.pop("matches_truncated", None)
+        print(f"[INFO] Post {p1['post_id']}: {len(matches)} matches")
+
+
+def rank_search_hits(embeddings, ranges, verify=VERIFY_CHROMA_SIMILARITY):
+    """Merge range-query hits of several query images.
+
+    Returns [(post_id, similarity, best_image)] with each post's best
+    similarity over all images, highest first. best_image is 1-based.
+    """
+    best = {}  # post_id -> (similarity, best_image)
+
+    for i, (emb, found) in enumerate(zip(embeddings, ranges)):
+        for j, post_id in enumerate(found['post_ids']):
+            similarity = found['similarities'][j]
+
+            if verify:
+                stored = np.asarray(found['embeddings'][j], dtype=np.float32)
+                direct = cosine_similarity(emb, stored)
+                if abs(direct - similarity) > 1e-3:
+                    print(f"[WARN] Post {post_id}: Chroma similarity {similarity:.4f} != direct {direct:.4f}")
+                similarity = direct
+                if similarity < SIMILARITY_THRESHOLD:
+                    continue
+
+            current = best.get(post_id)
+            if current is None or similarity > current[0]:
+                best[post_id] = (similarity, i + 1)
+
+    ranked = sorted(best.items(), key=lambda x: x[1][0], reverse=True)
+    return [(post_id, similarity, best_image) for post_id, (similarity, best_image) in ranked]
@@ -0,0 +1,267 @@
+# ============================================================================
+# Metrics - Timing Spans, Counters and Export
+# ============================================================================
+#
+#   with metrics.span("chroma.query"):
+#       ...
+#   metrics.incr("search.requests")
+#
+# When metrics are disabled span() returns a shared no-op context manager, so
+# instrumented code pays one flag check. When enabled, every span feeds the
+# per-stage totals; top-level spans (operations) also carry a breakdown of
+# their child stages, are kept in a ring buffer for the debug panel and are
+# appended to a rotating JSON-lines file. Totals and counters are written to
+# a Prometheus text file.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from config import (
+    METRICS_ENABLED, METRICS_DIR, METRICS_RECENT_OPS,
+    METRICS_JSONL_MAX_BYTES, METRICS_JSONL_BACKUPS, METRICS_PROM_INTERVAL_S
+)
+
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_local = threading.local()
+
+_recent = deque(maxlen=METRICS_RECENT_OPS)
+_span_stats = {}
+_counters = {}
+
+_jsonl_logger = None
+_last_prom_write = 0.0
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **labels):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'labels', 'start', 'wall_start', 'stages', 'parent')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.stages = {}
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        if self.parent is not None:
+            total, count = self.parent.stages.get(self.name, (0.0, 0))
+            self.parent.stages[self.name] = (total + duration, count + 1)
+            # Grandchildren show up in the operation breakdown as well
+            for stage, (s_total, s_count) in self.stages.items():
+                total, count = self.parent.stages.get(stage, (0.0, 0))
+                self.parent.stages[stage] = (total + s_total, count + s_count)
+
+        _record(self, duration, exc_type)
+        return False
+
+    def set(self, **labels):
+        """Attach labels (e.g. result counts) to the span"""
+        self.labels.update(labels)
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, **labels):
+    """Time a stage; a no-op when metrics are disabled"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def incr(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _record(sp, duration, exc_type):
+    with _lock:
+        stats = _span_stats.get(sp.name)
+        if stats is None:
+            stats = _span_stats[sp.name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'errors': 0}
+        stats['count'] += 1
+        stats['sum'] += duration
+        if duration > stats['max']:
+            stats['max'] = duration
+        if exc_type is not None:
+            stats['errors'] += 1
+
+    if sp.parent is not None:
+        return
+
+    op = {
+        'ts': round(sp.wall_start, 3),
+        'name': sp.name,
+        'duration_ms': round(duration * 1000.0, 3),
+        'thread': threading.current_thread().name,
+        'stages': {
+            stage: {'ms': round(total * 1000.0, 3), 'count': count}
+            for stage, (total, count) in sp.stages.items()
+        },
+    }
+    if sp.labels:
+        op['labels'] = sp.labels
+    if exc_type is not None:
+        op['error'] = exc_type.__name__
+
+    with _lock:
+        _recent.append(op)
+
+    _write_jsonl(op)
+    _maybe_write_prometheus()
+
+
+def _get_jsonl_logger():
+    global _jsonl_logger
+    if _jsonl_logger is None:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        logger = logging.getLogger("findme.metrics")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            METRICS_DIR / "operations.jsonl",
+            maxBytes=METRICS_JSONL_MAX_BYTES,
+            backupCount=METRICS_JSONL_BACKUPS,
+            encoding='utf-8'
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _jsonl_logger = logger
+    return _jsonl_logger
+
+
+def _write_jsonl(op):
+    try:
+        _get_jsonl_logger().info(json.dumps(op))
+    except Exception as e:
+        print(f"[WARN] Failed to write metrics log: {e}")
+
+
+def _maybe_write_prometheus():
+    global _last_prom_write
+    now = time.monotonic()
+    if now - _last_prom_write < METRICS_PROM_INTERVAL_S:
+        return
+    _last_prom_write = now
+    write_prometheus()
+
+
+def recent_operations(limit=None):
+    """Most recent top-level operations, newest last"""
+    with _lock:
+        ops = list(_recent)
+    return ops[-limit:] if limit else ops
+
+
+def snapshot():
+    with _lock:
+        return {
+            'spans': {name: dict(stats) for name, stats in _span_stats.items()},
+            'counters': dict(_counters),
+        }
+
+
+def reset():
+    with _lock:
+        _recent.clear()
+        _span_stats.clear()
+        _counters.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text():
+    snap = snapshot()
+    lines = [
+        "# HELP findme_span_seconds Time spent in instrumented stages.",
+        "# TYPE findme_span_seconds summary",
+    ]
+    for name, stats in sorted(snap['spans'].items()):
+        label = f'span="{_escape(name)}"'
+        lines.append(f"findme_span_seconds_count{{{label}}} {stats['count']}")
+        lines.append(f"findme_span_seconds_sum{{{label}}} {stats['sum']:.6f}")
+
+    lines.append("# HELP findme_span_max_seconds Slowest observation per stage.")
+    lines.append("# TYPE findme_span_max_seconds gauge")
+    for name, stats in sorted(snap['spans'].items()):
+        lines.append(f'findme_span_max_seconds{{span="{_escape(name)}"}} {stats["max"]:.6f}')
+
+    lines.append("# HELP findme_span_errors_total Stages that raised.")
+    lines.append("# TYPE findme_span_errors_total counter")
+    for name, stats in sorted(snap['spans'].items()):
+        lines.append(f'findme_span_errors_total{{span="{_escape(name)}"}} {stats["errors"]}')
+
+    lines.append("# HELP findme_events_total Application event counters.")
+    lines.append("# TYPE findme_events_total counter")
+    for name, value in sorted(snap['counters'].items()):
+        lines.append(f'findme_events_total{{name="{_escape(name)}"}} {value}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path=None):
+    """Write totals and counters in Prometheus text format (atomic replace)"""
+    if path is None:
+        path = METRICS_DIR / "metrics.prom"
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"[WARN] Failed to write Prometheus metrics: {e}")
+
+
+@atexit.register
+def _flush_at_exit():
+    if _span_stats or _counters:
+        write_prometheus()
@@ -0,0 +1,68 @@
+# ============================================================================
+# Embedding Model Versions
+# ============================================================================
+#
+# active_model.json names the model version that search, matching and new
+# posts use. It is replaced in one os.replace by reembed.py promote, and every
+# process re-reads it when the file changes, so all of them switch together.
+# Posts without an "embedding_version" were embedded by buffalo_l, whose
+# Chroma collection keeps the original name.
+
+import json
+import os
+import re
+import threading
+from config import ACTIVE_MODEL_JSON, FACE_MODEL_NAME
+
+LEGACY_VERSION = "buffalo_l"
+LEGACY_COLLECTION_NAME = "face_embeddings"
+
+_active = {'key': None, 'value': None}
+_active_lock = threading.Lock()
+
+
+def _default_model():
+    return {'version': FACE_MODEL_NAME, 'model': FACE_MODEL_NAME}
+
+
+def get_active_model():
+    """{'version', 'model'} currently in use, re-read only when the file changes"""
+    try:
+        stat = ACTIVE_MODEL_JSON.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return _default_model()
+
+    with _active_lock:
+        if _active['key'] != key:
+            try:
+                with open(ACTIVE_MODEL_JSON, 'r') as f:
+                    value = json.load(f)
+                _active['value'] = {'version': str(value['version']), 'model': str(value['model'])}
+            except Exception as e:
+                print(f"[WARN] Could not read {ACTIVE_MODEL_JSON}: {e}")
+                _active['value'] = _default_model()
+            _active['key'] = key
+        return dict(_active['value'])
+
+
+def get_active_version():
+    return get_active_model()['version']
+
+
+def set_active_model(version, model):
+    tmp_path = f"{ACTIVE_MODEL_JSON}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': version, 'model': model}, f, indent=2)
+    os.replace(tmp_path, ACTIVE_MODEL_JSON)
+    print(f"[INFO] Active embedding version is now {version} (model {model})")
+
+
+def post_version(post):
+    return post.get('embedding_version', LEGACY_VERSION)
+
+
+def collection_name(version):
+    if version == LEGACY_VERSION:
+        return LEGACY_COLLECTION_NAME
+    return f"{LEGACY_COLLECTION_NAME}_{re.sub(r'[^A-Za-z0-9_-]', '_', version)}"
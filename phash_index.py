@@ -0,0 +1,308 @@
+# ============================================================================
+# Perceptual-Hash Index - Near-Duplicate Image Detection
+# ============================================================================
+#
+# Every stored image gets a 64-bit DCT perceptual hash. Hashes, post ids,
+# paths and the image's face embedding (NaN row when unknown) live in flat
+# numpy arrays, so a lookup is one vectorised XOR + popcount over all rows.
+#
+# On disk, phash_index.npz holds the hashes, post ids and paths and names the
+# raw float32 embeddings file (phash_index_embeddings-<generation>.f32). Adding
+# a post appends its rows to that file instead of rewriting every embedding;
+# removals write a new generation before the npz points to it.
+#
+# Usage:
+#   python phash_index.py rebuild   # index the images of existing posts
+
+import glob
+import os
+import sys
+import threading
+import cv2
+import numpy as np
+from config import PHASH_INDEX_PATH, PHASH_DUPLICATE_DISTANCE, PHASH_REUSE_DISTANCE
+from model_version import LEGACY_VERSION, get_active_version, post_version
+from store_lock import get_store_lock
+
+EMBEDDING_DIM = 512
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def image_phash(image):
+    """64-bit pHash of a BGR or grayscale image (None if it cannot be hashed)"""
+    if image is None or image.size == 0:
+        return None
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def file_phash(path):
+    """Hash from a reduced decode; good enough for flagging duplicates in previews"""
+    img = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None or min(img.shape[:2]) < 32:
+        img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    return image_phash(img)
+
+
+class PHashIndex:
+    def __init__(self, path=PHASH_INDEX_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.version = get_active_version()  # model version of the cached embeddings
+        self.signature = None  # (mtime_ns, size) of the file this copy matches
+        self.generation = 0    # names the embeddings file
+        self.saved_rows = 0    # leading rows already in that file
+        self.rewrite = True    # rows changed in place: save() writes a new embeddings file
+        self._set_rows([], [], [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+        self.load()
+
+    def __len__(self):
+        return self.count
+
+    # Rows live in arrays with spare capacity (doubled when full), so add() is
+    # amortised O(1); these are views of the used part
+    @property
+    def hashes(self):
+        return self._hashes[:self.count]
+
+    @property
+    def post_ids(self):
+        return self._post_ids[:self.count]
+
+    @property
+    def embeddings(self):
+        return self._embeddings[:self.count]
+
+    def _set_rows(self, hashes, post_ids, paths, embeddings):
+        self._hashes = np.asarray(hashes, dtype=np.uint64)
+        self._post_ids = np.asarray(post_ids, dtype=np.int64)
+        self._embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        self.paths = list(paths)
+        self.count = len(self._hashes)
+
+    def _reserve(self, rows):
+        capacity = len(self._hashes)
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 64)
+        for name in ('_hashes', '_post_ids', '_embeddings'):
+            old = getattr(self, name)
+            grown = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:self.count] = old[:self.count]
+            setattr(self, name, grown)
+
+    def _embeddings_path(self, generation):
+        return f"{os.path.splitext(str(self.path))[0]}_embeddings-{generation}.f32"
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """Reload if another process saved since this copy was loaded; call under the store lock"""
+        with self.lock:
+            if self._file_signature() != self.signature:
+                self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            signature = self._file_signature()
+            data = np.load(self.path, allow_pickle=False)
+            hashes = data['hashes']
+            if 'embeddings' in data.files:
+                # Older indexes kept the embeddings inside the npz
+                generation, rewrite = 0, True
+                embeddings = data['embeddings']
+            else:
+                generation, rewrite = int(data['generation']), False
+                embeddings = np.fromfile(self._embeddings_path(generation), dtype=np.float32,
+                                         count=len(hashes) * EMBEDDING_DIM)
+            with self.lock:
+                self._set_rows(hashes, data['post_ids'], [str(p) for p in data['paths']], embeddings)
+                self.version = str(data['version']) if 'version' in data.files else LEGACY_VERSION
+                self.generation, self.rewrite, self.saved_rows = generation, rewrite, self.count
+                self.signature = signature
+            print(f"[INFO] Loaded perceptual-hash index with {len(self)} images")
+        except Exception as e:
+            print(f"[WARN] Could not load perceptual-hash index: {e}")
+
+    def save(self):
+        """Append new embedding rows (or write a new generation after removals), then the npz"""
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            rewrite = self.rewrite or not os.path.exists(self._embeddings_path(self.generation))
+            generation = self.generation + 1 if rewrite else self.generation
+            start = 0 if rewrite else self.saved_rows
+            with open(self._embeddings_path(generation), 'wb' if rewrite else 'r+b') as f:
+                f.seek(start * EMBEDDING_DIM * 4)
+                f.write(self.embeddings[start:].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                hashes=self.hashes,
+                post_ids=self.post_ids,
+                paths=np.array(self.paths, dtype=str),
+                generation=np.array(generation),
+                version=np.array(self.version)
+            )
+            os.replace(tmp_path, self.path)
+            self.signature = self._file_signature()
+            self.generation, self.rewrite, self.saved_rows = generation, False, self.count
+            if rewrite:
+                self._remove_stale_embeddings()
+
+    def _remove_stale_embeddings(self):
+        current = os.path.abspath(self._embeddings_path(self.generation))
+        for path in glob.glob(f"{os.path.splitext(str(self.path))[0]}_embeddings-*.f32"):
+            if os.path.abspath(path) != current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def add(self, phash, post_id, path, embedding=None):
+        if phash is None:
+            return
+        with self.lock:
+            self._reserve(self.count + 1)
+            row = self.count
+            self._hashes[row] = np.uint64(phash)
+            self._post_ids[row] = np.int64(post_id)
+            self._embeddings[row] = np.nan if embedding is None else np.asarray(embedding, dtype=np.float32)
+            self.paths.append(str(path))
+            self.count += 1
+
+    def remove_post(self, post_id):
+        with self.lock:
+            keep = self.post_ids != post_id
+            if keep.all():
+                return 0
+            removed = int((~keep).sum())
+            self._set_rows(self.hashes[keep], self.post_ids[keep],
+                           [p for p, k in zip(self.paths, keep) if k], self.embeddings[keep])
+            self.rewrite = True
+            return removed
+
+    def distances(self, phash):
+        with self.lock:
+            if phash is None or len(self.hashes) == 0:
+                return np.zeros(0, dtype=np.int64)
+            xor = np.bitwise_xor(self.hashes, np.uint64(phash))
+            return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+    def find(self, phash, max_distance=PHASH_DUPLICATE_DISTANCE):
+        """Stored images within max_distance bits, closest first"""
+        with self.lock:
+            dist = self.distances(phash)
+            hits = np.nonzero(dist <= max_distance)[0]
+            hits = hits[np.argsort(dist[hits], kind='stable')]
+            return [
+                {'post_id': int(self.post_ids[i]), 'path': self.paths[i], 'distance': int(dist[i])}
+                for i in hits
+            ]
+
+    def set_embeddings(self, version, embeddings):
+        """Replace the cached embeddings with {(post_id, path): embedding} of another model version"""
+        with self.lock:
+            self.version = version
+            self.rewrite = True
+            for i, (post_id, path) in enumerate(zip(self.post_ids, self.paths)):
+                emb = embeddings.get((int(post_id), path))
+                self._embeddings[i] = np.nan if emb is None else np.asarray(emb, dtype=np.float32)
+
+    def cached_embedding(self, phash, max_distance=PHASH_REUSE_DISTANCE, version=None):
+        """Embedding of the closest near-identical image, or None"""
+        with self.lock:
+            if version is not None and version != self.version:
+                return None
+            dist = self.distances(phash)
+            if len(dist) == 0:
+                return None
+            known = ~np.isnan(self.embeddings[:, 0])
+            candidates = np.nonzero(known & (dist <= max_distance))[0]
+            if len(candidates) == 0:
+                return None
+            best = candidates[np.argmin(dist[candidates])]
+            return self.embeddings[best].copy()
+
+
+def get_phash_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PHashIndex()
+        return _index
+
+
+def describe_duplicates(phash):
+    """Short operator-facing note such as 'already in post 12', or ''"""
+    hits = get_phash_index().find(phash)
+    if not hits:
+        return ""
+    post_ids = []
+    for hit in hits:
+        if hit['post_id'] not in post_ids:
+            post_ids.append(hit['post_id'])
+    shown = ", ".join(str(pid) for pid in post_ids[:5])
+    more = f" (+{len(post_ids) - 5} more)" if len(post_ids) > 5 else ""
+    return f"already exists in post {shown}{more}"
+
+
+def rebuild_from_posts():
+    """Index the images of every post; single-image posts also cache their embedding"""
+    from utils import load_posts
+
+    posts = load_posts()
+    version = get_active_version()
+    hashes, post_ids, paths, embeddings = [], [], [], []
+    for post in posts:
+        images = post.get('images', [])
+        same_model = post_version(post) == version
+        embedding = post.get('embedding') if len(images) == 1 and same_model else None
+        for path in images:
+            phash = image_phash(cv2.imread(path))
+            if phash is None:
+                continue
+            hashes.append(phash)
+            post_ids.append(post['post_id'])
+            paths.append(path)
+            embeddings.append(np.nan if embedding is None else embedding)
+
+    # Filled in bulk rather than with add(): one array of each per rebuild
+    index = PHashIndex(path=PHASH_INDEX_PATH)
+    rows = np.full((len(hashes), EMBEDDING_DIM), np.nan, dtype=np.float32)
+    for i, embedding in enumerate(embeddings):
+        rows[i] = embedding
+    with get_store_lock():
+        index.refresh()
+        index._set_rows(hashes, post_ids, paths, rows)
+        index.version = version
+        index.rewrite = True
+        index.save()
+    print(f"[INFO] Indexed {len(index)} images from {len(posts)} posts")
+
+    global _index
+    with _index_lock:
+        _index = index
+    return index
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild_from_posts()
+    else:
+        print("Usage: python phash_index.py rebuild")
@@ -0,0 +1,93 @@
+# ============================================================================
+# Pixmap Cache - Process-Wide LRU under a Byte Budget
+# ============================================================================
+#
+# Decoded pixmaps are keyed by (path, box width, box height, mtime) so the feed,
+# search results, post dialogs and the viewer share one decode per size, and
+# an edited file is never served stale. Least recently used entries are
+# evicted once the total pixel memory exceeds PIXMAP_CACHE_BYTES.
+
+import threading
+from collections import OrderedDict
+import metrics
+from config import PIXMAP_CACHE_BYTES
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class PixmapCache:
+    def __init__(self, max_bytes=PIXMAP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (pixmap, nbytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, count_miss=True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                    metrics.incr("pixmap_cache.miss")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            metrics.incr("pixmap_cache.hit")
+            return entry[0]
+
+    def put(self, key, pixmap):
+        nbytes = pixmap_bytes(pixmap)
+        if pixmap.isNull() or nbytes > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.entries[key] = (pixmap, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_pixmap_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PixmapCache()
+        return _cache
+
+
+def describe():
+    """One-line summary for the debug panel"""
+    s = get_pixmap_cache().stats()
+    return (f"Pixmap cache: {s['hit_rate'] * 100:.1f}% hits ({s['hits']}/{s['hits'] + s['misses']}), "
+            f"{s['entries']} pixmaps, {s['bytes'] / (1024 * 1024):.1f}/{s['max_bytes'] / (1024 * 1024):.0f} MB, "
+            f"{s['evictions']} evicted")
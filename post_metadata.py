@@ -0,0 +1,183 @@
+# ============================================================================
+# Post Metadata - Case Details and Search Filters
+# ============================================================================
+#
+# Posts may carry a "metadata" dict with any of:
+#   date_reported  "YYYY-MM-DD"
+#   region         free text, matched case-insensitively
+#   sex            one of SEX_VALUES
+#   age_band       one of AGE_BANDS
+#
+# The same fields are copied into each post's Chroma metadata (the date as an
+# int YYYYMMDD so it can be range-filtered). Posts are partitioned into one
+# Chroma collection per region (see chroma_manager.py), so a region filter
+# picks the collections to search; the other filters become a `where` clause.
+# A post without a field never matches a filter on that field.
+#
+# Filters: {'date_from', 'date_to', 'regions': [...], 'sex', 'age_bands': [...]}
+
+from datetime import date
+from config import AGE_BANDS, SEX_VALUES
+
+FIELDS = ('date_reported', 'region', 'sex', 'age_band')
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def date_key(value):
+    """'2024-05-01' -> 20240501"""
+    d = _parse_date(value)
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def normalize_region(region):
+    return " ".join(str(region).split()).lower()
+
+
+def clean_metadata(metadata):
+    """Validated copy of a post's metadata with empty fields dropped; raises ValueError"""
+    cleaned = {}
+    for field, value in (metadata or {}).items():
+        if field not in FIELDS:
+            raise ValueError(f"Unknown metadata field '{field}'")
+        if value is None or str(value).strip() == "":
+            continue
+        value = str(value).strip()
+        if field == 'date_reported':
+            value = _parse_date(value).isoformat()
+        elif field == 'sex':
+            value = value.upper()
+            if value not in SEX_VALUES:
+                raise ValueError(f"Invalid sex '{value}', expected one of {', '.join(SEX_VALUES)}")
+        elif field == 'age_band' and value not in AGE_BANDS:
+            raise ValueError(f"Invalid age band '{value}', expected one of {', '.join(AGE_BANDS)}")
+        elif field == 'region':
+            value = " ".join(value.split())
+        cleaned[field] = value
+    return cleaned
+
+
+def chroma_metadata(post):
+    """Metadata stored with the post's embedding in Chroma"""
+    metadata = {'num_images': len(post.get('images', [])), 'post_id': post['post_id']}
+    details = post.get('metadata') or {}
+    if details.get('date_reported'):
+        metadata['date_reported'] = date_key(details['date_reported'])
+    if details.get('region'):
+        metadata['region'] = normalize_region(details['region'])
+    if details.get('sex'):
+        metadata['sex'] = details['sex']
+    if details.get('age_band'):
+        metadata['age_band'] = details['age_band']
+    return metadata
+
+
+def _filter_list(filters, field):
+    """filters[field] as a list; a bare string is one value"""
+    values = filters.get(field) or []
+    if isinstance(values, str):
+        return [values]
+    if not isinstance(values, (list, tuple)):
+        raise ValueError(f"Filter '{field}' must be a list, got {type(values).__name__}")
+    return values
+
+
+def clean_filters(filters):
+    """Validated filters with empty entries dropped (None when nothing is filtered)"""
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError(f"Filters must be an object, got {type(filters).__name__}")
+    cleaned = {}
+    for field in ('date_from', 'date_to'):
+        if filters.get(field):
+            cleaned[field] = _parse_date(filters[field]).isoformat()
+    regions = [normalize_region(r) for r in _filter_list(filters, 'regions') if str(r).strip()]
+    if regions:
+        cleaned['regions'] = regions
+    if filters.get('sex'):
+        cleaned['sex'] = clean_metadata({'sex': filters['sex']})['sex']
+    age_bands = [clean_metadata({'age_band': b})['age_band'] for b in _filter_list(filters, 'age_bands') if b]
+    if age_bands:
+        cleaned['age_bands'] = age_bands
+    unknown = set(filters) - {'date_from', 'date_to', 'regions', 'sex', 'age_bands'}
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    return cleaned or None
+
+
+def build_where(filters):
+    """Chroma where clause for the non-region filters, or None"""
+    if not filters:
+        return None
+    clauses = []
+    if filters.get('date_from'):
+        clauses.append({'date_reported': {'$gte': date_key(filters['date_from'])}})
+    if filters.get('date_to'):
+        clauses.append({'date_reported': {'$lte': date_key(filters['date_to'])}})
+    if filters.get('sex'):
+        clauses.append({'sex': {'$eq': filters['sex']}})
+    if filters.get('age_bands'):
+        clauses.append({'age_band': {'$in': list(filters['age_bands'])}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def matches_filters(post, filters):
+    """Same test as a filtered Chroma query, for searches that do not go through Chroma"""
+    if not filters:
+        return True
+    metadata = chroma_metadata(post)
+    if filters.get('date_from') and metadata.get('date_reported', 0) < date_key(filters['date_from']):
+        return False
+    if filters.get('date_to') and metadata.get('date_reported', 99999999) > date_key(filters['date_to']):
+        return False
+    if filters.get('regions') and metadata.get('region') not in filters['regions']:
+        return False
+    if filters.get('sex') and metadata.get('sex') != filters['sex']:
+        return False
+    if filters.get('age_bands') and metadata.get('age_band') not in filters['age_bands']:
+        return False
+    return True
+
+
+def describe_filters(filters):
+    if not filters:
+        return "no filters"
+    parts = []
+    if filters.get('date_from') or filters.get('date_to'):
+        parts.append(f"reported {filters.get('date_from', '…')} to {filters.get('date_to', '…')}")
+    if filters.get('regions'):
+        parts.append("region " + "/".join(filters['regions']))
+    if filters.get('sex'):
+        parts.append(f"sex {filters['sex']}")
+    if filters.get('age_bands'):
+        parts.append("age " + "/".join(filters['age_bands']))
+    return ", ".join(parts)
+
+
+def describe_metadata(metadata):
+    """Short line for post cards, e.g. '2024-05-01 · Lviv · F · 18-29'"""
+    metadata = metadata or {}
+    return " · ".join(str(metadata[f]) for f in FIELDS if metadata.get(f))
+
+
+def add_filter_arguments(parser):
+    parser.add_argument('--date-from', help="only posts reported on or after YYYY-MM-DD")
+    parser.add_argument('--date-to', help="only posts reported on or before YYYY-MM-DD")
+    parser.add_argument('--region', action='append', dest='regions', help="only posts from this region (repeatable)")
+    parser.add_argument('--sex', choices=SEX_VALUES)
+    parser.add_argument('--age-band', action='append', dest='age_bands', choices=AGE_BANDS, help="repeatable")
+
+
+def filters_from_args(args):
+    return clean_filters({
+        'date_from': args.date_from, 'date_to': args.date_to, 'regions': args.regions,
+        'sex': args.sex, 'age_bands': args.age_bands,
+    })
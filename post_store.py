@@ -0,0 +1,212 @@
+# ============================================================================
+# Post Store - Adding and Deleting Posts
+# ============================================================================
+#
+# Shared by the admin widgets and the headless service. Every
+# load -> modify -> save of posts.json runs under the store lock (see
+# store_lock.py), so concurrent adds and deletes cannot overwrite each other,
+# whether they come from threads of one process or from the GUI and the
+# service running side by side.
+
+import shutil
+import cv2
+import metrics
+import image_store
+import clusters
+import search_cache
+from config import KNOWN_DIR
+from utils import load_posts, save_posts
+from matching import recompute_all_matches
+from phash_index import get_phash_index
+from chip_store import get_chip_store
+from model_version import get_active_version
+from post_metadata import clean_metadata, chroma_metadata
+from store_lock import get_store_lock
+
+_store_lock = get_store_lock()
+
+
+class NoFaceError(ValueError):
+    pass
+
+
+def recompute_matches(posts, chroma_manager=None):
+    with metrics.span("matches.recompute", posts=len(posts)):
+        recompute_all_matches(posts, chroma_manager)
+
+
+def post_exists(post_id):
+    return any(p["post_id"] == post_id for p in load_posts())
+
+
+def _store_images(post_id, image_paths, image_info, version):
+    saved_paths = []
+    stored = {}
+    with metrics.span("post.save_images"):
+        for src in image_paths:
+            if not cv2.haveImageReader(src):
+                print(f"[WARN] Skipping unreadable image {src}")
+                continue
+            try:
+                stored[src] = image_store.add_image(src)
+                saved_paths.append(stored[src])
+            except image_store.ImageRefsError:
+                raise
+            except Exception as e:
+                print(f"[WARN] failed to save image {src}: {e}")
+
+    try:
+        phash_index = get_phash_index()
+        phash_index.refresh()
+        same_model = phash_index.version == version
+        for info in image_info:
+            if info['path'] in stored:
+                phash_index.add(info['phash'], post_id, stored[info['path']],
+                                info['embedding'] if same_model else None)
+        phash_index.save()
+    except Exception as e:
+        print(f"[WARN] Failed to update perceptual-hash index: {e}")
+
+    try:
+        chip_store = get_chip_store()
+        chip_store.refresh()
+        for info in image_info:
+            face = info.get('face')
+            if info['path'] not in stored:
+                continue
+            if face:
+                chip_store.add(post_id, stored[info['path']], face['chip'], face['bbox'], face['kps'])
+            elif info['embedding'] is not None:
+                # Embedding came from the perceptual-hash cache, no detection ran
+                chip_store.copy_for_path(post_id, stored[info['path']])
+        chip_store.save()
+    except Exception as e:
+        print(f"[WARN] Failed to store face chips: {e}")
+
+    print(f"[INFO] Saved {len(saved_paths)} images for post {post_id}")
+    return saved_paths
+
+
+def add_post(post_id, image_paths, chroma_manager=None, metadata=None):
+    """Embed, store and index a new post; returns the saved post dict.
+
+    metadata holds the optional case details of post_metadata.FIELDS.
+    Raises ValueError if the ID is taken or metadata is invalid and
+    NoFaceError if no face was found.
+    """
+    from face_model import images_to_embedding_list
+
+    metadata = clean_metadata(metadata)
+    with metrics.span("post.add", post_id=post_id, images=len(image_paths)):
+        if post_exists(post_id):
+            raise ValueError(f"Post ID {post_id} already exists.")
+
+        print(f"[INFO] Processing post {post_id}...")
+        version = get_active_version()
+        image_info = []
+        emb = images_to_embedding_list(image_paths, image_info=image_info)
+        if emb is None:
+            raise NoFaceError("No faces detected.")
+
+        print(f"[INFO] Embedding extracted for post {post_id}")
+
+        with _store_lock:
+            posts = load_posts(strict=True)
+            if any(p["post_id"] == post_id for p in posts):
+                raise ValueError(f"Post ID {post_id} already exists.")
+
+            if get_active_version() != version:
+                # A new model was promoted while this post was being embedded
+                print(f"[INFO] Embedding version changed, re-embedding post {post_id}")
+                version = get_active_version()
+                image_info = []
+                emb = images_to_embedding_list(image_paths, image_info=image_info)
+                if emb is None:
+                    raise NoFaceError("No faces detected.")
+
+            saved_paths = _store_images(post_id, image_paths, image_info, version)
+
+            new_post = {
+                "post_id": post_id,
+                "images": saved_paths,
+                "embedding": emb.tolist(),
+                "embedding_version": version,
+                "metadata": metadata,
+                "matches": []
+            }
+            posts.append(new_post)
+
+            if chroma_manager is not None:
+                try:
+                    chroma_manager.add_post(
+                        post_id=post_id,
+                        embedding=emb,
+                        metadata=chroma_metadata(new_post)
+                    )
+                except Exception as e:
+                    print(f"[ERROR] Failed to add to ChromaDB: {e}")
+
+            print(f"[INFO] Computing matches for post {post_id}...")
+            recompute_matches(posts, chroma_manager)
+
+            save_posts(posts)
+            search_cache.bump_generation()
+            clusters.note_post_added(new_post)
+
+    metrics.incr("posts.added")
+    print(f"[INFO] Post {post_id} added successfully!")
+    return new_post
+
+
+def delete_post(post_id, chroma_manager=None):
+    """Remove a post, its index entries and unreferenced images; False if it did not exist"""
+    with metrics.span("post.delete", post_id=post_id), _store_lock:
+        posts = load_posts(strict=True)
+        deleted = [p for p in posts if p["post_id"] == post_id]
+        posts = [p for p in posts if p["post_id"] != post_id]
+
+        if chroma_manager is not None:
+            try:
+                chroma_manager.delete_post(post_id)
+            except Exception as e:
+                print(f"[ERROR] Failed to delete from ChromaDB: {e}")
+
+        for p in deleted:
+            try:
+                image_store.release_images(p.get("images", []))
+            except Exception as e:
+                print(f"[WARN] failed to release images: {e}")
+
+        try:
+            phash_index = get_phash_index()
+            phash_index.refresh()
+            if phash_index.remove_post(post_id):
+                phash_index.save()
+        except Exception as e:
+            print(f"[WARN] Failed to update perceptual-hash index: {e}")
+
+        try:
+            chip_store = get_chip_store()
+            chip_store.refresh()
+            if chip_store.remove_post(post_id):
+                chip_store.save()
+        except Exception as e:
+            print(f"[WARN] Failed to update face-chip store: {e}")
+
+        # Posts saved before the content-addressed store kept their own folder
+        folder = KNOWN_DIR / str(post_id)
+        if folder.exists():
+            try:
+                shutil.rmtree(folder)
+            except Exception as e:
+                print(f"[WARN] failed to remove folder: {e}")
+
+        recompute_matches(posts, chroma_manager)
+
+        save_posts(posts)
+        search_cache.bump_generation()
+        clusters.note_posts_changed(posts)
+
+    if deleted:
+        metrics.incr("posts.deleted")
+    return bool(deleted)
@@ -0,0 +1,359 @@
+# ============================================================================
+# Background Re-Embedding - Switch Face Models without Blocking Search
+# ============================================================================
+#
+# Usage:
+#   python reembed.py run --model antelopev2 [--version NAME] [--no-promote]
+#   python reembed.py status
+#   python reembed.py promote
+#   python reembed.py abort
+#
+# Posts are re-embedded in batches into a separate Chroma collection for the
+# new version. Stored face chips go through the recognition model only;
+# images without a chip are detected again. Each finished batch is written to
+# REEMBED_DIR/batches, so an interrupted run resumes where it stopped. Posts
+# added while the job runs are picked up before promotion.
+#
+# Until promotion everything keeps using the active version. promote rewrites
+# posts.json with the new embeddings and matches, then flips
+# active_model.json; running apps switch collection and model on their next call.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+from config import REEMBED_DIR, REEMBED_BATCH_SIZE
+from utils import load_posts, save_posts
+from model_version import get_active_model, set_active_model, post_version
+from post_metadata import chroma_metadata
+
+JOB_JSON = REEMBED_DIR / "job.json"
+BATCH_DIR = REEMBED_DIR / "batches"
+
+
+def load_job():
+    if not JOB_JSON.exists():
+        return None
+    with open(JOB_JSON, 'r') as f:
+        return json.load(f)
+
+
+def start_job(version, model):
+    job = {'version': version, 'model': model, 'started': time.strftime("%Y-%m-%d %H:%M:%S")}
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{JOB_JSON}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, JOB_JSON)
+    print(f"[INFO] Started re-embedding job for version {version} (model {model})")
+    return job
+
+
+def _batch_files():
+    if not BATCH_DIR.exists():
+        return []
+    return sorted(BATCH_DIR.glob("batch_*.npz"))
+
+
+def load_results():
+    """(post_id -> embedding or None, (post_id, path) -> image embedding) from finished batches"""
+    post_embeddings = {}
+    image_embeddings = {}
+    for path in _batch_files():
+        data = np.load(path, allow_pickle=False)
+        for post_id, emb in zip(data['post_ids'], data['embeddings']):
+            post_embeddings[int(post_id)] = None if np.isnan(emb[0]) else emb
+        for post_id, image_path, emb in zip(data['image_post_ids'], data['image_paths'], data['image_embeddings']):
+            image_embeddings[(int(post_id), str(image_path))] = emb
+    return post_embeddings, image_embeddings
+
+
+def _save_batch(result):
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    number = len(_batch_files()) + 1
+    path = BATCH_DIR / f"batch_{number:06d}.npz"
+    tmp_path = BATCH_DIR / f"batch_{number:06d}.tmp.npz"
+    np.savez(tmp_path, **result)
+    os.replace(tmp_path, path)
+
+
+def _chip_rows_by_post(chip_store, post_ids):
+    rows = {}
+    live = chip_store.rows()
+    for row in live[np.isin(chip_store.post_ids[live], list(post_ids))]:
+        rows.setdefault(int(chip_store.post_ids[row]), []).append(int(row))
+    return rows
+
+
+def embed_posts(posts, app, chip_store):
+    """New-model embeddings for a batch of posts, as arrays ready for _save_batch.
+
+    Post embeddings are fused from the image embeddings by face quality, as
+    face_model.images_to_embedding_list does for new posts.
+    """
+    from face_model import embed_chips, extract_face_chip, detect_and_embed_batch
+    from face_quality import face_quality, fuse_embeddings
+    from store_lock import get_store_lock
+
+    # Rows move when another process compacts the chip store, so they are looked
+    # up and read under the store lock; the model runs without it
+    with get_store_lock():
+        chip_store.refresh()
+        chip_rows = _chip_rows_by_post(chip_store, [p['post_id'] for p in posts])
+        rows = [row for p in posts for row in chip_rows.get(p['post_id'], [])]
+        chips = chip_store.read(rows)
+        row_faces = {
+            row: (chip_store.paths[row], {'chip': chip, 'bbox': chip_store.bboxes[row].copy(),
+                                          'kps': chip_store.kps[row].copy()})
+            for row, chip in zip(rows, chips)
+        }
+
+    # All stored chips of the batch go through the recognition model in one call
+    chip_embeddings = dict(zip(rows, embed_chips(chips, app=app)))
+
+    post_ids, embeddings = [], []
+    image_post_ids, image_paths, image_embeddings = [], [], []
+    new_chips = []
+    for post in posts:
+        per_image = {}  # path -> (embedding, face dict)
+        for row in chip_rows.get(post['post_id'], []):
+            path, face = row_faces[row]
+            per_image[path] = (chip_embeddings[row], face)
+
+        # Images without a stored chip are detected again, all of the post's at once
+        missing, images = [], []
+        for path in post.get('images', []):
+            if path not in per_image:
+                img = cv2.imread(path)
+                if img is not None:
+                    missing.append(path)
+                    images.append(img)
+        for path, img, faces in zip(missing, images, detect_and_embed_batch(app, images) if images else []):
+            if len(faces) == 0:
+                continue
+            face = extract_face_chip(img, faces[0])
+            per_image[path] = (np.asarray(faces[0].embedding, dtype=np.float32), face)
+            if face:
+                new_chips.append((post['post_id'], path, face))
+
+        post_ids.append(post['post_id'])
+        if len(per_image) == 1:
+            embeddings.append(next(iter(per_image.values()))[0])
+        elif per_image:
+            scored = [face_quality(face) for _, face in per_image.values()]
+            fused, _ = fuse_embeddings([emb for emb, _ in per_image.values()],
+                                       [q[0] if q else None for q in scored])
+            embeddings.append(fused)
+        else:
+            print(f"[WARN] Post {post['post_id']}: no face found by the new model, keeping old embedding")
+            embeddings.append(np.full(512, np.nan, dtype=np.float32))
+
+        for path, (emb, _) in per_image.items():
+            image_post_ids.append(post['post_id'])
+            image_paths.append(path)
+            image_embeddings.append(emb)
+
+    if new_chips:
+        with get_store_lock():
+            chip_store.refresh()
+            for post_id, path, face in new_chips:
+                if not chip_store.has(post_id, path):
+                    chip_store.add(post_id, path, face['chip'], face['bbox'], face['kps'])
+            chip_store.save()
+    return {
+        'post_ids': np.array(post_ids, dtype=np.int64),
+        'embeddings': np.array(embeddings, dtype=np.float32).reshape(-1, 512),
+        'image_post_ids': np.array(image_post_ids, dtype=np.int64),
+        'image_paths': np.array(image_paths, dtype=str),
+        'image_embeddings': np.array(image_embeddings, dtype=np.float32).reshape(-1, 512),
+    }
+
+
+def _index_batch(manager, result, posts):
+    by_id = {p['post_id']: p for p in posts}
+    keep = [i for i, emb in enumerate(result['embeddings']) if not np.isnan(emb[0])]
+    if keep:
+        manager.add_embeddings(
+            [f"post_{int(result['post_ids'][i])}" for i in keep],
+            [result['embeddings'][i].tolist() for i in keep],
+            [chroma_metadata(by_id[int(result['post_ids'][i])]) for i in keep],
+            upsert=True
+        )
+
+
+def process_pending(job, app, manager, batch_size=REEMBED_BATCH_SIZE):
+    """Re-embed every post without a finished batch; returns how many were processed"""
+    from chip_store import get_chip_store
+
+    chip_store = get_chip_store()
+    done, _ = load_results()
+    pending = [p for p in load_posts() if p['post_id'] not in done]
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        result = embed_posts(batch, app, chip_store)
+        # Index first, then checkpoint: a crash in between only repeats the batch
+        _index_batch(manager, result, batch)
+        _save_batch(result)
+        print(f"[INFO] Re-embedded {min(start + batch_size, len(pending))}/{len(pending)} pending posts")
+
+    return len(pending)
+
+
+def _open_job(job):
+    from sharded_index import open_index
+    from face_model import load_face_app
+
+    app = load_face_app(job['model'])
+    if app is None:
+        raise RuntimeError(f"Could not load face model {job['model']}")
+    manager = open_index(version=job['version'], auto_rebuild=False)
+    return app, manager
+
+
+def promote(job=None, app=None, manager=None):
+    """Finish stragglers, switch posts.json to the new embeddings and activate the version"""
+    import post_store
+    import clusters
+    from phash_index import get_phash_index
+
+    job = job or load_job()
+    if job is None:
+        print("[ERROR] No re-embedding job to promote")
+        return False
+    if app is None or manager is None:
+        app, manager = _open_job(job)
+
+    with post_store._store_lock:
+        # Posts added since the last pass; the store lock keeps the GUI and the
+        # service from adding more until the flip
+        process_pending(job, app, manager)
+
+        post_embeddings, image_embeddings = load_results()
+        posts = load_posts(strict=True)
+        kept_old = []
+        for post in posts:
+            emb = post_embeddings.get(post['post_id'])
+            if emb is None:
+                kept_old.append(post['post_id'])
+                continue
+            post['embedding'] = emb.tolist()
+            post['embedding_version'] = job['version']
+
+        live_ids = {f"post_{p['post_id']}" for p in posts}
+        stale = [i for i in manager.get_all_ids() if i not in live_ids]
+        if stale:
+            manager.delete_ids(stale)
+
+        post_store.recompute_matches(posts, manager)
+        save_posts(posts)
+        clusters.note_posts_changed(posts)
+
+        try:
+            phash_index = get_phash_index()
+            phash_index.refresh()
+            phash_index.set_embeddings(job['version'], image_embeddings)
+            phash_index.save()
+        except Exception as e:
+            print(f"[WARN] Failed to update perceptual-hash index: {e}")
+
+        set_active_model(job['version'], job['model'])
+
+    shutil.rmtree(REEMBED_DIR, ignore_errors=True)
+    if kept_old:
+        print(f"[WARN] {len(kept_old)} posts had no face under the new model; they are not searchable and have "
+              f"no matches until re-added with other photos: {', '.join(map(str, sorted(kept_old)))}")
+    print(f"[INFO] Promoted {job['version']}; the previous collection is kept for rollback")
+    return True
+
+
+def run(model, version=None, batch_size=REEMBED_BATCH_SIZE, do_promote=True):
+    version = version or model
+    job = load_job()
+    if job is None:
+        if version == get_active_model()['version']:
+            print(f"[ERROR] {version} is already the active version")
+            return False
+        job = start_job(version, model)
+    elif job['version'] != version:
+        print(f"[ERROR] A job for {job['version']} is in progress; finish it or run 'abort' first")
+        return False
+    else:
+        print(f"[INFO] Resuming re-embedding job for {version}")
+
+    app, manager = _open_job(job)
+    while process_pending(job, app, manager, batch_size):
+        pass
+
+    if do_promote:
+        return promote(job, app, manager)
+    print("[INFO] All posts re-embedded; run 'python reembed.py promote' to switch")
+    return True
+
+
+def status():
+    job = load_job()
+    active = get_active_model()
+    print(f"Active version: {active['version']} (model {active['model']})")
+    stale = sorted(p['post_id'] for p in load_posts() if post_version(p) != active['version'])
+    if stale:
+        print(f"Posts not embedded by {active['version']} (re-add them to make them searchable): "
+              f"{', '.join(map(str, stale))}")
+    if job is None:
+        print("No re-embedding job")
+        return
+    done, images = load_results()
+    total = len(load_posts())
+    print(f"Job: {job['version']} (model {job['model']}), started {job['started']}")
+    print(f"Posts re-embedded: {len(done)}/{total} ({len(images)} images)")
+
+
+def abort():
+    job = load_job()
+    if job is None:
+        print("No re-embedding job")
+        return
+    try:
+        from sharded_index import open_index
+        open_index(version=job['version'], auto_rebuild=False).drop()
+    except Exception as e:
+        print(f"[WARN] Could not delete collection for {job['version']}: {e}")
+    shutil.rmtree(REEMBED_DIR, ignore_errors=True)
+    print(f"[INFO] Aborted re-embedding job for {job['version']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed all posts with another face model")
+    sub = parser.add_subparsers(dest='command')
+    run_parser = sub.add_parser('run')
+    run_parser.add_argument('--model', required=True, help="insightface model pack, e.g. antelopev2")
+    run_parser.add_argument('--version', help="version name (defaults to the model name)")
+    run_parser.add_argument('--batch-size', type=int, default=REEMBED_BATCH_SIZE)
+    run_parser.add_argument('--no-promote', action='store_true')
+    sub.add_parser('status')
+    sub.add_parser('promote')
+    sub.add_parser('abort')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args.model, args.version, args.batch_size, not args.no_promote)
+    elif args.command == 'status':
+        status()
+    elif args.command == 'promote':
+        promote()
+    elif args.command == 'abort':
+        abort()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
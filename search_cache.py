@@ -0,0 +1,146 @@
+# ============================================================================
+# Search Cache - Recent Search Results by Query Embedding
+# ============================================================================
+#
+# Ranked hits of a search are kept under a key made from the query embeddings
+# (unit-normalized and rounded to 1/SEARCH_CACHE_QUANT_LEVELS, so the same
+# photo searched again hits even if inference differs in the last bits), the
+# threshold and the filters. Least recently used entries are dropped beyond
+# SEARCH_CACHE_SIZE.
+#
+# Every entry belongs to a database generation: a counter bumped by
+# post_store on each add and delete, plus the posts.json signature and the
+# active embedding version, so changes made by another process (service,
+# reembed.py, snapshot.py) also invalidate the cache. Only complete results
+# are kept: a search whose range query was truncated or failed runs again.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+import metrics
+from config import SEARCH_CACHE_SIZE, SEARCH_CACHE_QUANT_LEVELS
+from model_version import get_active_version
+from utils import posts_signature
+
+_cache = None
+_cache_lock = threading.Lock()
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def bump_generation():
+    """Call after adding or deleting posts"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def current_generation():
+    return (_generation, posts_signature(), get_active_version())
+
+
+def query_key(embeddings, threshold, filters=None):
+    digest = hashlib.sha1()
+    for emb in embeddings:
+        emb = np.asarray(emb, dtype=np.float32)
+        unit = emb / (np.linalg.norm(emb) or 1.0)
+        digest.update(np.round(unit * SEARCH_CACHE_QUANT_LEVELS).astype(np.int16).tobytes())
+    digest.update(json.dumps([float(threshold), filters], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SearchCache:
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> value
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_generation(self):
+        generation = current_generation()
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+                metrics.incr("search_cache.invalidated")
+            self.entries.clear()
+            self.generation = generation
+        return generation
+
+    def get(self, key):
+        with self.lock:
+            self._check_generation()
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                metrics.incr("search_cache.miss")
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            metrics.incr("search_cache.hit")
+            return value
+
+    def put(self, key, value, generation):
+        """Store value computed at generation (taken before the search ran)"""
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if self._check_generation() != generation:
+                return  # the database changed while searching
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_search_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
+
+def cached_search(embeddings, threshold, filters, search):
+    """(value, complete) of search(), or of the value cached for these embeddings at the current generation.
+
+    search() returns (value, complete); complete is False when a range query
+    was truncated or failed, and such values are not cached.
+    """
+    cache = get_search_cache()
+    key = query_key(embeddings, threshold, filters)
+    value = cache.get(key)
+    if value is not None:
+        return value, True
+    generation = current_generation()
+    value, complete = search()
+    if complete:
+        cache.put(key, value, generation)
+    return value, complete
+
+
+def describe():
+    """One-line summary for the debug panel"""
+    s = get_search_cache().stats()
+    return (f"Search cache: {s['hit_rate'] * 100:.1f}% hits ({s['hits']}/{s['hits'] + s['misses']}), "
+            f"{s['entries']}/{s['max_entries']} entries, {s['invalidations']} invalidations")
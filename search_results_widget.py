@@ -2,14 +2,14 @@
 #  Search Results Widget 
 # ============================================================================
 
-import cv2
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
     QListWidget, QListWidgetItem, QFrame, QScrollArea
 )
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QImage
+import metrics
+from ui.image_loader import load_thumbnail
 from ui.image_viewer import ImageViewer
 
 class SearchResultsWidget(QWidget):
@@ -30,6 +30,10 @@ class SearchResultsWidget(QWidget):
         self.setLayout(self.layout)
 
     def display_results(self, results):
+        with metrics.span("results.render", results=len(results)):
+            self._display_results(results)
+
+    def _display_results(self, results):
         self.list_widget.clear()
 
         for res in results:
@@ -57,14 +61,10 @@ class SearchResultsWidget(QWidget):
 
                 for img_path in post["images"]:
                     if Path(img_path).exists():
-                        img = cv2.imread(img_path)
-                        if img is None:
+                        with metrics.span("image.decode"):
+                            pix = load_thumbnail(img_path)
+                        if pix.isNull():
                             continue
-                        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                        h, w, ch = img.shape
-                        bytes_per_line = ch * w
-                        qimg = QImage(img.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                        pix = QPixmap.fromImage(qimg).scaled(100, 75, Qt.KeepAspectRatio)
                         lbl = QLabel()
                         lbl.setPixmap(pix)
                         lbl.setCursor(Qt.PointingHandCursor)
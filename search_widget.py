@@ -7,14 +7,23 @@ import numpy as np
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
-    QFileDialog, QMessageBox, QTextEdit, QScrollArea
+    QFileDialog, QMessageBox, QTextEdit, QScrollArea, QLineEdit, QComboBox
 )
 from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
-from config import MAX_IMAGES, SIMILARITY_THRESHOLD
-from utils import load_posts, cosine_similarity
-from face_model import get_face_embedding_from_image
+import metrics
+from config import (
+    MAX_IMAGES, SIMILARITY_THRESHOLD, SEARCH_RESULTS_LIMIT, VERIFY_CHROMA_SIMILARITY, SEX_VALUES, AGE_BANDS
+)
+from utils import load_posts, get_posts_by_ids, cosine_similarity
+from matching import rank_search_hits
+from search_cache import cached_search
+from face_model import get_face_embeddings_cached
+from phash_index import file_phash, describe_duplicates
+from post_metadata import clean_filters, matches_filters, describe_filters
+from ui.image_loader import load_thumbnail
 from ui.image_viewer import ImageViewer
+from ui.video_scan_dialog import VideoScanDialog
+from ui.batch_search_dialog import BatchSearchDialog
 
 
 class SearchWidget(QWidget):
@@ -51,6 +60,34 @@ class SearchWidget(QWidget):
         top_layout.addWidget(self.images_preview)
         top_layout.addWidget(self.search_btn)
         
+        self.video_btn = QPushButton("Scan video")
+        self.video_btn.setStyleSheet("background-color: #365899; color: white; font-weight: bold;")
+        self.video_btn.clicked.connect(self.scan_video)
+        top_layout.addWidget(self.video_btn)
+        
+        self.batch_btn = QPushButton("Batch search")
+        self.batch_btn.setStyleSheet("background-color: #365899; color: white; font-weight: bold;")
+        self.batch_btn.clicked.connect(self.batch_search)
+        top_layout.addWidget(self.batch_btn)
+        
+        filter_layout = QHBoxLayout()
+        input_style = "background-color: #242526; border: 1px solid #4E4F50; padding: 3px; color: white;"
+        self.date_from_input = QLineEdit()
+        self.date_from_input.setPlaceholderText("Reported from (YYYY-MM-DD)")
+        self.date_to_input = QLineEdit()
+        self.date_to_input.setPlaceholderText("Reported to (YYYY-MM-DD)")
+        self.region_input = QLineEdit()
+        self.region_input.setPlaceholderText("Regions (comma separated)")
+        for line_edit in (self.date_from_input, self.date_to_input, self.region_input):
+            line_edit.setStyleSheet(input_style)
+            filter_layout.addWidget(line_edit)
+        self.sex_input = QComboBox()
+        self.sex_input.addItems(["Any sex", *SEX_VALUES])
+        self.age_input = QComboBox()
+        self.age_input.addItems(["Any age", *AGE_BANDS])
+        filter_layout.addWidget(self.sex_input)
+        filter_layout.addWidget(self.age_input)
+        
         self.preview_scroll = QScrollArea()
         self.preview_scroll.setWidgetResizable(True)
         self.preview_scroll.setFixedHeight(120)
@@ -65,6 +102,7 @@ class SearchWidget(QWidget):
         self.preview_scroll.setWidget(self.preview_widget)
         
         main_layout.addLayout(top_layout)
+        main_layout.addLayout(filter_layout)
         main_layout.addWidget(self.preview_scroll)
         self.setLayout(main_layout)
     
@@ -80,7 +118,11 @@ class SearchWidget(QWidget):
             files = files[:MAX_IMAGES]
         
         self.chosen_paths = files
-        self.images_preview.setPlainText("\n".join(files))
+        lines = []
+        for f in files:
+            note = describe_duplicates(file_phash(f))
+            lines.append(f"{f}  — {note}" if note else f)
+        self.images_preview.setPlainText("\n".join(lines))
         
         while self.preview_layout.count():
             child = self.preview_layout.takeAt(0)
@@ -89,7 +131,7 @@ class SearchWidget(QWidget):
         
         for img_path in files:
             if Path(img_path).exists():
-                pix = QPixmap(img_path).scaled(100, 75, Qt.KeepAspectRatio)
+                pix = load_thumbnail(img_path)
                 lbl = QLabel()
                 lbl.setPixmap(pix)
                 lbl.setCursor(Qt.PointingHandCursor)
@@ -102,116 +144,154 @@ class SearchWidget(QWidget):
         viewer = ImageViewer(image_path)
         viewer.exec_()
     
+    def scan_video(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Select video", str(Path.cwd()), "Videos (*.mp4 *.avi *.mkv *.mov *.mpg *.ts)"
+        )
+        if not path:
+            return
+        self.video_dialog = VideoScanDialog(path, self.results_widget.view_post_callback, self)
+        self.video_dialog.show()
+    
+    def batch_search(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select folder of photos", str(Path.cwd()))
+        if not folder:
+            return
+        report, _ = QFileDialog.getSaveFileName(
+            self, "Save report as", str(Path(folder).parent / f"{Path(folder).name}_matches.csv"),
+            "CSV report (*.csv);;JSON report (*.json)"
+        )
+        if not report:
+            return
+        self.batch_dialog = BatchSearchDialog([folder], report, self.results_widget.view_post_callback, self)
+        self.batch_dialog.show()
+    
+    def current_filters(self):
+        """Cleaned metadata filters from the filter row (None when empty); raises ValueError"""
+        return clean_filters({
+            'date_from': self.date_from_input.text(),
+            'date_to': self.date_to_input.text(),
+            'regions': self.region_input.text().split(","),
+            'sex': self.sex_input.currentText() if self.sex_input.currentIndex() > 0 else None,
+            'age_bands': [self.age_input.currentText()] if self.age_input.currentIndex() > 0 else [],
+        })
+    
     def perform_search(self):
         if not self.chosen_paths:
             QMessageBox.warning(self, "No images", "Please choose 1 to 5 images for search.")
             return
         
-        embeddings = []
-        for i, p in enumerate(self.chosen_paths):
-            img = cv2.imread(p)
-            if img is None:
-                print(f"[WARN] Could not read {p}")
-                continue
+        try:
+            filters = self.current_filters()
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid filters", str(e))
+            return
+        if filters:
+            print(f"[INFO] Search filters: {describe_filters(filters)}")
+        
+        metrics.incr("search.requests")
+        results = []
+        with metrics.span("search", images=len(self.chosen_paths)) as op:
+            images = []
+            for p in self.chosen_paths:
+                with metrics.span("image.decode"):
+                    img = cv2.imread(p)
+                if img is None:
+                    print(f"[WARN] Could not read {p}")
+                    continue
+                images.append(img)
+            
+            embeddings = []
+            for i, (emb, _) in enumerate(get_face_embeddings_cached(images)):
+                if emb is not None:
+                    embeddings.append(emb)
+                    print(f"[INFO] Extracted embedding {i+1}/{len(images)}")
             
-            emb = get_face_embedding_from_image(img)
-            if emb is not None:
-                embeddings.append(emb)
-                print(f"[INFO] Extracted embedding {i+1}/{len(self.chosen_paths)}")
+            if embeddings:
+                if self.chroma_manager and self.chroma_manager.get_count() > 0:
+                    print(f"[INFO] Using ChromaDB for fast search with {len(embeddings)} images...")
+                    results = self._search_with_chroma(embeddings, filters)
+                else:
+                    print("[INFO] Using linear search (ChromaDB not available)")
+                    results = self._search_linear(embeddings, filters)
+                op.set(results=len(results))
+                
+                if results:
+                    self.results_widget.display_results(results)
         
         if not embeddings:
             QMessageBox.warning(self, "No faces", "No faces detected.")
             return
         
-        if self.chroma_manager and self.chroma_manager.get_count() > 0:
-            print(f"[INFO] Using ChromaDB for fast search with {len(embeddings)} images...")
-            results = self._search_with_chroma(embeddings)
-        else:
-            print("[INFO] Using linear search (ChromaDB not available)")
-            results = self._search_linear(embeddings)
-        
         if not results:
             QMessageBox.information(self, "No Matches", "No similar posts found.")
             return
-        
-        self.results_widget.display_results(results)
     
-    def _search_with_chroma(self, embeddings):
-        posts = load_posts()
-        post_dict = {p['post_id']: p for p in posts}
-        results = []
+    def _search_with_chroma(self, embeddings, filters=None):
+        def search():
+            print(f"[DEBUG] ChromaDB has {self.chroma_manager.get_count()} posts")
+            
+            ranges = self.chroma_manager.query_range(
+                embeddings, threshold=SIMILARITY_THRESHOLD, include_embeddings=VERIFY_CHROMA_SIMILARITY,
+                filters=filters
+            )
+            for i, found in enumerate(ranges):
+                print(f"[DEBUG] Image {i+1}: {len(found['post_ids'])} posts above threshold from ChromaDB")
+            
+            complete = not any(found['truncated'] for found in ranges)
+            if not complete:
+                print("[WARN] Range query hit its cap or failed; some posts above the threshold may be missing")
+            
+            with metrics.span("search.rerank"):
+                return rank_search_hits(embeddings, ranges, verify=VERIFY_CHROMA_SIMILARITY), complete
         
-        print(f"[DEBUG] ChromaDB has {self.chroma_manager.get_count()} posts")
-        print(f"[DEBUG] Total posts in JSON: {len(posts)}")
+        ranked, _ = cached_search(embeddings, SIMILARITY_THRESHOLD, filters, search)
         
-        for i, emb in enumerate(embeddings):
-            chroma_results = self.chroma_manager.query_similar(emb, n_results=100)
-            
-            if chroma_results and chroma_results.get('ids') and len(chroma_results['ids'][0]) > 0:
-                print(f"[DEBUG] Found {len(chroma_results['ids'][0])} candidate posts from ChromaDB")
-                
-                for j, post_id_str in enumerate(chroma_results['ids'][0]):
-                    post_id = int(post_id_str.split('_')[1])
-                    
-                    if post_id not in post_dict:
-                        continue
-                    
-                    post_emb = np.array(post_dict[post_id]['embedding'], dtype=np.float32)
-                    similarity = cosine_similarity(emb, post_emb)  
-                    
-                    print(f"[DEBUG] Post {post_id}: direct cosine similarity = {similarity:.4f}")
-                    
-                    if similarity >= SIMILARITY_THRESHOLD:
-                        existing = next((r for r in results if r['post']['post_id'] == post_id), None)
-                        
-                        if existing:
-                            if similarity > existing['similarity']:
-                                existing['similarity'] = similarity
-                                existing['best_image'] = i + 1
-                        else:
-                            results.append({
-                                'post': post_dict[post_id],
-                                'similarity': similarity,
-                                'best_image': i + 1
-                            })
+        page = ranked[:SEARCH_RESULTS_LIMIT]
+        posts = get_posts_by_ids([post_id for post_id, _, _ in page])
         
-        results.sort(key=lambda x: x['similarity'], reverse=True)
-        print(f"[INFO] Found {len(results)} matches using ChromaDB + direct cosine similarity")
+        results = [
+            {'post': posts[post_id], 'similarity': similarity, 'best_image': best_image}
+            for post_id, similarity, best_image in page
+            if post_id in posts
+        ]
+        print(f"[INFO] Found {len(ranked)} matches using ChromaDB distances, showing {len(results)}")
         return results
 
-    def _search_linear(self, embeddings):
-        posts = load_posts()
+    def _search_linear(self, embeddings, filters=None):
+        posts = [p for p in load_posts() if matches_filters(p, filters)]
         if not posts:
             return []
         
         results = []
         print(f"[INFO] Comparing {len(embeddings)} images with {len(posts)} posts...")
         
-        for post in posts:
-            try:
-                post_emb = np.array(post['embedding'], dtype=np.float32)
+        with metrics.span("search.rerank"):
+            for post in posts:
+                try:
+                    post_emb = np.array(post['embedding'], dtype=np.float32)
                 
-                best_sim = 0.0
-                best_img_idx = 0
+                    best_sim = 0.0
+                    best_img_idx = 0
                 
-                for i, search_emb in enumerate(embeddings):
-                    sim = cosine_similarity(search_emb, post_emb)
-                    if sim > best_sim:
-                        best_sim = sim
-                        best_img_idx = i + 1
+                    for i, search_emb in enumerate(embeddings):
+                        sim = cosine_similarity(search_emb, post_emb)
+                        if sim > best_sim:
+                            best_sim = sim
+                            best_img_idx = i + 1
                 
-                if best_sim >= SIMILARITY_THRESHOLD:
-                    results.append({
-                        'post': post,
-                        'similarity': best_sim,
-                        'best_image': best_img_idx
-                    })
+                    if best_sim >= SIMILARITY_THRESHOLD:
+                        results.append({
+                            'post': post,
+                            'similarity': best_sim,
+                            'best_image': best_img_idx
+                        })
             
-            except Exception as e:
-                print(f"[WARN] Failed to compare with post {post.get('post_id')}: {e}")
+                except Exception as e:
+                    print(f"[WARN] Failed to compare with post {post.get('post_id')}: {e}")
         
         results.sort(key=lambda x: x['similarity'], reverse=True)
-        return results
+        return results[:SEARCH_RESULTS_LIMIT]
     
     def clear_search(self):
         self.chosen_paths = []
@@ -0,0 +1,341 @@
+# ============================================================================
+# Headless Search Service (HTTP on localhost or a Unix socket)
+# ============================================================================
+#
+# Usage:
+#   python service.py                       # http://127.0.0.1:8765
+#   python service.py --unix /tmp/findme.sock
+#
+# Endpoints (JSON in, JSON out):
+#   GET    /health
+#   POST   /search        {"images": [<base64>...]} or {"paths": [...]}, optional "limit" and "filters"
+#   POST   /posts         {"post_id": 12, "paths": [...]} or {"post_id": 12, "images": [<base64>...]},
+#                         optional "metadata" (see post_metadata.py)
+#   DELETE /posts/<id>
+#
+# The GUI and the command-line tools may use the same posts and Chroma index
+# while the service runs (see store_lock.py and chroma_manager.py); face
+# inference runs on the worker pool (inference_worker.py). Concurrent
+# searches are micro-batched: query images from all waiting requests are
+# embedded together, and their embeddings go to Chroma as one batched range
+# query.
+# A batch closes when it is full or --batch-wait-ms after its first item.
+
+import argparse
+import base64
+import json
+import os
+import queue
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+import metrics
+import post_store
+from config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_BATCH_MAX, SERVICE_BATCH_WAIT_MS, SERVICE_MAX_LIMIT,
+    SEARCH_RESULTS_LIMIT, SIMILARITY_THRESHOLD, VERIFY_CHROMA_SIMILARITY
+)
+from matching import rank_search_hits
+from search_cache import cached_search
+from utils import get_posts_by_ids
+from post_metadata import clean_filters, clean_metadata
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class MicroBatcher:
+    """Feeds submitted items to process_batch(items) -> results in batches"""
+
+    def __init__(self, name, process_batch, max_batch=SERVICE_BATCH_MAX, max_wait_ms=SERVICE_BATCH_WAIT_MS):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                with metrics.span(f"batch.{self.name}", size=len(items)):
+                    results = self.process_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                print(f"[ERROR] {self.name} batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class SearchService:
+    def __init__(self, chroma_manager, max_batch=SERVICE_BATCH_MAX, max_wait_ms=SERVICE_BATCH_WAIT_MS):
+        self.chroma_manager = chroma_manager
+        self.inference = MicroBatcher("inference", self._embed_batch, max_batch, max_wait_ms)
+        self.queries = MicroBatcher("query", self._query_batch, max_batch, max_wait_ms)
+
+    def _embed_batch(self, images):
+        from face_model import get_face_embeddings_cached
+        return [emb for emb, _ in get_face_embeddings_cached(images)]
+
+    def _query_batch(self, items):
+        """items are (embedding, filters); one range query per distinct filter"""
+        groups = {}
+        for i, (_, filters) in enumerate(items):
+            groups.setdefault(json.dumps(filters, sort_keys=True), []).append(i)
+
+        results = [None] * len(items)
+        for indices in groups.values():
+            ranges = self.chroma_manager.query_range(
+                [items[i][0] for i in indices], threshold=SIMILARITY_THRESHOLD,
+                include_embeddings=VERIFY_CHROMA_SIMILARITY, filters=items[indices[0]][1]
+            )
+            for i, found in zip(indices, ranges):
+                results[i] = found
+        return results
+
+    def search(self, images, limit=SEARCH_RESULTS_LIMIT, filters=None):
+        with metrics.span("service.search", images=len(images)):
+            emb_futures = [self.inference.submit(img) for img in images]
+            embeddings = [f.result() for f in emb_futures]
+
+            image_numbers = [i + 1 for i, emb in enumerate(embeddings) if emb is not None]
+            valid = [emb for emb in embeddings if emb is not None]
+            if not valid:
+                return {'faces': 0, 'truncated': False, 'results': []}
+
+            def run_search():
+                range_futures = [self.queries.submit((emb, filters)) for emb in valid]
+                ranges = [f.result() for f in range_futures]
+                ranked = rank_search_hits(valid, ranges, verify=VERIFY_CHROMA_SIMILARITY)
+                return ranked, not any(found['truncated'] for found in ranges)
+
+            ranked, complete = cached_search(valid, SIMILARITY_THRESHOLD, filters, run_search)
+            page = ranked[:limit]
+            posts = get_posts_by_ids([post_id for post_id, _, _ in page])
+
+            return {
+                'faces': len(valid),
+                'total_matches': len(ranked),
+                'truncated': not complete,
+                'results': [
+                    {
+                        'post_id': post_id,
+                        'similarity': round(float(similarity), 4),
+                        'best_image': image_numbers[best_image - 1],
+                        'images': posts[post_id].get('images', []),
+                    }
+                    for post_id, similarity, best_image in page
+                    if post_id in posts
+                ]
+            }
+
+    def add(self, post_id, image_paths, metadata=None):
+        post = post_store.add_post(post_id, image_paths, self.chroma_manager, metadata=metadata)
+        return {'post_id': post['post_id'], 'images': post['images'], 'matches': post['matches']}
+
+    def delete(self, post_id):
+        return post_store.delete_post(post_id, self.chroma_manager)
+
+
+def decode_base64_image(data):
+    img = cv2.imdecode(np.frombuffer(base64.b64decode(data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def write_base64_images(images, folder):
+    paths = []
+    for i, data in enumerate(images):
+        raw = base64.b64decode(data)
+        ext = ".png" if raw[:8] == b"\x89PNG\r\n\x1a\n" else ".jpg"
+        path = Path(folder) / f"upload_{i}{ext}"
+        path.write_bytes(raw)
+        paths.append(str(path))
+    return paths
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args):
+        print(f"[SERVICE] {self.address_string()} {fmt % args}")
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            raise ValueError("Missing or oversized request body")
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {'status': 'ok', 'indexed_posts': self.service.chroma_manager.get_count()})
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except Exception as e:
+            self._send(400, {'error': f"Invalid JSON body: {e}"})
+            return
+
+        if self.path == "/search":
+            self._handle_search(payload)
+        elif self.path == "/posts":
+            self._handle_add(payload)
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "posts" or not parts[1].isdigit():
+            self._send(404, {'error': 'Not found'})
+            return
+
+        post_id = int(parts[1])
+        if self.service.delete(post_id):
+            self._send(200, {'deleted': post_id})
+        else:
+            self._send(404, {'error': f"Post ID {post_id} not found."})
+
+    def _handle_search(self, payload):
+        try:
+            if payload.get('images'):
+                images = [decode_base64_image(data) for data in payload['images']]
+            else:
+                images = [cv2.imread(p) for p in payload.get('paths', [])]
+                if any(img is None for img in images):
+                    raise ValueError("Could not read one of the image paths")
+            if not images:
+                raise ValueError("Provide 'images' (base64) or 'paths'")
+            limit = int(payload.get('limit', SEARCH_RESULTS_LIMIT))
+            if not 1 <= limit <= SERVICE_MAX_LIMIT:
+                raise ValueError(f"'limit' must be between 1 and {SERVICE_MAX_LIMIT}")
+            filters = clean_filters(payload.get('filters'))
+        except Exception as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            self._send(200, self.service.search(images, limit=limit, filters=filters))
+        except Exception as e:
+            print(f"[ERROR] Search failed: {e}")
+            self._send(500, {'error': str(e)})
+
+    def _handle_add(self, payload):
+        post_id = payload.get('post_id')
+        if not isinstance(post_id, int):
+            self._send(400, {'error': "post_id must be an integer"})
+            return
+        try:
+            metadata = clean_metadata(payload.get('metadata'))
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        try:
+            with tempfile.TemporaryDirectory() as upload_dir:
+                if payload.get('images'):
+                    paths = write_base64_images(payload['images'], upload_dir)
+                else:
+                    paths = [str(p) for p in payload.get('paths', [])]
+                if not paths:
+                    self._send(400, {'error': "Provide 'images' (base64) or 'paths'"})
+                    return
+                result = self.service.add(post_id, paths, metadata)
+            self._send(201, result)
+        except post_store.NoFaceError as e:
+            self._send(422, {'error': str(e)})
+        except ValueError as e:
+            self._send(409, {'error': str(e)})
+        except Exception as e:
+            print(f"[ERROR] Add failed: {e}")
+            self._send(500, {'error': str(e)})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless face search service")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--unix', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--batch-max', type=int, default=SERVICE_BATCH_MAX)
+    parser.add_argument('--batch-wait-ms', type=float, default=SERVICE_BATCH_WAIT_MS)
+    args = parser.parse_args()
+
+    from sharded_index import open_index
+    from face_model import start_inference
+
+    start_inference()
+
+    ServiceHandler.service = SearchService(open_index(), args.batch_max, args.batch_wait_ms)
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        server = UnixHTTPServer(args.unix, ServiceHandler)
+        print(f"[INFO] Service listening on unix:{args.unix}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+        server.daemon_threads = True
+        print(f"[INFO] Service listening on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+# ============================================================================
+# Sharded Index - Posts Spread over Several Chroma Stores and Processes
+# ============================================================================
+#
+# Usage:
+#   python sharded_index.py stats
+#   python sharded_index.py rebuild [--shard N]
+#
+# With CHROMA_SHARDS > 1 each post lives in shard shard_of(post_id): its own
+# persist directory under CHROMA_SHARD_DIR, served by its own process running
+# a ChromaManager. ShardedIndex has the ChromaManager interface used by the
+# rest of the app; writes go to the owning shard, queries go to every shard
+# at once and the per-shard results are merged. Each shard builds, ingests
+# and rebuilds independently, so a full rebuild uses every core. While one
+# shard is rebuilt, queries skip it and report their results as truncated.
+# A shard that keeps failing to start is restarted with a growing delay and
+# given up after SHARD_MAX_RESTARTS attempts in a row.
+#
+# open_index() returns a plain ChromaManager when CHROMA_SHARDS is 1.
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import numpy as np
+import metrics
+from config import (
+    CHROMA_SHARDS, CHROMA_SHARD_DIR, SIMILARITY_THRESHOLD, RANGE_QUERY_INITIAL_K, RANGE_QUERY_MAX_K
+)
+from model_version import get_active_version
+
+MANIFEST = "shards.json"
+MONITOR_INTERVAL_S = 1.0
+SHARD_MAX_RESTARTS = 5   # failed starts in a row before a shard is given up
+
+
+def shard_of(post_id, count):
+    """Stable shard number of a post (multiplicative hash, so runs of ids spread out)"""
+    return ((int(post_id) * 2654435761) & 0xFFFFFFFF) % count
+
+
+def _post_id(entry_id):
+    return int(entry_id.split('_')[1])
+
+
+class _InShard:
+    """post_filter for shard index of count (a class, so it can be pickled)"""
+
+    def __init__(self, index, count):
+        self.index = index
+        self.count = count
+
+    def __call__(self, post):
+        return shard_of(post['post_id'], self.count) == self.index
+
+
+def _shard_main(index, count, persist_directory, version, auto_rebuild, requests, results):
+    from chroma_manager import ChromaManager
+
+    try:
+        manager = ChromaManager(
+            persist_directory=persist_directory, version=version,
+            auto_rebuild=auto_rebuild, post_filter=_InShard(index, count)
+        )
+    except Exception as e:
+        results.put((None, index, False, f"could not open shard: {e}"))
+        return
+    results.put((None, index, True, None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, method, args, kwargs = request
+        try:
+            results.put((request_id, index, True, getattr(manager, method)(*args, **kwargs)))
+        except Exception as e:
+            results.put((request_id, index, False, str(e)))
+
+
+class ShardedIndex:
+    def __init__(self, shards=CHROMA_SHARDS, persist_directory=None, version=None, auto_rebuild=True):
+        self.count = max(1, int(shards))
+        self.root = Path(persist_directory or CHROMA_SHARD_DIR)
+        self.follow_active = version is None
+        self._version = version
+        self.auto_rebuild = auto_rebuild
+        self._check_manifest()
+
+        self.ctx = mp.get_context('spawn')
+        self.results = self.ctx.Queue()
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.pending = {}   # request_id -> (shard, future)
+        self.workers = {}
+        self.queues = {}
+        self.failures = {}    # shard -> exits since it last opened its store
+        self.down = {}        # shard -> time of its next restart (None: given up)
+        self.rebuilding = set()
+        self.closed = False
+
+        for index in range(self.count):
+            self._start_shard(index)
+
+        threading.Thread(target=self._collect, name="shard-results", daemon=True).start()
+        threading.Thread(target=self._monitor, name="shard-monitor", daemon=True).start()
+        print(f"[INFO] Sharded index: {self.count} shards in {self.root}")
+
+    @property
+    def version(self):
+        return get_active_version() if self.follow_active else self._version
+
+    def _check_manifest(self):
+        """Start over when the shard count changed, since every post would move"""
+        manifest = self.root / MANIFEST
+        try:
+            previous = json.loads(manifest.read_text(encoding='utf-8'))['count']
+        except Exception:
+            previous = None
+        if previous is not None and previous != self.count:
+            print(f"[INFO] Shard count changed {previous} -> {self.count}, rebuilding the sharded index")
+            shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(json.dumps({'count': self.count}), encoding='utf-8')
+
+    def _start_shard(self, index):
+        requests = self.ctx.Queue()
+        proc = self.ctx.Process(
+            target=_shard_main,
+            args=(index, self.count, str(self.root / f"shard_{index}"), self._version,
+                  self.auto_rebuild, requests, self.results),
+            name=f"chroma-shard-{index}",
+            daemon=True
+        )
+        proc.start()
+        self.queues[index] = requests
+        self.workers[index] = proc
+
+    def _collect(self):
+        while True:
+            try:
+                request_id, index, ok, value = self.results.get()
+            except (EOFError, OSError):
+                return
+            if request_id is None:
+                if ok:
+                    self.failures[index] = 0
+                else:
+                    print(f"[ERROR] Shard {index}: {value}")
+                continue
+            with self.lock:
+                entry = self.pending.pop(request_id, None)
+            if entry is None:
+                continue
+            if ok:
+                entry[1].set_result(value)
+            else:
+                entry[1].set_exception(RuntimeError(f"shard {index}: {value}"))
+
+    def _monitor(self):
+        while not self.closed:
+            time.sleep(MONITOR_INTERVAL_S)
+            for index, proc in list(self.workers.items()):
+                if self.closed:
+                    break
+                if index in self.down:
+                    restart_at = self.down[index]
+                    if restart_at is not None and time.monotonic() >= restart_at:
+                        with self.lock:
+                            del self.down[index]
+                            self._start_shard(index)
+                    continue
+                if proc.is_alive():
+                    continue
+
+                failures = self.failures.get(index, 0) + 1
+                self.failures[index] = failures
+                with self.lock:
+                    failed = [rid for rid, (shard, _) in self.pending.items() if shard == index]
+                    entries = [self.pending.pop(rid) for rid in failed]
+                    if failures >= SHARD_MAX_RESTARTS:
+                        self.down[index] = None
+                    else:
+                        self.down[index] = time.monotonic() + MONITOR_INTERVAL_S * 2 ** (failures - 1)
+                if self.down[index] is None:
+                    print(f"[ERROR] Shard {index} exited {failures} times in a row, giving up on it; "
+                          f"searches report truncated results until the app is restarted")
+                else:
+                    print(f"[WARN] Shard {index} exited with code {proc.exitcode}, restarting in "
+                          f"{MONITOR_INTERVAL_S * 2 ** (failures - 1):.0f}s")
+                for _, future in entries:
+                    future.set_exception(RuntimeError(f"shard {index} crashed"))
+
+    def _call(self, index, method, *args, **kwargs):
+        future = Future()
+        request_id = next(self.ids)
+        with self.lock:
+            if index in self.down:
+                future.set_exception(RuntimeError(f"shard {index} is not running"))
+                return future
+            self.pending[request_id] = (index, future)
+            self.queues[index].put((request_id, method, args, kwargs))
+        return future
+
+    def _call_all(self, method, *args, **kwargs):
+        futures = [self._call(index, method, *args, **kwargs) for index in range(self.count)]
+        return [f.result() for f in futures]
+
+    def _by_shard(self, ids):
+        groups = {}
+        for i, entry_id in enumerate(ids):
+            groups.setdefault(shard_of(_post_id(entry_id), self.count), []).append(i)
+        return groups
+
+    # --- ChromaManager interface -------------------------------------------
+
+    def get_count(self) -> int:
+        try:
+            return sum(self._call_all('get_count'))
+        except Exception as e:
+            print(f"[ERROR] Sharded count failed: {e}")
+            return 0
+
+    def get_all_ids(self):
+        return [entry_id for ids in self._call_all('get_all_ids') for entry_id in ids]
+
+    def add_post(self, post_id: int, embedding: np.ndarray, metadata: dict = None):
+        return self._call(shard_of(post_id, self.count), 'add_post', post_id, embedding, metadata).result()
+
+    def delete_post(self, post_id: int):
+        return self._call(shard_of(post_id, self.count), 'delete_post', post_id).result()
+
+    def add_embeddings(self, ids, embeddings, metadatas, upsert=False):
+        futures = [
+            self._call(index, 'add_embeddings', [ids[i] for i in rows], [embeddings[i] for i in rows],
+                       [metadatas[i] for i in rows], upsert=upsert)
+            for index, rows in self._by_shard(ids).items()
+        ]
+        for f in futures:
+            f.result()
+
+    def delete_ids(self, ids):
+        futures = [
+            self._call(index, 'delete_ids', [ids[i] for i in rows])
+            for index, rows in self._by_shard(ids).items()
+        ]
+        for f in futures:
+            f.result()
+
+    def query_range(self, query_embeddings, threshold: float = SIMILARITY_THRESHOLD,
+                    initial_k: int = RANGE_QUERY_INITIAL_K, max_k: int = RANGE_QUERY_MAX_K,
+                    include_embeddings: bool = False, filters=None):
+        """ChromaManager.query_range on every shard at once, merged by similarity"""
+        queries = [np.asarray(emb, dtype=np.float32) for emb in query_embeddings]
+        results = [
+            {'post_ids': [], 'similarities': [], 'embeddings': [], 'truncated': False, 'failed': False}
+            for _ in queries
+        ]
+        if not queries:
+            return results
+
+        with metrics.span("shards.query", shards=self.count, queries=len(queries)):
+            # A shard being rebuilt answers nothing until it is done, so it is left out
+            skipped = set(self.rebuilding)
+            futures = [
+                (index, self._call(index, 'query_range', queries, threshold=threshold, initial_k=initial_k,
+                                   max_k=max_k, include_embeddings=include_embeddings, filters=filters))
+                for index in range(self.count) if index not in skipped
+            ]
+            parts = []
+            failed = bool(skipped)
+            for index, f in futures:
+                try:
+                    parts.append(f.result())
+                except Exception as e:
+                    print(f"[ERROR] Range query on shard {index} failed: {e}")
+                    failed = True
+
+        for qi, out in enumerate(results):
+            out['truncated'] = out['failed'] = failed
+            hits = []
+            for part in parts:
+                found = part[qi]
+                out['truncated'] = out['truncated'] or found['truncated']
+                out['failed'] = out['failed'] or found['failed']
+                for j, post_id in enumerate(found['post_ids']):
+                    hits.append((found['similarities'][j], post_id,
+                                 found['embeddings'][j] if include_embeddings else None))
+            hits.sort(key=lambda h: h[0], reverse=True)
+            out['post_ids'] = [post_id for _, post_id, _ in hits]
+            out['similarities'] = [similarity for similarity, _, _ in hits]
+            if include_embeddings:
+                out['embeddings'] = [emb for _, _, emb in hits]
+        return results
+
+    def set_search_ef(self, search_ef: int):
+        return all(self._call_all('set_search_ef', search_ef))
+
+    def rebuild_from_posts(self):
+        self._call_all('rebuild_from_posts')
+
+    def force_rebuild(self):
+        """Rebuild every shard from posts.json, all in parallel"""
+        self._call_all('force_rebuild')
+
+    def rebuild_shard(self, index):
+        """Rebuild one shard; meanwhile queries skip it and are marked truncated"""
+        self.rebuilding.add(index)
+        try:
+            self._call(index, 'force_rebuild').result()
+        finally:
+            self.rebuilding.discard(index)
+
+    def drop(self):
+        self._call_all('drop')
+
+    def reset(self):
+        self._call_all('reset')
+
+    def shard_counts(self):
+        return self._call_all('get_count')
+
+    def shutdown(self):
+        self.closed = True
+        for requests in self.queues.values():
+            requests.put(None)
+        for proc in self.workers.values():
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+
+
+def open_index(version=None, auto_rebuild=True):
+    """The app's vector index: sharded if CHROMA_SHARDS > 1, else a single ChromaManager"""
+    if CHROMA_SHARDS > 1:
+        return ShardedIndex(version=version, auto_rebuild=auto_rebuild)
+    from chroma_manager import ChromaManager
+    return ChromaManager(version=version, auto_rebuild=auto_rebuild)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or rebuild the sharded Chroma index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats')
+    rebuild = sub.add_parser('rebuild')
+    rebuild.add_argument('--shard', type=int, help="rebuild only this shard")
+    args = parser.parse_args()
+
+    if CHROMA_SHARDS <= 1:
+        print("[INFO] CHROMA_SHARDS is 1 (set FINDME_CHROMA_SHARDS); the index is not sharded")
+        return
+
+    index = ShardedIndex()
+    try:
+        if args.command == 'rebuild':
+            start = time.perf_counter()
+            if args.shard is not None:
+                index.rebuild_shard(args.shard)
+            else:
+                index.force_rebuild()
+            print(f"[INFO] Rebuilt in {time.perf_counter() - start:.1f}s")
+        for i, count in enumerate(index.shard_counts()):
+            print(f"Shard {i}: {count} posts")
+    finally:
+        index.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+# ============================================================================
+# Index Snapshots - Binary Export/Import of the Post Database
+# ============================================================================
+#
+# Usage:
+#   python snapshot.py export db.snap
+#   python snapshot.py export changes.snap --base db.snap
+#   python snapshot.py import db.snap [--force]
+#   python snapshot.py info db.snap
+#
+# A snapshot is one file: a 4 KiB header (magic, then JSON padded with spaces)
+# followed by the embeddings as one packed float32 matrix, the post ids as
+# int64, the ids of deleted posts as int64, the posts (without their
+# embeddings) as JSON, and the id and SHA-1 fingerprint of every post in the
+# database at export time. The header carries the offsets of each section and
+# a SHA-256 of everything after it. The matrix is memory-mapped on load and
+# goes to add_embeddings and posts.json as whole rows, never as a list of
+# Python floats per post.
+#
+# A delta snapshot (--base) holds only the posts added or changed since the
+# base snapshot (found by comparing with the base's fingerprints), plus the
+# ids of posts deleted since. It can only be imported on a replica whose last
+# imported or exported snapshot is that base.
+#
+# Snapshots carry no images; copy the image store (KNOWN_DIR) separately.
+
+import argparse
+import hashlib
+import json
+import struct
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import numpy as np
+import metrics
+import search_cache
+from config import SNAPSHOT_STATE_JSON
+from model_version import get_active_model, get_active_version, set_active_model, post_version
+from post_metadata import chroma_metadata
+
+MAGIC = b"FMSNAP01"
+FORMAT = 2
+READABLE_FORMATS = (1, 2)   # format 1 kept its fingerprints in a <snapshot>.fp.json sidecar
+FINGERPRINT_BYTES = 20
+HEADER_SIZE = 4096
+_LENGTH = struct.Struct("<I")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def _fingerprint(post, embedding):
+    """SHA-1 of everything stored for a post, to tell changed posts in a delta"""
+    digest = hashlib.sha1(json.dumps({k: v for k, v in post.items() if k != 'embedding'},
+                                     sort_keys=True).encode('utf-8'))
+    digest.update(np.asarray(embedding, dtype='<f4').tobytes())
+    return digest.digest()
+
+
+def _file_sha256(path, offset):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_state():
+    try:
+        with open(SNAPSHOT_STATE_JSON, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_state(header):
+    with open(SNAPSHOT_STATE_JSON, 'w') as f:
+        json.dump({'snapshot_id': header['snapshot_id'], 'kind': header['kind'],
+                   'updated': datetime.now().isoformat(timespec='seconds')}, f, indent=2)
+
+
+class Snapshot:
+    """An opened snapshot file; embeddings is a read-only memory map"""
+
+    def __init__(self, path, verify=True):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            head = f.read(HEADER_SIZE)
+        if len(head) < HEADER_SIZE or head[:len(MAGIC)] != MAGIC:
+            raise SnapshotError(f"{self.path} is not a snapshot file")
+        (length,) = _LENGTH.unpack_from(head, len(MAGIC))
+        start = len(MAGIC) + _LENGTH.size
+        self.header = json.loads(head[start:start + length].decode('utf-8'))
+        if self.header.get('format') not in READABLE_FORMATS:
+            raise SnapshotError(f"Unsupported snapshot format {self.header.get('format')}")
+        if verify and _file_sha256(self.path, HEADER_SIZE) != self.header['sha256']:
+            raise SnapshotError(f"{self.path} is corrupt (checksum mismatch)")
+
+        sections = self.header['sections']
+        count, dim = self.header['count'], self.header['dim']
+        self.embeddings = np.memmap(self.path, dtype='<f4', mode='r',
+                                    offset=sections['embeddings'][0], shape=(count, dim)) if count and dim \
+            else np.zeros((0, dim), dtype=np.float32)
+        self.post_ids = self._array(sections['post_ids'], '<i8')
+        self.deleted_ids = self._array(sections['deleted_ids'], '<i8')
+
+    def _array(self, section, dtype):
+        offset, size = section
+        if size == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=(size // np.dtype(dtype).itemsize,))
+
+    def posts(self):
+        """Post dicts without embeddings, in matrix row order"""
+        offset, size = self.header['sections']['posts']
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(size).decode('utf-8'))
+
+    def fingerprints(self):
+        """post_id -> fingerprint of every post in the database when this snapshot was exported"""
+        sections = self.header['sections']
+        if 'fingerprints' not in sections:
+            sidecar = Path(str(self.path) + ".fp.json")
+            try:
+                with open(sidecar, 'r') as f:
+                    return {int(k): v for k, v in json.load(f).items()}
+            except Exception:
+                raise SnapshotError(f"{self.path} has no fingerprints to take a delta against ({sidecar.name} missing)")
+        ids = self._array(sections['fingerprint_ids'], '<i8')
+        offset, size = sections['fingerprints']
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            blob = f.read(size)
+        return {int(post_id): blob[i * FINGERPRINT_BYTES:(i + 1) * FINGERPRINT_BYTES] for i, post_id in enumerate(ids)}
+
+
+def write_snapshot(path, posts, deleted_ids=(), base=None, fingerprints=None):
+    """Write posts (full, or a delta against base) to path; returns the header.
+
+    fingerprints ({post_id: 20-byte SHA-1}) describe the whole database, so
+    the next delta can be taken against this file.
+    """
+    active = get_active_model()
+    dims = {len(p['embedding']) for p in posts}
+    if len(dims) > 1:
+        raise SnapshotError(f"Posts have embeddings of different sizes {sorted(dims)}; finish re-embedding first")
+    dim = dims.pop() if dims else 0
+
+    matrix = np.asarray([p['embedding'] for p in posts], dtype='<f4').reshape(len(posts), dim)
+    post_ids = np.asarray([p['post_id'] for p in posts], dtype='<i8')
+    deleted = np.asarray(sorted(deleted_ids), dtype='<i8')
+    bodies = json.dumps([{k: v for k, v in p.items() if k != 'embedding'} for p in posts]).encode('utf-8')
+    fingerprints = fingerprints or {}
+    fingerprint_ids = np.asarray(sorted(fingerprints), dtype='<i8')
+    blobs = (
+        ('embeddings', matrix.tobytes()),
+        ('post_ids', post_ids.tobytes()),
+        ('deleted_ids', deleted.tobytes()),
+        ('posts', bodies),
+        ('fingerprint_ids', fingerprint_ids.tobytes()),
+        ('fingerprints', b"".join(fingerprints[int(i)] for i in fingerprint_ids)),
+    )
+
+    sections = {}
+    offset = HEADER_SIZE
+    for name, blob in blobs:
+        sections[name] = (offset, len(blob))
+        offset += len(blob)
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    digest = hashlib.sha256()
+    with open(tmp_path, 'wb') as f:
+        f.write(b"\0" * HEADER_SIZE)
+        for _, blob in blobs:
+            f.write(blob)
+            digest.update(blob)
+
+        header = {
+            'format': FORMAT,
+            'kind': 'delta' if base is not None else 'full',
+            'snapshot_id': uuid.uuid4().hex[:16],
+            'base_id': base.header['snapshot_id'] if base is not None else None,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'embedding_version': active['version'],
+            'model': active['model'],
+            'dim': dim,
+            'count': len(posts),
+            'deleted': len(deleted),
+            'sections': sections,
+            'sha256': digest.hexdigest(),
+        }
+        encoded = json.dumps(header).encode('utf-8')
+        if len(MAGIC) + _LENGTH.size + len(encoded) > HEADER_SIZE:
+            raise SnapshotError("Snapshot header too large")
+        f.seek(0)
+        f.write(MAGIC + _LENGTH.pack(len(encoded)) + encoded.ljust(HEADER_SIZE - len(MAGIC) - _LENGTH.size))
+    tmp_path.replace(path)
+    return header
+
+
+def export_snapshot(path, base_path=None):
+    """Export posts.json (or what changed since base_path) to a snapshot file"""
+    from utils import load_posts
+
+    posts = load_posts()
+    fingerprints = {p['post_id']: _fingerprint(p, p['embedding']) for p in posts}
+
+    base = None
+    changed, deleted = posts, []
+    if base_path:
+        base = Snapshot(base_path)
+        previous = base.fingerprints()
+        changed = [p for p in posts if previous.get(p['post_id']) != fingerprints[p['post_id']]]
+        deleted = [post_id for post_id in previous if post_id not in fingerprints]
+
+    header = write_snapshot(path, changed, deleted, base, fingerprints)
+    _save_state(header)
+    return header
+
+
+def _index_rows(chroma_manager, snap, posts, rows):
+    """Add matrix rows of the active embedding version to the index"""
+    version = snap.header['embedding_version']
+    if version != get_active_version():
+        print(f"[WARN] Snapshot embeddings are {version} but {get_active_version()} is active; "
+              f"not indexing them (re-embed them with reembed.py)")
+        return 0
+    rows = [i for i in rows if post_version(posts[i]) == version]
+    if rows:
+        chroma_manager.add_embeddings(
+            [f"post_{posts[i]['post_id']}" for i in rows],
+            np.asarray(snap.embeddings[rows], dtype=np.float32),
+            [chroma_metadata(posts[i]) for i in rows],
+            upsert=True
+        )
+    return len(rows)
+
+
+def _merged_matrix(posts, snap_rows, snap):
+    """Embedding matrix for posts: rows of the snapshot where given, else the post's own list"""
+    matrix = np.empty((len(posts), snap.header['dim']), dtype=np.float32)
+    for i, post in enumerate(posts):
+        matrix[i] = snap.embeddings[snap_rows[i]] if i in snap_rows else post['embedding']
+    return matrix
+
+
+def import_snapshot(path, chroma_manager=None, force=False):
+    """Load a full or delta snapshot into posts.json and the vector index; returns the header"""
+    import clusters
+    from post_store import _store_lock
+    from utils import load_posts, save_posts
+
+    snap = Snapshot(path)
+    header = snap.header
+    snap_posts = snap.posts()
+
+    with _store_lock:
+        if header['kind'] == 'delta':
+            state = load_state()
+            if state.get('snapshot_id') != header['base_id'] and not force:
+                raise SnapshotError(
+                    f"Delta is against snapshot {header['base_id']} but this database is at "
+                    f"{state.get('snapshot_id') or 'no snapshot'}; import the base first"
+                )
+            replaced = {p['post_id'] for p in snap_posts} | {int(i) for i in snap.deleted_ids}
+            kept = [p for p in load_posts(strict=True) if p['post_id'] not in replaced]
+            merged = kept + snap_posts
+            order = sorted(range(len(merged)), key=lambda i: merged[i]['post_id'])
+            posts = [merged[i] for i in order]
+            snap_rows = {new: old - len(kept) for new, old in enumerate(order) if old >= len(kept)}
+            if chroma_manager is not None and replaced:
+                chroma_manager.delete_ids([f"post_{post_id}" for post_id in replaced])
+        else:
+            posts = snap_posts
+            snap_rows = {i: i for i in range(len(posts))}
+            if get_active_model()['version'] != header['embedding_version']:
+                set_active_model(header['embedding_version'], header['model'])
+            if chroma_manager is not None:
+                # Switches to the snapshot version first, so only its collection is emptied
+                chroma_manager.reset()
+
+        indexed = 0
+        if chroma_manager is not None:
+            with metrics.span("snapshot.index", posts=len(snap_posts)):
+                indexed = _index_rows(chroma_manager, snap, snap_posts, range(len(snap_posts)))
+
+        with metrics.span("snapshot.save_posts", posts=len(posts)):
+            try:
+                matrix = _merged_matrix(posts, snap_rows, snap)
+            except ValueError:
+                # Kept posts of an older model with another embedding size
+                for new, old in snap_rows.items():
+                    posts[new]['embedding'] = snap.embeddings[old].tolist()
+                matrix = None
+            save_posts(posts, matrix)
+        search_cache.bump_generation()
+        clusters.note_posts_changed(posts)
+        _save_state(header)
+
+    print(f"[INFO] Imported {header['kind']} snapshot {header['snapshot_id']}: {len(snap_posts)} posts, "
+          f"{len(snap.deleted_ids)} deleted, {indexed} indexed")
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a binary snapshot of the post database")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export')
+    export.add_argument('path')
+    export.add_argument('--base', help="write only the changes since this earlier snapshot")
+    load = sub.add_parser('import')
+    load.add_argument('path')
+    load.add_argument('--force', action='store_true', help="apply a delta even if its base does not match")
+    info = sub.add_parser('info')
+    info.add_argument('path')
+    args = parser.parse_args()
+
+    try:
+        start = time.perf_counter()
+        if args.command == 'export':
+            header = export_snapshot(args.path, args.base)
+            print(f"[INFO] Wrote {header['kind']} snapshot {header['snapshot_id']}: {header['count']} posts, "
+                  f"{header['deleted']} deleted, in {time.perf_counter() - start:.2f}s")
+        elif args.command == 'import':
+            from sharded_index import open_index
+            index = open_index(auto_rebuild=False)
+            try:
+                import_snapshot(args.path, index, force=args.force)
+            finally:
+                if hasattr(index, 'shutdown'):
+                    index.shutdown()
+            print(f"[INFO] Import took {time.perf_counter() - start:.2f}s")
+        else:
+            header = Snapshot(args.path).header
+            print(json.dumps({k: v for k, v in header.items() if k != 'sections'}, indent=2))
+    except SnapshotError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
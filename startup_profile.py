@@ -0,0 +1,54 @@
+# ============================================================================
+# Startup Profile - Where Application Launch Time Goes
+# ============================================================================
+#
+#   with startup_profile.stage("import widgets"):
+#       ...
+#   startup_profile.mark("window shown")
+#   print(startup_profile.report())
+#
+# Times are measured from the import of this module (the first thing main.py
+# does), so interpreter start-up itself is not included. Stages may run on
+# any thread; the report lists them in start order with the thread name.
+#
+#   python main.py --startup-report    prints the report and exits once loaded
+
+import threading
+import time
+from contextlib import contextmanager
+
+_START = time.perf_counter()
+_events = []   # (name, start, duration or None for a mark, thread name)
+_lock = threading.Lock()
+
+
+def elapsed():
+    return time.perf_counter() - _START
+
+
+@contextmanager
+def stage(name):
+    start = elapsed()
+    try:
+        yield
+    finally:
+        with _lock:
+            _events.append((name, start, elapsed() - start, threading.current_thread().name))
+
+
+def mark(name):
+    """Record a point in time, e.g. the window becoming visible"""
+    with _lock:
+        _events.append((name, elapsed(), None, threading.current_thread().name))
+
+
+def report():
+    with _lock:
+        events = sorted(_events, key=lambda e: e[1])
+    lines = ["Startup profile (seconds since launch):"]
+    for name, start, duration, thread in events:
+        if duration is None:
+            lines.append(f"  {start:7.3f}  * {name}")
+        else:
+            lines.append(f"  {start:7.3f}  {duration:7.3f}s  {name}  [{thread}]")
+    return "\n".join(lines)
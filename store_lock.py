@@ -0,0 +1,95 @@
+# ============================================================================
+# Store Lock - One Writer across Threads and Processes
+# ============================================================================
+#
+# The GUI, the headless service, reembed.py and snapshot.py all read, modify
+# and save posts.json, the perceptual-hash index and the face-chip store. A
+# threading lock only orders the threads of one process, so every such
+# read-modify-write runs under this lock: a thread lock plus an exclusive OS
+# lock (flock, or msvcrt.locking on Windows) on STORE_LOCK_PATH.
+#
+# The lock is re-entrant within a process. Whoever holds it must re-read the
+# stores from disk before changing them (load_posts, refresh()), as another
+# process may have saved since they were loaded.
+
+import os
+import threading
+import metrics
+from config import STORE_LOCK_PATH
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after ~10s; keep waiting
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+_lock = None
+_lock_guard = threading.Lock()
+
+
+class StoreLock:
+    def __init__(self, path=STORE_LOCK_PATH, span="store.lock_wait"):
+        self.path = path
+        self.span = span
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def acquire(self):
+        with metrics.span(self.span):
+            self.thread_lock.acquire()
+            if self.depth == 0:
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self.file = open(self.path, 'a+b')
+                    _lock_file(self.file)
+                except Exception:
+                    if self.file is not None:
+                        self.file.close()
+                        self.file = None
+                    self.thread_lock.release()
+                    raise
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            try:
+                _unlock_file(self.file)
+            finally:
+                self.file.close()
+                self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def get_store_lock():
+    global _lock
+    with _lock_guard:
+        if _lock is None:
+            _lock = StoreLock()
+        return _lock
@@ -3,23 +3,104 @@
 # ============================================================================
 
 import json
+import os
+import threading
+import time
 import numpy as np
+import metrics
 from config import POSTS_JSON
 
+REPLACE_ATTEMPTS = 20
 
-def load_posts():
+_posts_index = {'key': None, 'index': {}}
+_posts_index_lock = threading.Lock()
+
+
+def load_posts(strict=False):
+    """Posts of posts.json; [] if it is missing or unreadable, unless strict (then it raises).
+
+    Writers load strictly: saving what a failed read returned would erase the database.
+    """
     if not POSTS_JSON.exists():
         return []
     try:
-        with open(POSTS_JSON, 'r') as f:
-            return json.load(f)
-    except:
+        with metrics.span("store.load_posts"):
+            with open(POSTS_JSON, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        if strict:
+            raise RuntimeError(f"Could not read {POSTS_JSON}: {e}") from e
+        print(f"[ERROR] Could not read {POSTS_JSON}: {e}")
         return []
 
 
-def save_posts(posts):
-    with open(POSTS_JSON, 'w') as f:
-        json.dump(posts, f, indent=2)
+def posts_signature():
+    """(mtime_ns, size) of posts.json, or None if it does not exist"""
+    try:
+        stat = POSTS_JSON.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_posts_index():
+    """post_id -> post, re-read only when posts.json changes. Treat as read-only."""
+    key = posts_signature()
+    if key is None:
+        return {}
+
+    with _posts_index_lock:
+        if _posts_index['key'] == key:
+            return _posts_index['index']
+
+        posts = load_posts()
+        index = {p['post_id']: p for p in posts if 'post_id' in p}
+        if posts:
+            _posts_index['key'] = key
+            _posts_index['index'] = index
+        return index
+
+
+def get_posts_by_ids(post_ids):
+    index = load_posts_index()
+    return {pid: index[pid] for pid in post_ids if pid in index}
+
+
+def save_posts(posts, embeddings=None):
+    """Write posts.json atomically: readers see the old or the new file, never a partial one.
+
+    embeddings, if given, is a float32 matrix with one row per post that is
+    written in place of the posts' 'embedding' lists, one format call per row
+    ('%.9g' is exact for float32) instead of one json float at a time.
+    """
+    with metrics.span("store.save_posts"):
+        tmp_path = f"{POSTS_JSON}.tmp"
+        with open(tmp_path, 'w') as f:
+            if embeddings is None:
+                json.dump(posts, f, indent=2)
+            else:
+                _write_posts_rows(f, posts, embeddings)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(REPLACE_ATTEMPTS):
+            try:
+                os.replace(tmp_path, POSTS_JSON)
+                return
+            except PermissionError:
+                # Windows refuses while a reader has the file open
+                if attempt == REPLACE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.05)
+
+
+def _write_posts_rows(f, posts, embeddings):
+    row_format = ",".join(["%.9g"] * embeddings.shape[1])
+    f.write("[")
+    for i, (post, row) in enumerate(zip(posts, embeddings)):
+        body = json.dumps({k: v for k, v in post.items() if k != 'embedding'})
+        f.write(("\n" if i == 0 else ",\n") + body[:-1] + (", " if len(body) > 2 else "")
+                + '"embedding": [' + row_format % tuple(row.tolist()) + "]}")
+    f.write("\n]\n")
 
 
 def cosine_similarity(a, b):
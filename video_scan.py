@@ -0,0 +1,267 @@
+# ============================================================================
+# Video Scan - Match Faces in Footage against the Database
+# ============================================================================
+#
+# Usage:
+#   python video_scan.py footage.mp4 [--fps 5] [--jsonl] [--snapshots DIR]
+#
+# Frames are sampled at VIDEO_SAMPLE_FPS; a sampled frame that barely differs
+# from the previous one is skipped. Only the detector runs per frame: boxes
+# are linked into tracks by overlap, and each track is embedded once, from its
+# best (highest score x size) aligned chip, after VIDEO_TRACK_MIN_HITS
+# detections or when it ends. Track embeddings go to Chroma in batches and
+# matches are reported as soon as their batch is queried.
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+import metrics
+from config import (
+    SIMILARITY_THRESHOLD, CHIP_SIZE, VIDEO_SAMPLE_FPS, VIDEO_FRAME_DIFF_THRESHOLD,
+    VIDEO_MIN_DET_SCORE, VIDEO_TRACK_IOU, VIDEO_TRACK_MAX_GAP_S, VIDEO_TRACK_MIN_HITS,
+    VIDEO_EMBED_BATCH
+)
+from matching import rank_search_hits
+from post_metadata import add_filter_arguments, filters_from_args
+
+MAX_MATCHES_PER_TRACK = 5
+DIFF_SIZE = (160, 90)
+DIFF_GRID = (16, 9)
+PROGRESS_INTERVAL_S = 1.0
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(max(0.0, seconds), 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:04.1f}"
+
+
+def box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, bbox, t):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.first_seen = t
+        self.last_seen = t
+        self.hits = 0
+        self.best_quality = -1.0
+        self.chip = None
+        self.embedded = False
+
+
+class VideoScanner:
+    def __init__(self, chroma_manager, app=None, sample_fps=VIDEO_SAMPLE_FPS, snapshot_dir=None, filters=None):
+        from face_model import get_face_app
+
+        self.chroma_manager = chroma_manager
+        self.app = app or get_face_app()
+        if self.app is None:
+            raise RuntimeError("Face model could not be loaded")
+        self.sample_fps = sample_fps
+        self.snapshot_dir = snapshot_dir
+        self.filters = filters
+        self.stats = {}
+
+    def _detect(self, frame):
+        bboxes, kpss = self.app.det_model.detect(frame, max_num=0, metric='default')
+        faces = []
+        for i in range(bboxes.shape[0]):
+            if bboxes[i, 4] >= VIDEO_MIN_DET_SCORE and kpss is not None:
+                faces.append((bboxes[i, :4].astype(np.float32), float(bboxes[i, 4]), kpss[i]))
+        return faces
+
+    def _update_tracks(self, tracks, faces, frame, t):
+        from insightface.utils import face_align
+
+        pairs = sorted(
+            ((box_iou(track.bbox, bbox), tid, fi) for tid, track in tracks.items() for fi, (bbox, _, _) in enumerate(faces)),
+            reverse=True
+        )
+        assigned = {}
+        used_tracks = set()
+        for iou, tid, fi in pairs:
+            if iou < VIDEO_TRACK_IOU:
+                break
+            if tid in used_tracks or fi in assigned:
+                continue
+            assigned[fi] = tid
+            used_tracks.add(tid)
+
+        for fi, (bbox, score, kps) in enumerate(faces):
+            tid = assigned.get(fi)
+            if tid is None:
+                tid = self._next_track_id
+                self._next_track_id += 1
+                tracks[tid] = Track(tid, bbox, t)
+                self.stats['tracks'] += 1
+            track = tracks[tid]
+            track.bbox = bbox
+            track.last_seen = t
+            track.hits += 1
+
+            quality = score * np.sqrt(max(1.0, (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])))
+            if not track.embedded and quality > track.best_quality:
+                track.best_quality = quality
+                track.chip = face_align.norm_crop(frame, landmark=kps, image_size=CHIP_SIZE)
+
+    def _embed_and_match(self, ready):
+        """Embed a batch of tracks and return their match events"""
+        from face_model import embed_chips
+
+        with metrics.span("video.embed_match", tracks=len(ready)):
+            embeddings = embed_chips(np.stack([track.chip for track in ready]), app=self.app)
+            ranges = self.chroma_manager.query_range(list(embeddings), threshold=SIMILARITY_THRESHOLD, filters=self.filters)
+
+        self.stats['embedded'] += len(ready)
+        events = []
+        for track, emb, found in zip(ready, embeddings, ranges):
+            track.embedded = True
+            snapshot = None
+            if self.snapshot_dir:
+                snapshot = os.path.join(self.snapshot_dir, f"track_{track.track_id:05d}.jpg")
+                cv2.imwrite(snapshot, track.chip)
+            track.chip = None
+
+            for post_id, similarity, _ in rank_search_hits([emb], [found], verify=False)[:MAX_MATCHES_PER_TRACK]:
+                events.append({
+                    'time': round(track.first_seen, 2),
+                    'time_str': format_time(track.first_seen),
+                    'track': track.track_id,
+                    'post_id': post_id,
+                    'similarity': round(float(similarity), 4),
+                    'snapshot': snapshot,
+                })
+        self.stats['matches'] += len(events)
+        return events
+
+    def scan(self, video_path, on_progress=None):
+        """Yield match events while reading the video; self.stats is filled as it goes"""
+        cap = cv2.VideoCapture(str(video_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video {video_path}")
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps / self.sample_fps)))
+        self.stats = {
+            'fps': fps, 'frames': 0, 'sampled': 0, 'repeats': 0, 'detections': 0,
+            'tracks': 0, 'embedded': 0, 'matches': 0, 'video_seconds': 0.0, 'elapsed': 0.0,
+            'duration': (cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) / fps,
+        }
+        self._next_track_id = 1
+        tracks = {}
+        ready = []
+        last_small = None
+        start = time.perf_counter()
+        last_progress = start
+
+        try:
+            frame_index = -1
+            while True:
+                frame_index += 1
+                # grab() skips the colour conversion of frames that are not sampled
+                if not cap.grab():
+                    break
+                self.stats['frames'] += 1
+                if frame_index % step:
+                    continue
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+
+                t = frame_index / fps
+                self.stats['sampled'] += 1
+                self.stats['video_seconds'] = t
+
+                # Compare per grid cell, so one small face moving in a wide shot still counts
+                small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), DIFF_SIZE, interpolation=cv2.INTER_AREA)
+                repeat = False
+                if last_small is not None:
+                    cells = cv2.resize(cv2.absdiff(small, last_small), DIFF_GRID, interpolation=cv2.INTER_AREA)
+                    repeat = cells.max() < VIDEO_FRAME_DIFF_THRESHOLD
+                if repeat:
+                    self.stats['repeats'] += 1
+                    for track in tracks.values():
+                        track.last_seen = t
+                else:
+                    last_small = small
+                    with metrics.span("video.detect"):
+                        faces = self._detect(frame)
+                    self.stats['detections'] += len(faces)
+                    self._update_tracks(tracks, faces, frame, t)
+
+                for tid in list(tracks):
+                    track = tracks[tid]
+                    ended = t - track.last_seen > VIDEO_TRACK_MAX_GAP_S
+                    if not track.embedded and track.chip is not None and (ended or track.hits >= VIDEO_TRACK_MIN_HITS):
+                        ready.append(track)
+                        track.embedded = True
+                    if ended:
+                        del tracks[tid]
+
+                if len(ready) >= VIDEO_EMBED_BATCH:
+                    yield from self._embed_and_match(ready)
+                    ready = []
+                now = time.perf_counter()
+                self.stats['elapsed'] = now - start
+                if on_progress and now - last_progress >= PROGRESS_INTERVAL_S:
+                    last_progress = now
+                    on_progress(self.stats)
+
+            ready.extend(track for track in tracks.values() if not track.embedded and track.chip is not None)
+            if ready:
+                yield from self._embed_and_match(ready)
+        finally:
+            cap.release()
+            self.stats['elapsed'] = time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan a video file for faces in the database")
+    parser.add_argument('video')
+    parser.add_argument('--fps', type=float, default=VIDEO_SAMPLE_FPS, help="sampled frames per second of video")
+    parser.add_argument('--jsonl', action='store_true', help="print one JSON object per match/progress line")
+    parser.add_argument('--snapshots', help="write each track's face chip to this folder")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    from sharded_index import open_index
+
+    if args.snapshots:
+        os.makedirs(args.snapshots, exist_ok=True)
+    scanner = VideoScanner(open_index(), sample_fps=args.fps, snapshot_dir=args.snapshots,
+                           filters=filters_from_args(args))
+
+    on_progress = (lambda stats: print(json.dumps({'progress': stats}), flush=True)) if args.jsonl else None
+    for event in scanner.scan(args.video, on_progress=on_progress):
+        if args.jsonl:
+            print(json.dumps({'match': event}), flush=True)
+        else:
+            print(f"[MATCH] {event['time_str']} track {event['track']} -> post {event['post_id']} "
+                  f"(similarity {event['similarity']:.4f})", flush=True)
+
+    stats = scanner.stats
+    if args.jsonl:
+        print(json.dumps({'done': stats}), flush=True)
+    speed = stats['video_seconds'] / stats['elapsed'] if stats['elapsed'] else 0.0
+    print(f"[INFO] Scanned {format_time(stats['video_seconds'])} of video in {stats['elapsed']:.1f}s "
+          f"({speed:.1f}x real time): {stats['sampled']} frames sampled, {stats['repeats']} repeats skipped, "
+          f"{stats['tracks']} tracks, {stats['matches']} matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# ============================================================================
+# Video Scan Dialog - Stream Matches from video_scan.py
+# ============================================================================
+#
+# The scan runs as a child process (video_scan.py --jsonl) so decoding and
+# detection never block the GUI; each JSON line it prints is a match, a
+# progress update or the final summary.
+
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QListWidgetItem, QPushButton
+)
+from PyQt5.QtCore import Qt, QProcess, QSize
+from PyQt5.QtGui import QIcon, QPixmap
+
+SCRIPT = Path(__file__).resolve().parent / "video_scan.py"
+THUMB_SIZE = 64
+
+
+class VideoScanDialog(QDialog):
+    def __init__(self, video_path, view_post_callback, parent=None):
+        super().__init__(parent)
+        self.view_post_callback = view_post_callback
+        self.snapshot_dir = tempfile.mkdtemp(prefix="findme_scan_")
+        self.buffer = b""
+
+        self.setWindowTitle(f"Video scan - {Path(video_path).name}")
+        self.setStyleSheet("background-color: #1C1E21; color: white;")
+        self.resize(520, 600)
+
+        layout = QVBoxLayout()
+        self.status_label = QLabel("Starting scan...")
+        self.list_widget = QListWidget()
+        self.list_widget.setIconSize(QSize(THUMB_SIZE, THUMB_SIZE))
+        self.list_widget.setStyleSheet("background-color: #242526; color: white;")
+        self.list_widget.itemDoubleClicked.connect(self.open_match)
+
+        bottom_layout = QHBoxLayout()
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setStyleSheet("background-color: #e74c3c; color: white; font-weight: bold;")
+        self.stop_btn.clicked.connect(self.stop)
+        bottom_layout.addWidget(QLabel("Double-click a match to open the post"))
+        bottom_layout.addStretch()
+        bottom_layout.addWidget(self.stop_btn)
+
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.list_widget)
+        layout.addLayout(bottom_layout)
+        self.setLayout(layout)
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.ForwardedErrorChannel)
+        self.process.readyReadStandardOutput.connect(self._read_output)
+        self.process.finished.connect(self._finished)
+        self.process.start(sys.executable, [
+            str(SCRIPT), str(video_path), "--jsonl", "--snapshots", self.snapshot_dir
+        ])
+
+    def _read_output(self):
+        self.buffer += bytes(self.process.readAllStandardOutput())
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            line = line.decode('utf-8', errors='replace').strip()
+            if not line.startswith("{"):
+                if line:
+                    print(line)
+                continue
+            try:
+                message = json.loads(line)
+            except Exception:
+                continue
+            if 'match' in message:
+                self._add_match(message['match'])
+            elif 'progress' in message:
+                self._show_progress(message['progress'], "Scanning")
+            elif 'done' in message:
+                self._show_progress(message['done'], "Finished")
+
+    def _add_match(self, match):
+        item = QListWidgetItem(
+            f"{match['time_str']}  track {match['track']}  →  post {match['post_id']}  "
+            f"({match['similarity'] * 100:.1f}%)"
+        )
+        item.setData(Qt.UserRole, match['post_id'])
+        if match.get('snapshot'):
+            item.setIcon(QIcon(QPixmap(match['snapshot'])))
+        self.list_widget.addItem(item)
+
+    def _show_progress(self, stats, state):
+        position = f"{stats['video_seconds']:.0f}s"
+        if stats.get('duration'):
+            position += f" / {stats['duration']:.0f}s"
+        speed = stats['video_seconds'] / stats['elapsed'] if stats.get('elapsed') else 0.0
+        self.status_label.setText(
+            f"{state}: {position} ({speed:.1f}x real time), {stats['tracks']} faces tracked, "
+            f"{stats['matches']} matches"
+        )
+
+    def _finished(self, exit_code, _status):
+        self.stop_btn.setEnabled(False)
+        if exit_code != 0:
+            self.status_label.setText(f"Scan stopped (exit code {exit_code}) - {self.list_widget.count()} matches")
+
+    def open_match(self, item):
+        self.view_post_callback(item.data(Qt.UserRole))
+
+    def stop(self):
+        if self.process.state() != QProcess.NotRunning:
+            self.process.kill()
+            self.process.waitForFinished(3000)
+
+    def closeEvent(self, event):
+        self.stop()
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        super().closeEvent(event)